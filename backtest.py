@@ -0,0 +1,213 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import snapshot_store
+
+TRADING_DAYS = 252  # 年化时每年的交易日数
+HOLD_DAYS = 20      # 默认持有期（交易日），每隔该天数按筛选结果重新等权调仓
+PANEL_COLUMNS = ('price', 'pb_ratio', 'pe_ratio', 'market_cap')
+
+
+class MarketPanel:
+    """按 日期 × 股票 排列的行情面板，每个字段一个二维数组，缺失为 NaN"""
+
+    def __init__(self, dates, codes, names, price, pb_ratio, pe_ratio, market_cap):
+        self.dates = pd.DatetimeIndex(dates)
+        self.codes = np.asarray(codes)
+        self.names = np.asarray(names)
+        self.price = price
+        self.pb_ratio = pb_ratio
+        self.pe_ratio = pe_ratio
+        self.market_cap = market_cap
+
+    @property
+    def shape(self):
+        return self.price.shape
+
+    def rows(self, index):
+        """取部分日期的各字段，返回 {列名: 二维数组}，可直接交给 Criteria.mask 求值"""
+        return {column: getattr(self, column)[index] for column in PANEL_COLUMNS}
+
+    def restrict(self, codes):
+        """只保留 codes 中的股票"""
+        keep = np.isin(self.codes, list(codes))
+        return MarketPanel(self.dates, self.codes[keep], self.names[keep],
+                           *(getattr(self, column)[:, keep] for column in PANEL_COLUMNS))
+
+
+def load_panel(keys=None, root=snapshot_store.SNAPSHOT_DIR, start=None, end=None, include_partial=False, log=print):
+    """把已保存的行情快照按日组装为面板，同一天有多份快照时取当天最后一份全市场快照
+
+    按 PB 快速抓取的快照（meta 中 pb_limit 不为空）缺少高 PB 股票，持仓股 PB 升出范围后没有价格，
+    只能沿用旧价格，收益会失真，因此默认跳过；只有这类快照的日期不参与回测。
+    include_partial 为 True 时，当天没有全市场快照才退而使用当天最后一份快速抓取的快照。
+    start / end 为 'YYYYMMDD' 形式的日期（含端点）。
+    """
+    keys = keys if keys is not None else snapshot_store.list_snapshots(root)
+    full, partial = {}, {}
+    for key in keys:
+        day = key[:8]
+        if (start is None or day >= start) and (end is None or day <= end):
+            truncated = snapshot_store.load_snapshot_meta(key, root).get('pb_limit') is not None
+            (partial if truncated else full)[day] = key  # 快照键按时间排序，后者覆盖前者
+    daily = dict(full)
+    skipped = [day for day in partial if day not in full]
+    if include_partial:
+        daily.update((day, partial[day]) for day in skipped)
+        if skipped:
+            log(f"⚠️ {len(skipped)} 天只有按PB快速抓取的快照，高PB股票缺少价格，持仓收益可能失真")
+    elif skipped:
+        log(f"⚠️ 跳过 {len(skipped)} 天只有按PB快速抓取的快照（高PB股票缺少价格，收益会失真）")
+    if not daily:
+        raise FileNotFoundError(f"{root} 下没有可用于回测的全市场行情快照")
+
+    frames = [snapshot_store.load_snapshot(key, root)[0] for day, key in sorted(daily.items())]
+    dates = [datetime.strptime(day, '%Y%m%d') for day in sorted(daily)]
+    panel = panel_from_frames(dates, frames)
+    log(f"📂 已加载 {len(dates)} 个交易日、{len(panel.codes)} 只股票的行情快照")
+    return panel
+
+
+def panel_from_frames(dates, frames):
+    """把逐日行情表（列与行情快照一致）组装为面板
+
+    先把所有行拼接起来，一次性把代码映射为列号，再按 (日, 列) 整体写入各字段矩阵。
+    """
+    lengths = [len(df) for df in frames]
+    code_column, columns = pd.factorize(np.concatenate([df['code'].to_numpy(dtype=object) for df in frames]),
+                                        sort=True)
+    row_index = np.repeat(np.arange(len(frames)), lengths)
+
+    # 名称取该股票最后一次出现时的名称：从最后一天往前补齐，通常一两天即可补全
+    names = np.empty(len(columns), dtype=object)
+    named = np.zeros(len(columns), dtype=bool)
+    ends = np.cumsum(lengths)
+    for row in range(len(frames) - 1, -1, -1):
+        position = code_column[ends[row] - lengths[row]:ends[row]]
+        missing = ~named[position]
+        names[position[missing]] = frames[row]['name'].to_numpy(dtype=object)[missing]
+        named[position] = True
+        if named.all():
+            break
+
+    shape = (len(frames), len(columns))
+    panel = {}
+    for column in PANEL_COLUMNS:
+        panel[column] = np.full(shape, np.nan)
+        values = np.concatenate([df[column].to_numpy(dtype=float) for df in frames])
+        panel[column][row_index, code_column] = values
+    return MarketPanel(dates, np.asarray(columns, dtype=str), names, **panel)
+
+
+def forward_fill(values):
+    """沿日期方向用最近一次有效值填充 NaN（停牌、缺页时沿用上一价格）"""
+    valid = ~np.isnan(values)
+    index = np.where(valid, np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(index, axis=0, out=index)
+    return values[index, np.arange(values.shape[1])]
+
+
+def run_backtest(panel, criteria, hold=HOLD_DAYS, cost=0.0):
+    """等权持有筛选结果的历史回测，返回 (每日净值表, 调仓表, 汇总指标)
+
+    每隔 hold 个交易日用 criteria 在当日行情上筛选一次，按当日价格等权买入并持有到下次调仓，
+    期间不再平衡（权重随价格漂移）；没有候选股时持有现金。cost 为单边交易费率，
+    按调仓时的换手扣减净值。全部计算按 日期 × 股票 矩阵整体完成，不逐日逐股循环。
+    """
+    days, _ = panel.shape
+    if days < 2:
+        raise ValueError("回测至少需要两个交易日的行情快照")
+    price = forward_fill(panel.price)
+
+    # 调仓日及其筛选结果：调仓日价格有效的候选股
+    rebalance = np.arange(0, days - 1, hold)
+    selected = criteria.mask(panel.rows(rebalance)) & ~np.isnan(panel.price[rebalance])
+    holdings = selected.sum(axis=1)
+
+    # 第 t 日（t ≥ 1）属于第 period[t] 个持有期，相对该期买入价的涨跌
+    period = np.minimum((np.arange(1, days) - 1) // hold, len(rebalance) - 1)
+    entry = price[rebalance][period]
+    held = selected[period]
+    relative = np.where(held, price[1:] / entry, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        growth = np.where(holdings[period] > 0, relative.sum(axis=1) / holdings[period], 1.0)
+
+    # 每期期末（下一调仓日或最后一日）的持仓漂移权重，用于计算换手
+    period_end = np.append(rebalance[1:], days - 1)
+    end_relative = np.where(selected, price[period_end] / price[rebalance], 0.0)
+    end_value = end_relative.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drifted = np.where(end_value > 0, end_relative / end_value, 0.0)
+        target = np.where(holdings[:, None] > 0, selected / holdings[:, None], 0.0)
+    # 把现金视为一项资产：调仓前为上一期漂移后的权重，第一期从全现金开始
+    before = np.vstack([np.zeros((1, target.shape[1])), drifted[:-1]])
+    before_cash = np.append(1.0, (holdings[:-1] == 0).astype(float))
+    target_cash = (holdings == 0).astype(float)
+    traded = np.abs(target - before).sum(axis=1)  # 股票的买入与卖出金额之和，现金的增减不收费
+    turnover = (traded + np.abs(target_cash - before_cash)) / 2
+
+    # 各期期初净值 = 之前各期期末涨幅与交易成本的连乘
+    period_growth = growth[period_end - 1]
+    cost_factor = 1 - cost * traded
+    start_value = np.cumprod(np.append(1.0, period_growth[:-1] * cost_factor[1:])) * cost_factor[0]
+    value = np.append(1.0, start_value[period] * growth)
+
+    drawdown = value / np.maximum.accumulate(value) - 1
+    daily = pd.DataFrame({
+        'date': panel.dates,
+        'value': value,
+        'return': np.append(0.0, value[1:] / value[:-1] - 1),
+        'drawdown': drawdown,
+        'holdings': np.append(0, holdings[period]),
+    })
+    periods = pd.DataFrame({
+        'date': panel.dates[rebalance],
+        'holdings': holdings,
+        'turnover': turnover,
+        'return': period_growth * cost_factor - 1,
+    })
+    return daily, periods, summarize(daily, periods)
+
+
+def summarize(daily, periods):
+    """汇总收益、波动、回撤和换手指标"""
+    value = daily['value'].to_numpy()
+    years = max((len(value) - 1) / TRADING_DAYS, 1 / TRADING_DAYS)
+    returns = daily['return'].to_numpy()[1:]
+    volatility = returns.std() * np.sqrt(TRADING_DAYS) if len(returns) > 1 else 0.0
+    annual = value[-1] ** (1 / years) - 1
+    return {
+        'start': daily['date'].iloc[0].strftime('%Y-%m-%d'),
+        'end': daily['date'].iloc[-1].strftime('%Y-%m-%d'),
+        'total_return': value[-1] - 1,
+        'annual_return': annual,
+        'annual_volatility': volatility,
+        'sharpe': annual / volatility if volatility > 0 else float('nan'),
+        'max_drawdown': daily['drawdown'].min(),
+        'rebalances': len(periods),
+        'avg_holdings': periods['holdings'].mean(),
+        'avg_turnover': periods['turnover'].mean(),
+    }
+
+
+def format_summary(summary):
+    """把汇总指标整理为便于打印的中文文本"""
+    return "\n".join([
+        f"回测区间: {summary['start']} ~ {summary['end']}（调仓 {summary['rebalances']} 次）",
+        f"累计收益: {summary['total_return']:.2%}    年化收益: {summary['annual_return']:.2%}",
+        f"年化波动: {summary['annual_volatility']:.2%}    夏普比率: {summary['sharpe']:.2f}",
+        f"最大回撤: {summary['max_drawdown']:.2%}",
+        f"平均持股: {summary['avg_holdings']:.1f} 只    平均换手: {summary['avg_turnover']:.2%}",
+    ])
+
+
+def timed_backtest(panel, criteria, hold=HOLD_DAYS, cost=0.0, log=print):
+    """运行回测并打印耗时"""
+    start = time.perf_counter()
+    result = run_backtest(panel, criteria, hold=hold, cost=cost)
+    days, stocks = panel.shape
+    log(f"⚡ 回测 {days} 个交易日 × {stocks} 只股票耗时 {(time.perf_counter() - start) * 1000:.0f} 毫秒")
+    return result
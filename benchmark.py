@@ -0,0 +1,363 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import choose
+import exporters
+import sina_fetch
+from criteria import Criteria
+from sina_emulator import SinaEmulator
+
+BENCHMARK_FILE = 'benchmark.json'  # 默认结果文件
+REPEAT = 3                         # 每项重复次数，取中位数
+REGRESSION_THRESHOLD = 0.10        # 比较时变慢 / 变大超过该比例视为回归
+RESULT_FORMATS = {'股价': '%.2f', 'PB': '%.3f', 'PE': '%.2f', '市值(亿)': '%.2f'}
+# 基准项：全市场抓取、按 PB 快速抓取、多板块节点并发抓取、端到端筛选（行数为候选股数）、解析、
+# 条件筛选、结果表渲染、全部行情导出（CSV + XLSX）、各入口脚本的冷启动导入耗时
+STAGES = ('fetch', 'fetch_screen_aware', 'fetch_boards', 'screen_e2e', 'parse', 'screen', 'render', 'export',
+          'startup')
+BOARD_NODES = ('sh_a', 'sz_a', 'kcb', 'cyb', 'hs_b', 'hs_bjs')  # fetch_boards 并发抓取的板块节点
+STARTUP_SCRIPTS = {'choose': 'choose.py', 'gui': 'choose-gui.py', 'gui_exe': 'choose-gui-exe.py'}
+STARTUP_BUDGET = 1.5                     # 冷启动预算（秒）：解释器启动并导入入口脚本的全部模块
+LAZY_MODULES = ('akshare', 'matplotlib')  # 只应在首次使用时导入的重量级可选依赖
+# 比较时检查的指标：(指标路径, 显示名)，数值越大越差
+COMPARED_METRICS = ((('seconds', 'median'), '耗时中位数(秒)'), (('peak_mb',), '峰值内存(MB)'),
+                    (('latency_ms', 'p99'), '请求延迟p99(毫秒)'))
+STARTUP_METRICS = ((('seconds', 'median'), '冷启动中位数(秒)'), (('import_seconds',), '导入耗时(秒)'))
+
+
+def percentiles(values):
+    """毫秒为单位的 p50 / p90 / p99"""
+    if not values:
+        return None
+    p50, p90, p99 = np.percentile(np.asarray(values) * 1000, [50, 90, 99])
+    return {'p50': round(p50, 2), 'p90': round(p90, 2), 'p99': round(p99, 2)}
+
+
+def measure(run, repeat=REPEAT, network=False):
+    """重复运行 run()（返回处理的行数），统计耗时、吞吐、请求延迟，并单独运行一次测量峰值内存
+
+    network 为 True 时每次运行前重置共享会话，使每次都从初始限速开始，并汇总其请求统计。
+    """
+    seconds, latencies = [], []
+    rows = requests = errors = 0
+    for _ in range(repeat + 1):
+        if network:
+            sina_fetch.reset_session()
+        profile = len(seconds) == repeat  # 最后一次只用于测量内存，tracemalloc 会拖慢计时
+        if profile:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = run()
+        elapsed = time.perf_counter() - start
+        if profile:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            break
+        seconds.append(elapsed)
+        stats = sina_fetch.get_session().last_stats if network else None
+        if stats is not None:
+            latencies.extend(stats.latencies)
+            requests += stats.requests
+            errors += stats.errors
+
+    median = statistics.median(seconds)
+    result = {
+        'runs': repeat,
+        'rows': rows,
+        'seconds': {'min': round(min(seconds), 4), 'median': round(median, 4), 'max': round(max(seconds), 4)},
+        'rows_per_sec': round(rows / median, 1) if median > 0 else None,
+        'peak_mb': round(peak / 2**20, 2),
+    }
+    if network:
+        result.update(requests=requests // repeat, errors=errors, latency_ms=percentiles(latencies))
+    return result
+
+
+def import_profile(script, repeat=REPEAT, budget=STARTUP_BUDGET):
+    """在新进程中以 -X importtime 导入入口脚本（不执行 main），统计冷启动耗时和最重的顶层导入"""
+    code = f"import runpy; runpy.run_path({script!r}, run_name='startup_probe')"
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True,
+                                 text=True, encoding='utf-8', cwd=os.path.dirname(os.path.abspath(__file__)))
+        seconds.append(time.perf_counter() - start)
+        if process.returncode:
+            raise RuntimeError(f"导入 {script} 失败: {process.stderr.strip().splitlines()[-1]}")
+
+    # 每行形如 "import time: 自身微秒 | 累计微秒 | 模块名"，模块名前的缩进表示嵌套层级
+    top, loaded = [], set()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        loaded.add(name.strip().split('.')[0])
+        if len(name) - len(name.lstrip()) == 1:
+            top.append((name.strip(), int(cumulative)))
+    top.sort(key=lambda item: -item[1])
+
+    median = statistics.median(seconds)
+    return {
+        'runs': repeat,
+        'seconds': {'min': round(min(seconds), 4), 'median': round(median, 4), 'max': round(max(seconds), 4)},
+        'import_seconds': round(sum(us for _, us in top) / 1e6, 4),
+        'budget': budget,
+        'over_budget': median > budget,
+        'heaviest': [{'module': name, 'ms': round(us / 1000, 1)} for name, us in top[:8]],
+        'lazy_loaded': sorted(loaded.intersection(LAZY_MODULES)),
+    }
+
+
+def format_startup(name, profile):
+    """冷启动结果的单行摘要"""
+    heaviest = '，'.join(f"{item['module']} {item['ms']:.0f}ms" for item in profile['heaviest'][:3])
+    text = (f"{name} 冷启动中位数 {profile['seconds']['median']:.2f} 秒（导入 {profile['import_seconds']:.2f} 秒，"
+            f"最重: {heaviest}）")
+    if profile['over_budget']:
+        text += f"  ⚠️ 超出 {profile['budget']} 秒预算"
+    if profile['lazy_loaded']:
+        text += f"  ⚠️ 启动时导入了 {', '.join(profile['lazy_loaded'])}"
+    return text
+
+
+def write_stock_list(records, path='a_stock_list.csv'):
+    """按模拟行情写出股票列表缓存，使 get_market_data 不访问 akshare"""
+    pd.DataFrame({'code': [record['code'] for record in records],
+                  'name': [record['name'] for record in records]}).to_csv(path, index=False, encoding='utf-8')
+
+
+def render_rows(frame):
+    """把结果表载入虚拟表格并依次按每列排序，返回行数；没有图形界面时返回 None"""
+    import tkinter as tk
+    from virtual_table import VirtualTable
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    try:
+        root.withdraw()
+        table = VirtualTable(root, frame.columns, formats=RESULT_FORMATS)
+        table.load(frame)
+        for col in frame.columns:
+            table.sort_by(col)
+        root.update_idletasks()
+        return len(frame)
+    finally:
+        root.destroy()
+
+
+def run_benchmarks(stages=STAGES, stocks=5300, latency=0.05, jitter=0.01, error_rate=0.0,
+                   throttle_rate=0.0, repeat=REPEAT, seed=0, log=print):
+    """启动本地模拟接口，把抓取地址指向它，依次运行各项基准，返回结果字典"""
+    emulator = SinaEmulator(stocks, latency, jitter, error_rate, throttle_rate, seed=seed)
+    results, startup = {}, {}
+    base, save, sources, nodes = sina_fetch.SINA_API_BASE, choose.SAVE_SNAPSHOTS, choose.QUOTE_SOURCES, choose.MARKET_NODES
+    boards = choose.BOARDS
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, emulator:
+        os.chdir(workdir)  # 股票列表缓存等文件只写入临时目录
+        sina_fetch.SINA_API_BASE = emulator.base_url
+        choose.SAVE_SNAPSHOTS = False
+        choose.QUOTE_SOURCES = ('sina',)  # 只测模拟接口，不向其他行情源发送对冲请求
+        choose.BOARDS = None              # 模拟代码分布在各板块，全部参与筛选
+        try:
+            write_stock_list(emulator.records)
+            criteria = Criteria(choose.DEFAULT_CRITERIA)
+            market = None
+            for stage in stages:
+                log(f"⏱️ {stage} ...")
+                if stage == 'startup':
+                    for name, script in STARTUP_SCRIPTS.items():
+                        startup[name] = import_profile(script, repeat)
+                        log(f"   {format_startup(name, startup[name])}")
+                    continue
+                if stage == 'fetch':
+                    result = measure(lambda: len(choose.get_realtime_quotes_sina_fixed()), repeat, network=True)
+                elif stage == 'fetch_screen_aware':
+                    result = measure(lambda: len(choose.get_realtime_quotes_sina_fixed(
+                        pb_limit=criteria.pb_upper_bound())), repeat, network=True)
+                elif stage == 'fetch_boards':
+                    choose.MARKET_NODES = BOARD_NODES
+                    result = measure(lambda: len(choose.get_realtime_quotes_sina_fixed()), repeat, network=True)
+                    choose.MARKET_NODES = nodes
+                elif stage == 'screen_e2e':
+                    result = measure(lambda: len(choose.get_cigar_butt_realtime_final(criteria=criteria, show=False)),
+                                     repeat, network=True)
+                elif stage == 'parse':
+                    pages = [emulator.records[i:i + sina_fetch.PAGE_SIZE]
+                             for i in range(0, len(emulator.records), sina_fetch.PAGE_SIZE)]
+
+                    def parse():
+                        columns = sina_fetch.QuoteColumns(len(emulator.records))
+                        for number, page in enumerate(pages):
+                            columns.add(number * sina_fetch.PAGE_SIZE, page)
+                        return len(columns.to_frame(len(emulator.records)))
+                    result = measure(parse, repeat)
+                elif stage in ('screen', 'render', 'export'):
+                    if market is None:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            sina_fetch.reset_session()
+                            market = choose.get_market_data()
+                    if stage == 'screen':
+                        def screen():
+                            market[criteria.mask(market)]
+                            return len(market)
+                        result = measure(screen, repeat)
+                    elif stage == 'export':
+                        def export():
+                            exporters.export(market, 'universe.csv')
+                            return exporters.export(market, 'universe.xlsx')
+                        result = measure(export, repeat)
+                    else:
+                        table = choose.format_candidates(market)
+                        if render_rows(table) is None:
+                            log("⚠️ 没有可用的图形界面，跳过 render")
+                            continue
+                        result = measure(lambda: render_rows(table), repeat)
+                else:
+                    raise ValueError(f"未知的基准项: {stage}")
+                results[stage] = result
+                log(f"   {format_result(result)}")
+        finally:
+            sina_fetch.SINA_API_BASE, choose.SAVE_SNAPSHOTS, choose.QUOTE_SOURCES = base, save, sources
+            choose.MARKET_NODES, choose.BOARDS = nodes, boards
+            sina_fetch.reset_session()
+            os.chdir(cwd)
+
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'emulator': {'stocks': stocks, 'latency': latency, 'jitter': jitter,
+                         'error_rate': error_rate, 'throttle_rate': throttle_rate, 'seed': seed},
+        },
+        'results': results,
+        'startup': startup,
+    }
+
+
+def format_result(result):
+    """一项基准结果的单行摘要"""
+    text = (f"{result['rows']} 行，中位数 {result['seconds']['median'] * 1000:.1f} 毫秒，"
+            f"{result['rows_per_sec']} 行/秒，峰值内存 {result['peak_mb']} MB")
+    if result.get('latency_ms'):
+        latency = result['latency_ms']
+        text += (f"，{result['requests']} 次请求（失败 {result['errors']}），"
+                 f"延迟 p50/p90/p99 {latency['p50']}/{latency['p90']}/{latency['p99']} 毫秒")
+    return text
+
+
+def _metric(result, path):
+    for key in path:
+        if not isinstance(result, dict) or result.get(key) is None:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """比较两次基准结果，返回 (比较明细, 回归项列表)；指标增大超过 threshold 比例即为回归"""
+    rows, regressions = [], []
+    pairs = [(stage, baseline['results'].get(stage), result, COMPARED_METRICS)
+             for stage, result in current['results'].items()]
+    pairs += [(f"startup:{name}", baseline.get('startup', {}).get(name), profile, STARTUP_METRICS)
+              for name, profile in current.get('startup', {}).items()]
+    for stage, before, result, checked in pairs:
+        if before is None:
+            continue
+        for path, label in checked:
+            old, new = _metric(before, path), _metric(result, path)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            regressed = change > threshold
+            rows.append({'stage': stage, 'metric': label, 'baseline': old, 'current': new,
+                         'change': round(change, 4), 'regression': regressed})
+            if regressed:
+                regressions.append(f"{stage} {label}: {old} → {new}（+{change:.1%}）")
+    return rows, regressions
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="抓取、解析、筛选、渲染的离线性能基准（使用本地模拟行情接口）")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"逗号分隔的基准项，默认全部: {','.join(STAGES)}")
+    parser.add_argument('--stocks', type=int, default=5300, help="模拟股票数，默认 5300")
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟接口平均延迟（秒），默认 0.05")
+    parser.add_argument('--jitter', type=float, default=0.01, help="模拟接口延迟标准差（秒），默认 0.01")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟接口返回 500 的比例")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="模拟接口返回 456（限流）的比例")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help=f"每项重复次数，默认 {REPEAT}")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--out', default=BENCHMARK_FILE, help=f"结果 JSON 文件，默认 {BENCHMARK_FILE}")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="比较两个结果文件并标出回归，不运行基准")
+    parser.add_argument('--baseline', metavar='JSON', help="运行完成后与该结果文件比较")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f"判定回归的变化比例，默认 {REGRESSION_THRESHOLD}")
+    return parser.parse_args()
+
+
+def report(baseline, current, threshold):
+    """打印比较结果，有回归时返回 False"""
+    rows, regressions = compare(baseline, current, threshold)
+    if not rows:
+        print("⚠️ 两次结果没有可比较的基准项")
+        return True
+    table = pd.DataFrame(rows)
+    table['change'] = table['change'].map(lambda change: f"{change:+.1%}")
+    table['regression'] = table['regression'].map({True: '❌', False: ''})
+    table.columns = ['基准项', '指标', '基线', '本次', '变化', '回归']
+    print(table.to_string(index=False))
+    if baseline['meta'].get('emulator') != current['meta'].get('emulator'):
+        print("⚠️ 两次运行的模拟接口参数不同，结果不完全可比")
+    for stage, result in current['results'].items():
+        before = baseline['results'].get(stage)
+        if before is not None and before['rows'] != result['rows']:
+            print(f"⚠️ {stage} 的行数不同: {before['rows']} → {result['rows']}")
+    if regressions:
+        print(f"\n❌ 发现 {len(regressions)} 项回归（阈值 {threshold:.0%}）:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return False
+    print(f"\n✅ 没有超过 {threshold:.0%} 的回归")
+    return True
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare:
+        ok = report(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold)
+        sys.exit(0 if ok else 1)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    current = run_benchmarks(stages, args.stocks, args.latency, args.jitter, args.error_rate,
+                             args.throttle_rate, args.repeat, args.seed)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"💾 基准结果已保存到 {args.out}")
+    if args.baseline:
+        sys.exit(0 if report(load_results(args.baseline), current, args.threshold) else 1)
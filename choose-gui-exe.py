@@ -1,20 +1,50 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import pandas as pd
-import requests
 import time
 import warnings
 import threading
+import queue
+import argparse
 from datetime import datetime
 
+import compact_snapshot
+import exporters
+import metrics
+import quote_sources
+import screen_index
+import sina_fetch
+import snapshot_store
+import virtual_table
+
 warnings.filterwarnings('ignore')
 
+FETCH_WORKERS = 8      # 并发抓取页数上限
+QUOTE_SOURCES = quote_sources.DEFAULT_SOURCES  # 行情源优先顺序，首选源慢或失败时对冲 / 切换到后面的源
+MARKET_NODES = ('hs_a',)  # 抓取的新浪板块节点，多个节点并发抓取后合并去重（如 'hs_a', 'hs_b', 'hs_bjs'）
+BOARDS = None             # 参与筛选的板块（如 ('沪主板', '深主板')），None 为抓到的全部板块
+SAVE_SNAPSHOTS = True  # 每次抓取的行情保存到 snapshots/ 目录
+RESULT_LOG = True      # 每次分析的候选股追加到 results/ 下按日期分区的结果日志
+EXPORT_FILETYPES = [("CSV files", "*.csv"), ("Excel files", "*.xlsx"), ("Parquet files", "*.parquet"),
+                    ("Feather files", "*.feather"), ("All files", "*.*")]
+SNAPSHOT_TTL = 300     # 行情缓存默认有效期（秒），过期后重新联网获取
+LIVE_SCREEN_DELAY = 150  # 参数输入停止多久（毫秒）后实时重新筛选
+UI_PUMP_INTERVAL = 50    # 主线程处理工作线程界面更新的间隔（毫秒）
+
 class StockAnalysisApp:
-    def __init__(self, root):
+    def __init__(self, root, snapshot=None, server=None):
         self.root = root
+        # 离线快照键，不为 None 时不联网，直接筛选该快照
+        self.snapshot = snapshot
+        # 筛选服务地址（screen_server.py），不为 None 时从服务获取共享的行情快照，不直接访问新浪
+        self.server = server
         self.root.title("股票捡烟蒂策略分析工具 v1.1")
         self.root.geometry("1200x800")
         
+        # 工作线程不直接操作控件，只向队列投递界面更新，由主线程定时批量处理
+        self.ui_queue = queue.Queue()
+        self.root.after(UI_PUMP_INTERVAL, self.pump_ui)
+        
         # 设置样式
         self.setup_styles()
         
@@ -24,6 +54,26 @@ class StockAnalysisApp:
         # 初始化数据
         self.analysis_result = None
         self.all_data = None
+        self.fetched_pb_limit = None
+        
+        # 行情缓存：过滤后的行情（紧凑快照）、获取时间；参数变化时直接在缓存上重新筛选
+        # 当天获取的各份行情都以紧凑形式保留在 history 中
+        self.history = compact_snapshot.SnapshotHistory()
+        self.market_cache = None
+        self.market_cache_time = 0
+        self.screen_index = None
+        
+        # 参数变化时在缓存行情上实时重新筛选（防抖）
+        self.live_screen_job = None
+        # 取消当前分析的行情抓取（每次开始分析时新建）
+        self.cancel_event = threading.Event()
+        # 边下载边筛选：已找到的候选股，以及是否已有待处理的界面刷新
+        # （抓取线程写入、主线程读取，都在 stream_lock 内进行）
+        self.stream_candidates = None
+        self.stream_pending = False
+        self.stream_lock = threading.Lock()
+        for var in (self.pb_max_var, self.pe_max_var, self.mcap_min_var):
+            var.trace_add('write', lambda *args: self.schedule_live_screen())
         
     def setup_styles(self):
         """设置界面样式"""
@@ -59,6 +109,14 @@ class StockAnalysisApp:
         self.mcap_min_var = tk.StringVar(value="100")
         ttk.Entry(param_frame, textvariable=self.mcap_min_var, width=10).grid(row=0, column=5, padx=5, pady=5)
         
+        # 按 PB 升序抓取，超过 PB 上限后提前停止（统计信息只覆盖已抓取部分）
+        self.quick_fetch_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(param_frame, text="按PB快速抓取", variable=self.quick_fetch_var).grid(row=0, column=6, padx=5, pady=5)
+        
+        ttk.Label(param_frame, text="缓存有效期(秒):").grid(row=0, column=7, padx=5, pady=5, sticky='w')
+        self.cache_ttl_var = tk.StringVar(value=str(SNAPSHOT_TTL))
+        ttk.Entry(param_frame, textvariable=self.cache_ttl_var, width=6).grid(row=0, column=8, padx=5, pady=5)
+        
         # 按钮区域
         button_frame = ttk.Frame(control_frame)
         button_frame.pack(fill='x', pady=(10, 0))
@@ -66,12 +124,22 @@ class StockAnalysisApp:
         self.analyze_btn = ttk.Button(button_frame, text="🔍 开始分析", command=self.start_analysis)
         self.analyze_btn.pack(side='left', padx=5)
         
+        self.refresh_btn = ttk.Button(button_frame, text="🔄 刷新数据", command=lambda: self.start_analysis(force_refresh=True))
+        self.refresh_btn.pack(side='left', padx=5)
+        
         self.export_btn = ttk.Button(button_frame, text="💾 导出结果", command=self.export_results, state='disabled')
         self.export_btn.pack(side='left', padx=5)
         
+        self.export_all_btn = ttk.Button(button_frame, text="📤 导出全部行情", command=lambda: self.export_results(universe=True),
+                                         state='disabled')
+        self.export_all_btn.pack(side='left', padx=5)
+        
         self.clear_btn = ttk.Button(button_frame, text="🗑️ 清空结果", command=self.clear_results)
         self.clear_btn.pack(side='left', padx=5)
         
+        self.cancel_btn = ttk.Button(button_frame, text="⏹️ 取消", command=self.cancel_analysis, state='disabled')
+        self.cancel_btn.pack(side='left', padx=5)
+        
         # 进度和状态
         status_frame = ttk.Frame(control_frame)
         status_frame.pack(fill='x', pady=(10, 0))
@@ -80,7 +148,7 @@ class StockAnalysisApp:
         self.status_label = ttk.Label(status_frame, textvariable=self.status_var)
         self.status_label.pack(side='left')
         
-        self.progress = ttk.Progressbar(status_frame, mode='indeterminate')
+        self.progress = ttk.Progressbar(status_frame, mode='determinate')
         self.progress.pack(side='right', fill='x', expand=True, padx=(10, 0))
         
         # 主内容区域
@@ -107,19 +175,8 @@ class StockAnalysisApp:
         table_frame.pack(fill='both', expand=True, pady=(0, 5))
         
         columns = ('股票名', '代码', '股价', 'PB', 'PE', '市值(亿)')
-        self.result_tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=10)
-        
-        for col in columns:
-            self.result_tree.heading(col, text=col)
-            self.result_tree.column(col, width=100)
-        
-        v_scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.result_tree.yview)
-        h_scrollbar = ttk.Scrollbar(table_frame, orient='horizontal', command=self.result_tree.xview)
-        self.result_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
-        
-        self.result_tree.grid(row=0, column=0, sticky='nsew')
-        v_scrollbar.grid(row=0, column=1, sticky='ns')
-        h_scrollbar.grid(row=1, column=0, sticky='ew')
+        formats = {'股价': '%.2f', 'PB': '%.3f', 'PE': '%.2f', '市值(亿)': '%.2f'}
+        self.result_table = virtual_table.VirtualTable(table_frame, columns, formats)
         
         table_frame.grid_rowconfigure(0, weight=1)
         table_frame.grid_columnconfigure(0, weight=1)
@@ -133,93 +190,166 @@ class StockAnalysisApp:
         self.log_message("应用启动成功，等待开始分析...")
         
     def log_message(self, message):
-        """记录日志"""
+        """记录日志（任意线程均可调用）"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
-        
-    def get_realtime_quotes_sina_fixed(self):
-        """从新浪财经获取实时A股行情（最终修复版）"""
-        self.log_message("正在获取实时行情数据...")
-        self.status_var.set("正在获取实时行情数据...")
-        
-        all_data = []
-        for page in range(1, 100):
-            try:
-                url = f"http://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData?page={page}&num=80&sort=code&asc=1&node=hs_a"
-                response = requests.get(url, timeout=10)
-                data = response.json()
-                
-                if not data:
-                    break
-                    
-                all_data.extend(data)
-                self.log_message(f"已获取第 {page} 页数据，累计 {len(all_data)} 只股票")
-                time.sleep(0.5)
-            except Exception as e:
-                self.log_message(f"获取第 {page} 页失败: {e}")
-                break
-        
-        if not all_data:
-            self.log_message("❌ 无法获取实时行情数据")
-            return pd.DataFrame()
+        self.ui_queue.put(('log', f"[{timestamp}] {message}\n"))
+    
+    def set_status(self, text):
+        """更新状态栏（任意线程均可调用）"""
+        self.ui_queue.put(('call', self.status_var.set, (text,), {}))
+    
+    def set_progress(self, done, total):
+        """更新分页进度（任意线程均可调用）"""
+        self.ui_queue.put(('progress', done, total))
+    
+    def post_ui(self, func, *args, **kwargs):
+        """把需要操作控件的调用交给主线程执行"""
+        self.ui_queue.put(('call', func, args, kwargs))
+    
+    def pump_ui(self):
+        """主线程定时取出队列中的全部界面更新，日志合并为一次插入，进度只取最新值"""
+        lines = []
+        progress = None
+        try:
+            while True:
+                item = self.ui_queue.get_nowait()
+                if item[0] == 'log':
+                    lines.append(item[1])
+                elif item[0] == 'progress':
+                    progress = item[1:]
+                else:
+                    # 先应用之前的进度，保证与后续调用的先后顺序
+                    if progress is not None:
+                        self.show_progress(*progress)
+                        progress = None
+                    _, func, args, kwargs = item
+                    try:
+                        func(*args, **kwargs)
+                    except Exception as e:
+                        lines.append(f"❌ 界面更新失败: {e}\n")
+        except queue.Empty:
+            pass
+        
+        if lines:
+            self.log_text.insert(tk.END, ''.join(lines))
+            self.log_text.see(tk.END)
+        if progress is not None:
+            self.show_progress(*progress)
+        self.root.after(UI_PUMP_INTERVAL, self.pump_ui)
+    
+    def show_progress(self, done, total):
+        """显示分页进度（主线程执行）"""
+        self.progress.config(maximum=max(total, 1), value=done)
+        self.status_var.set(f"正在获取实时行情数据... {done}/{total} 页")
         
-        df = pd.DataFrame(all_data)
-        df['code'] = df['symbol'].str[2:]  # 去掉 'sz' 或 'sh' 前缀
-        df['pb'] = pd.to_numeric(df['pb'], errors='coerce')
-        df['per'] = pd.to_numeric(df['per'], errors='coerce')
-        df['trade'] = pd.to_numeric(df['trade'], errors='coerce')
-        df['mktcap'] = pd.to_numeric(df['mktcap'], errors='coerce') * 10000  # 万元转元
-        
-        df = df.rename(columns={
-            'name': 'name',
-            'pb': 'pb_ratio',
-            'per': 'pe_ratio', 
-            'trade': 'price',
-            'mktcap': 'market_cap'
-        })
-        
-        df = df.dropna(subset=['pb_ratio', 'price'])
-        df = df[df['pb_ratio'] > 0]
-        df = df[df['price'] > 0]
-        
-        self.log_message(f"📊 成功获取 {len(df)} 只股票的有效行情数据")
-        return df[['code', 'name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']]
+    def get_realtime_quotes_sina_fixed(self, pb_limit=None, on_page=None):
+        """从新浪财经获取实时A股行情（并发分页版），离线模式下读取快照
 
-    def get_cigar_butt_realtime_final(self):
-        """实时捡烟蒂策略（使用真实股票名称）"""
-        self.log_message("🔍 开始执行捡烟蒂策略...")
-        
-        realtime_data = self.get_realtime_quotes_sina_fixed()
+        on_page(frame) 在每页行情解析后调用（离线快照一次性加载，不逐页回调）。
+        """
+        if self.snapshot is not None:
+            self.set_status("正在加载离线快照...")
+            with metrics.stage('snapshot'):
+                return snapshot_store.load_snapshot_for_screen(self.snapshot, pb_limit=pb_limit,
+                                                               log=self.log_message)
+        
+        self.set_status("正在获取实时行情数据...")
+        if self.server is not None:
+            sources = [quote_sources.ServerSource(self.server)]
+        else:
+            sources = quote_sources.create_sources(QUOTE_SOURCES, max_workers=FETCH_WORKERS, nodes=MARKET_NODES)
+        df = quote_sources.get_quotes(sources, pb_limit=pb_limit, log=self.log_message,
+                                      progress=self.set_progress, on_page=on_page, cancel=self.cancel_event)
+        if SAVE_SNAPSHOTS and self.server is None and not df.empty:
+            with metrics.stage('save'):
+                key = snapshot_store.save_snapshot(df, pb_limit=pb_limit)
+            self.log_message(f"💾 行情快照已保存: {key}")
+        return df
+
+    def is_cache_usable(self, pb_limit, cache_ttl=SNAPSHOT_TTL):
+        """行情缓存未过期（cache_ttl 秒内）且覆盖所需的 PB 范围时可直接复用"""
+        if self.market_cache is None:
+            return False
+        # 离线快照不会变化，无需过期
+        if self.snapshot is None and time.time() - self.market_cache_time > cache_ttl:
+            return False
+        covered = self.fetched_pb_limit
+        return covered is None or (pb_limit is not None and pb_limit <= covered)
+
+    def filter_quotes(self, quotes):
+        """直接使用行情数据中的 name 字段，过滤 ST/退市股和 BOARDS 以外的板块并规范股票代码"""
+        df = quotes[~quotes['name'].str.contains('ST|退|B股|暂停', na=False, regex=True)].copy()
+        df['code'] = df['code'].astype(str).str.zfill(6)
+        if BOARDS is not None:
+            df = df[pd.Series(sina_fetch.board_of(df['code']), index=df.index).isin(BOARDS)]
+        return df
+
+    def get_market_data(self, params, force_refresh=False, on_page=None):
+        """获取过滤 ST/退市股后的行情数据，缓存可用时直接返回缓存
+
+        on_page(filtered_page) 在下载过程中对每页过滤后的行情调用。
+        params 为主线程读取的界面参数（见 read_params），工作线程不访问 Tk 变量。
+        """
+        # 快速抓取时只下载 PB ≤ pb_max 的页，否则全量抓取
+        pb_limit = params['pb_max'] if params['quick_fetch'] else None
+        if not force_refresh and self.is_cache_usable(pb_limit, params['cache_ttl']):
+            age = time.time() - self.market_cache_time
+            self.log_message(f"♻️ 复用 {age:.0f} 秒前获取的行情（{len(self.market_cache)} 条），不重新下载")
+            return self.market_cache.to_frame()
+        
+        page_filtered = None
+        if on_page is not None:
+            page_filtered = lambda page: on_page(self.filter_quotes(page))
+        realtime_data = self.get_realtime_quotes_sina_fixed(pb_limit=pb_limit, on_page=page_filtered)
         if realtime_data.empty:
             self.log_message("❌ 获取实时行情失败")
-            return pd.DataFrame(), pd.DataFrame()
+            return pd.DataFrame()
         
-        self.log_message(f"📊 从新浪财经获取到 {len(realtime_data)} 只股票数据")
+        self.log_message(f"📊 获取到 {len(realtime_data)} 只股票数据")
+        metrics.rows('fetched', len(realtime_data))
 
-        # 直接使用行情数据中的 name 字段，并过滤 ST/退市股
-        df = realtime_data.copy()
-        df = df[~df['name'].str.contains('ST|退|B股|暂停', na=False, regex=True)]
-        df['code'] = df['code'].astype(str).str.zfill(6)
+        with metrics.stage('filter'):
+            df = self.filter_quotes(realtime_data)
+        metrics.rows('filtered', len(df))
+
+        self.market_cache = self.history.append(df, pb_limit=pb_limit, name_column='name')
+        self.market_cache_time = time.time()
+        self.fetched_pb_limit = pb_limit
+        self.screen_index = screen_index.ScreenIndex(self.market_cache)
+        self.log_message(f"🗜️ 今日已缓存 {len(self.history)} 份行情，共 {self.history.nbytes / 1024:.0f} KB")
+        return df
+
+    def format_candidates(self, candidates):
+        """把候选股整理为展示用的中文列（市值转为亿元）"""
+        result = candidates[['name', 'code', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']].copy()
+        result['market_cap'] = (result['market_cap'] / 1e8).round(2)  # 转亿元
+        result.columns = ['股票名', '代码', '股价', 'PB', 'PE', '市值(亿)']
+        return result.reset_index(drop=True)
 
-        # 应用筛选条件
-        pb_max = float(self.pb_max_var.get())
-        pe_max = float(self.pe_max_var.get())
-        mcap_min = float(self.mcap_min_var.get()) * 1e8  # 转为元
+    def get_cigar_butt_realtime_final(self, params, force_refresh=False):
+        """实时捡烟蒂策略（使用真实股票名称），行情缓存可用时只重新筛选"""
+        self.log_message("🔍 开始执行捡烟蒂策略...")
+        
+        pb_max, pe_max, mcap_min = params['pb_max'], params['pe_max'], params['mcap_min']
+        
+        # 下载过程中每到一页就筛选并刷新表格，完整结果在下载结束后给出
+        self.reset_stream()
+        df = self.get_market_data(
+            params, force_refresh=force_refresh,
+            on_page=lambda page: self.screen_page(page, pb_max, pe_max, mcap_min))
+        self.reset_stream()
+        if df.empty:
+            return pd.DataFrame(), pd.DataFrame()
 
-        candidates = df[
-            (df['pb_ratio'] > 0) & (df['pb_ratio'] <= pb_max) &
-            (df['pe_ratio'] > 0) & (df['pe_ratio'] <= pe_max) &
-            (df['market_cap'] > mcap_min) &
-            (df['price'] > 0)
-        ].copy()
+        # 应用筛选条件（索引查询结果已按 PB 升序）
+        screen_start = time.perf_counter()
+        with metrics.stage('screen'):
+            candidates = df.iloc[self.screen_index.query(pb_max, pe_max, mcap_min)]
+        metrics.rows('candidates', len(candidates))
 
         if not candidates.empty:
-            result = candidates[['name', 'code', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']].copy()
-            result['market_cap'] = (result['market_cap'] / 1e8).round(2)  # 转亿元
-            result.columns = ['股票名', '代码', '股价', 'PB', 'PE', '市值(亿)']
-            result = result.sort_values('PB').reset_index(drop=True)
+            result = self.format_candidates(candidates)
+            self.log_message(f"⚡ 筛选耗时 {(time.perf_counter() - screen_start) * 1000:.1f} 毫秒")
 
             self.log_message(f"\n✅ 找到 {len(result)} 只捡烟蒂候选股（PB≤{pb_max}）:")
             for _, row in result.head(10).iterrows():
@@ -239,59 +369,168 @@ class StockAnalysisApp:
             
             return pd.DataFrame(), df
 
-    def start_analysis(self):
-        """开始分析"""
+    def screen_page(self, page, pb_max, pe_max, mcap_min):
+        """边下载边筛选：对刚到达的一页行情筛选，按 PB 顺序并入已找到的候选股（工作线程执行）"""
+        matches = page[screen_index.screen_mask(page, pb_max, pe_max, mcap_min)]
+        if matches.empty:
+            return
+        matches = matches.sort_values('pb_ratio', kind='stable')
+        # 多个分片的抓取线程可能同时到达，合并在锁内进行
+        with self.stream_lock:
+            found = self.stream_candidates
+            if found is None:
+                found = matches
+            elif matches['pb_ratio'].iloc[0] >= found['pb_ratio'].iloc[-1]:
+                found = pd.concat([found, matches])  # 按 PB 升序抓取时新页总排在末尾
+            else:
+                found = pd.concat([found, matches]).sort_values('pb_ratio', kind='stable')
+            self.stream_candidates = found
+            # 上一次刷新尚未被界面处理时只更新数据，不重复投递
+            post = not self.stream_pending
+            self.stream_pending = True
+        if post:
+            self.post_ui(self.show_stream_results)
+
+    def reset_stream(self):
+        """清空边下载边筛选的候选股（任意线程均可调用）"""
+        with self.stream_lock:
+            self.stream_candidates = None
+            self.stream_pending = False
+
+    def show_stream_results(self):
+        """显示下载过程中已找到的候选股（主线程执行）"""
+        with self.stream_lock:
+            self.stream_pending = False
+            found = self.stream_candidates
+        if found is None:
+            return
+        self.result_table.load(self.format_candidates(found))
+        self.stats_text.delete(1.0, tk.END)
+        self.stats_text.insert(tk.END, f"候选股票数（获取中）: {len(found)}")
+
+    def schedule_live_screen(self):
+        """参数输入变化后防抖，停止输入一段时间后再筛选"""
+        if self.live_screen_job is not None:
+            self.root.after_cancel(self.live_screen_job)
+        self.live_screen_job = self.root.after(LIVE_SCREEN_DELAY, self.live_screen)
+
+    def live_screen(self):
+        """在缓存行情上按当前参数即时筛选并刷新表格（主线程执行）"""
+        self.live_screen_job = None
+        # 尚未加载行情或分析进行中时不做实时筛选
+        if self.screen_index is None or str(self.analyze_btn.cget('state')) == 'disabled':
+            return
+        try:
+            params = self.read_params()
+        except ValueError:
+            return  # 输入尚未完成
+        pb_max, pe_max, mcap_min = params['pb_max'], params['pe_max'], params['mcap_min']
+        
+        if self.fetched_pb_limit is not None and pb_max > self.fetched_pb_limit:
+            self.status_var.set(f"PB 上限超出已抓取范围（≤{self.fetched_pb_limit}），请点击开始分析")
+            return
+        
+        start = time.perf_counter()
+        rows = self.screen_index.query(pb_max, pe_max, mcap_min)
+        result = self.format_candidates(self.market_cache.to_frame(rows))
+        self.display_results(result, self.market_cache)
+        self.export_btn.config(state='normal' if not result.empty else 'disabled')
+        self.status_var.set(f"实时筛选: {len(result)} 只候选股（{(time.perf_counter() - start) * 1000:.1f} 毫秒）")
+
+    def read_params(self):
+        """读取并校验界面参数（主线程执行），返回普通值的字典交给工作线程，输入不是数字时抛出 ValueError"""
+        params = {}
+        for key, var, label in (('pb_max', self.pb_max_var, '最大PB值'), ('pe_max', self.pe_max_var, '最大PE值'),
+                                ('mcap_min', self.mcap_min_var, '最小市值(亿)'),
+                                ('cache_ttl', self.cache_ttl_var, '缓存有效期(秒)')):
+            try:
+                params[key] = float(var.get())
+            except ValueError:
+                raise ValueError(f"{label}必须是数字: {var.get()!r}") from None
+        params['mcap_min'] *= 1e8  # 转为元
+        params['quick_fetch'] = bool(self.quick_fetch_var.get())
+        return params
+
+    def start_analysis(self, force_refresh=False):
+        """开始分析，force_refresh 为 True 时忽略行情缓存重新下载"""
+        try:
+            params = self.read_params()
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+
         self.analyze_btn.config(state='disabled')
+        self.refresh_btn.config(state='disabled')
         self.export_btn.config(state='disabled')
-        self.progress.start()
-        thread = threading.Thread(target=self.run_analysis)
+        self.export_all_btn.config(state='disabled')
+        self.progress.config(maximum=1, value=0)
+        self.cancel_event = threading.Event()
+        self.cancel_btn.config(state='normal')
+        thread = threading.Thread(target=self.run_analysis, args=(params, force_refresh))
         thread.daemon = True
         thread.start()
         
-    def run_analysis(self):
-        """运行分析（在新线程中）"""
+    def run_analysis(self, params, force_refresh=False):
+        """运行分析（在新线程中），params 为 read_params 在主线程读取的参数"""
         try:
             start_time = time.time()
-            candidates, all_data = self.get_cigar_butt_realtime_final()
+            metrics.start_run('gui')
+            candidates, all_data = self.get_cigar_butt_realtime_final(params, force_refresh=force_refresh)
             
             if not candidates.empty:
-                self.display_results(candidates, all_data)
-                candidates.to_csv('cigar_butt_realtime.csv', index=False, encoding='utf-8-sig')
+                self.post_ui(self.display_results, candidates, all_data)
+                exporters.export(candidates, 'cigar_butt_realtime.csv', encoding=exporters.EXPORT_ENCODING)
                 self.log_message("✅ 结果已保存到 cigar_butt_realtime.csv")
-                self.export_btn.config(state='normal')
+                if RESULT_LOG:
+                    self.log_message(f"🗂️ 结果已追加到 {exporters.ResultLog().append(candidates)}")
+                self.post_ui(self.export_btn.config, state='normal')
             else:
-                self.clear_results_table()
-                self.stats_text.delete(1.0, tk.END)
-                self.stats_text.insert(tk.END, "未找到符合条件的股票")
+                self.post_ui(self.show_no_results)
                 self.log_message("未找到符合条件的股票")
             
             elapsed_time = time.time() - start_time
             self.log_message(f"⏱️ 总耗时: {elapsed_time:.2f} 秒")
             
+        except sina_fetch.FetchCancelled:
+            self.log_message("⏹️ 分析已取消，已下载的页保存在断点中，下次抓取时只补齐缺失的页")
         except Exception as e:
             self.log_message(f"❌ 分析过程中出现错误: {str(e)}")
         finally:
-            self.progress.stop()
-            self.root.after(0, lambda: self.analyze_btn.config(state='normal'))
-            self.status_var.set("分析完成")
+            self.post_ui(self.finish_analysis)
+    
+    def cancel_analysis(self):
+        """取消正在进行的行情抓取，在途请求在零点几秒内停止等待（主线程执行）"""
+        self.cancel_event.set()
+        self.cancel_btn.config(state='disabled')
+        self.status_var.set("正在取消...")
+        
+    def finish_analysis(self):
+        """分析结束后恢复界面状态（主线程执行）"""
+        cancelled = self.cancel_event.is_set()
+        if not cancelled:
+            self.progress.config(value=self.progress.cget('maximum'))
+        self.analyze_btn.config(state='normal')
+        self.refresh_btn.config(state='normal')
+        self.cancel_btn.config(state='disabled')
+        self.status_var.set("已取消" if cancelled else "分析完成")
+        run = metrics.finish_run()
+        if run is not None:
+            self.log_message(run.format_stages())
+    
+    def show_no_results(self):
+        """未找到候选股时清空表格（主线程执行）"""
+        self.clear_results_table()
+        self.stats_text.delete(1.0, tk.END)
+        self.stats_text.insert(tk.END, "未找到符合条件的股票")
     
     def display_results(self, candidates, all_data):
         """显示分析结果"""
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
-        
-        for _, row in candidates.iterrows():
-            self.result_tree.insert('', 'end', values=(
-                row['股票名'],
-                row['代码'], 
-                f"{row['股价']:.2f}",
-                f"{row['PB']:.3f}",
-                f"{row['PE']:.2f}",
-                f"{row['市值(亿)']:.2f}"
-            ))
+        with metrics.stage('render'):
+            self.result_table.load(candidates)
         
         if not all_data.empty:
-            stats = f"""总股票数: {len(all_data)}
+            scope = f"(PB≤{self.fetched_pb_limit})" if self.fetched_pb_limit is not None else ""
+            stats = f"""总股票数{scope}: {len(all_data)}
 候选股票数: {len(candidates)}
 PB范围: {all_data['pb_ratio'].min():.3f} ~ {all_data['pb_ratio'].max():.3f}
 PE范围: {all_data['pe_ratio'].min():.2f} ~ {all_data['pe_ratio'].max():.2f}
@@ -304,27 +543,32 @@ PE范围: {all_data['pe_ratio'].min():.2f} ~ {all_data['pe_ratio'].max():.2f}
         self.stats_text.insert(tk.END, stats)
         self.analysis_result = candidates
         self.all_data = all_data
+        self.export_all_btn.config(state='normal' if len(all_data) else 'disabled')
     
     def clear_results_table(self):
         """清空结果表格"""
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
+        self.result_table.clear()
     
-    def export_results(self):
-        """导出结果"""
-        if self.analysis_result is None or self.analysis_result.empty:
+    def export_results(self, universe=False):
+        """导出结果，universe 为 True 时导出全部行情；格式按扩展名（CSV / XLSX / Parquet / Feather）"""
+        data = self.all_data if universe else self.analysis_result
+        if isinstance(data, compact_snapshot.CompactSnapshot):
+            data = data.to_frame()
+        if data is None or data.empty:
             messagebox.showwarning("警告", "没有可导出的结果")
             return
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            title="保存分析结果"
+            filetypes=EXPORT_FILETYPES,
+            title="保存全部行情" if universe else "保存分析结果"
         )
         
         if filename:
             try:
-                self.analysis_result.to_csv(filename, index=False, encoding='utf-8-sig')
+                start = time.perf_counter()
+                rows = exporters.export(data, filename, encoding=exporters.EXPORT_ENCODING)
+                self.log_message(f"📤 已导出 {rows} 行到 {filename}（{(time.perf_counter() - start) * 1000:.0f} 毫秒）")
                 messagebox.showinfo("成功", f"结果已保存到 {filename}")
             except Exception as e:
                 messagebox.showerror("错误", f"保存失败: {str(e)}")
@@ -336,11 +580,19 @@ PE范围: {all_data['pe_ratio'].min():.2f} ~ {all_data['pe_ratio'].max():.2f}
         self.analysis_result = None
         self.all_data = None
         self.export_btn.config(state='disabled')
+        self.export_all_btn.config(state='disabled')
         self.log_message("结果已清空")
 
 def main():
+    parser = argparse.ArgumentParser(description="股票捡烟蒂策略分析工具")
+    parser.add_argument('--offline', action='store_true', help="不联网，筛选最新保存的行情快照")
+    parser.add_argument('--snapshot', metavar='KEY', help="不联网，筛选指定的行情快照")
+    parser.add_argument('--server', metavar='URL', help="从筛选服务获取行情（如 http://127.0.0.1:8765），不直接访问新浪")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = StockAnalysisApp(root)
+    app = StockAnalysisApp(root, snapshot=args.snapshot or (snapshot_store.LATEST if args.offline else None),
+                           server=args.server)
     root.mainloop()
 
 if __name__ == "__main__":
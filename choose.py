@@ -1,140 +1,196 @@
-import akshare as ak
 import pandas as pd
-import requests
-import json
+import argparse
 import time
 import warnings
+
+import backtest
+import exporters
+import metrics
+import monitor
+import quote_sources
+import sina_fetch
+import snapshot_store
+import sweep
+import valuation_history
+from criteria import Criteria, CriteriaError, combined_pb_bound, evaluate_strategies, load_strategies
+
 warnings.filterwarnings('ignore')
 
-def get_realtime_quotes_sina_fixed():
-    """从新浪财经获取实时A股行情（最终修复版）"""
-    print("正在获取实时行情数据...")
-    
-    all_data = []
-    
-    # 分批获取沪深A股数据
-    for page in range(1, 100):
-        try:
-            url = f"http://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData?page={page}&num=80&sort=code&asc=1&node=hs_a"
-            response = requests.get(url, timeout=10)
-            data = response.json()
-            
-            if not data:
-                break
-                
-            all_data.extend(data)
-            print(f"已获取第 {page} 页数据，累计 {len(all_data)} 只股票")
-            
-            time.sleep(0.5)
-        except Exception as e:
-            print(f"获取第 {page} 页失败: {e}")
-            break
-    
-    if not all_data:
-        print("❌ 无法获取实时行情数据")
-        return pd.DataFrame()
-    
-    # 转换为 DataFrame
-    df = pd.DataFrame(all_data)
-    
-    # 新浪财经返回的字段名
-    # 'symbol': 'sz000001' 格式
-    # 'pb': 市净率
-    # 'per': 市盈率
-    # 'mktcap': 总市值（万元）
-    
-    # 提取股票代码（去掉前缀 sz/sh）
-    df['code'] = df['symbol'].str[2:]  # 去掉 'sz' 或 'sh' 前缀
-    
-    # 数据类型转换
-    df['pb'] = pd.to_numeric(df['pb'], errors='coerce')
-    df['per'] = pd.to_numeric(df['per'], errors='coerce')
-    df['trade'] = pd.to_numeric(df['trade'], errors='coerce')
-    df['mktcap'] = pd.to_numeric(df['mktcap'], errors='coerce') * 10000  # 万元转元
-    
-    # 重命名字段
-    df = df.rename(columns={
-        'name': 'name',
-        'pb': 'pb_ratio',
-        'per': 'pe_ratio', 
-        'trade': 'price',
-        'mktcap': 'market_cap'
-    })
-    
-    # 过滤有效数据
-    df = df.dropna(subset=['pb_ratio', 'price'])
-    df = df[df['pb_ratio'] > 0]
-    df = df[df['price'] > 0]
-    
-    print(f"📊 成功获取 {len(df)} 只股票的有效行情数据")
-    print(f"📊 PB 数据范围: {df['pb_ratio'].min():.3f} ~ {df['pb_ratio'].max():.3f}")
-    
-    return df[['code', 'name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']]
+FETCH_WORKERS = 8         # 并发抓取页数上限
+QUOTE_SOURCES = quote_sources.DEFAULT_SOURCES  # 行情源优先顺序，首选源慢或失败时对冲 / 切换到后面的源
+MARKET_NODES = sina_fetch.DEFAULT_NODES  # 抓取的板块节点，多个节点并发抓取后合并去重
+BOARDS = sina_fetch.MAIN_BOARDS          # 参与筛选的板块，None 为抓到的全部板块
+SCREEN_AWARE_FETCH = True  # 按 PB 升序抓取，超过 PB 上限后提前停止
+SAVE_SNAPSHOTS = True      # 每次抓取的行情保存到 snapshots/ 目录
+RESULT_LOG = True          # 每次筛选的候选股追加到 results/ 下按日期分区的结果日志
+
+# 捡烟蒂筛选阈值
+PB_MAX = 1.2      # 最大市净率
+PE_MAX = 20       # 最大市盈率
+MCAP_MIN = 1e10   # 最小市值（元），即 100 亿
+DEFAULT_CRITERIA = f"0 < pb <= {PB_MAX} and 0 < pe <= {PE_MAX} and mcap > {MCAP_MIN:g} and price > 0"
+HISTORY_YEARS = valuation_history.HISTORY_YEARS  # PB 分位数回看年数（条件中用到 pb_pct 时）
+
+def get_realtime_quotes_sina_fixed(max_workers=FETCH_WORKERS, pb_limit=None, snapshot=None):
+    """获取实时A股行情（默认新浪财经并发分页，慢或失败时对冲 / 切换到 QUOTE_SOURCES 中的其他源）
+
+    pb_limit 为 None 时抓取全市场，否则只抓取 PB ≤ pb_limit 所在的页。
+    snapshot 不为 None 时不联网，直接读取该快照（'latest' 为最新一份）。
+    """
+    if snapshot is not None:
+        with metrics.stage('snapshot'):
+            return snapshot_store.load_snapshot_for_screen(snapshot, pb_limit=pb_limit, log=print)
+
+    sources = quote_sources.create_sources(QUOTE_SOURCES, max_workers=max_workers, nodes=MARKET_NODES)
+    df = quote_sources.get_quotes(sources, pb_limit=pb_limit, log=print)
+    if SAVE_SNAPSHOTS and not df.empty:
+        with metrics.stage('save'):
+            key = snapshot_store.save_snapshot(df, pb_limit=pb_limit)
+        print(f"💾 行情快照已保存: {key}")
+    return df
 
 def get_stock_list_offline():
-    """获取股票列表（本地缓存）"""
+    """获取股票列表（本地缓存，剔除 ST/退市股；旧版缓存只含主板）"""
     try:
         df = pd.read_csv('a_stock_list.csv', dtype={'code': str})
         print(f"✅ 从本地加载 {len(df)} 只股票")
     except:
         print("正在获取股票列表并保存...")
+        import akshare as ak  # 只在没有本地股票列表时才需要，按需导入以加快启动
         df = ak.stock_info_a_code_name()
         df = df[~df['name'].str.contains('ST|退', na=False)]
         df['code'] = df['code'].astype(str).str.zfill(6)
-        df = df[df['code'].str.startswith(('60', '00'))]  # 只保留主板
         df.to_csv('a_stock_list.csv', index=False, encoding='utf-8')
         print(f"✅ 已保存 {len(df)} 只股票到本地")
     
     return df
 
-def get_cigar_butt_realtime_final():
-    """实时捡烟蒂策略（最终版）"""
-    print("🔍 开始执行捡烟蒂策略...")
-    
+def merge_stock_list(quotes, stock_list, boards=None):
+    """按代码合并股票列表中的名称，只保留 boards 中的板块（None 为全部）和非ST股票
+
+    主板股票必须在股票列表中；其他板块的股票不在列表中时（旧版缓存只含主板）
+    按行情自带的名称剔除 ST/退市股。没有 board 列的旧快照按代码补上。
+    """
+    quotes = quotes.assign(code=quotes['code'].astype(str).str.zfill(6))
+    if 'board' not in quotes.columns:
+        quotes['board'] = sina_fetch.board_of(quotes['code'])
+    if boards is not None:
+        quotes = quotes[quotes['board'].isin(boards)]
+    merged = pd.merge(
+        quotes,
+        stock_list[['code', 'name']].rename(columns={'name': 'display_name'}),
+        on='code', how='left'
+    )
+    listed = merged['display_name'].notna()
+    unlisted_ok = ~merged['board'].isin(sina_fetch.MAIN_BOARDS) & ~merged['name'].str.contains('ST|退', na=False)
+    merged = merged[listed | unlisted_ok].reset_index(drop=True)
+    merged['display_name'] = merged['display_name'].fillna(merged['name'])
+    return merged
+
+def get_market_data(pb_limit=None, snapshot=None):
+    """获取实时行情并与股票列表合并（只保留 BOARDS 中的非ST股票）"""
     # 获取实时行情
-    realtime_data = get_realtime_quotes_sina_fixed()
+    realtime_data = get_realtime_quotes_sina_fixed(pb_limit=pb_limit, snapshot=snapshot)
     if realtime_data.empty:
         print("❌ 获取实时行情失败")
         return pd.DataFrame()
     
-    print(f"📊 从新浪财经获取到 {len(realtime_data)} 只股票数据")
+    print(f"📊 获取到 {len(realtime_data)} 只股票数据")
+    metrics.rows('fetched', len(realtime_data))
     
     # 获取股票列表
-    stock_list = get_stock_list_offline()
+    with metrics.stage('stock_list'):
+        stock_list = get_stock_list_offline()
     
-    # 标准化股票代码格式
-    realtime_data['code'] = realtime_data['code'].astype(str).str.zfill(6)
-    stock_list['code'] = stock_list['code'].astype(str).str.zfill(6)
-    
-    # 合并数据（只保留非ST股票）
-    merged = pd.merge(
-        realtime_data,
-        stock_list[['code', 'name']].rename(columns={'name': 'display_name'}),
-        on='code', how='inner'
-    )
+    with metrics.stage('merge'):
+        stock_list['code'] = stock_list['code'].astype(str).str.zfill(6)
+        merged = merge_stock_list(realtime_data, stock_list, BOARDS)
     
     print(f"📊 合并后数据 {len(merged)} 条")
+    metrics.rows('merged', len(merged))
+    return merged
+
+def add_history_columns(merged, columns, history_source=None, history_years=HISTORY_YEARS):
+    """条件用到 pb_percentile 时，为行情补充当前 PB 在自身历史中的分位数
+
+    history_source 为 None 时通过 akshare 下载历史估值，否则为本地快照目录（离线替身）。
+    """
+    if 'pb_percentile' not in columns:
+        return merged
+    if history_source is None:
+        source = valuation_history.AkshareValuationSource()
+    else:
+        source = valuation_history.SnapshotValuationSource(history_source)
+    with metrics.stage('history'):
+        return valuation_history.add_pb_percentile(merged, source, years=history_years)
+
+def format_candidates(candidates):
+    """按 PB 升序整理为展示用的中文列（市值转为亿元）"""
+    columns = ['display_name', 'code', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']
+    labels = ['股票名', '代码', '股价', 'PB', 'PE', '市值(亿)']
+    if 'pb_percentile' in candidates.columns:
+        columns.append('pb_percentile')
+        labels.append('PB分位')
+    if 'board' in candidates.columns and not candidates['board'].isin(sina_fetch.MAIN_BOARDS).all():  # 含主板以外的板块时标注
+        columns.append('board')
+        labels.append('板块')
+    result = candidates[columns].copy()
+    result = result.sort_values('pb_ratio').reset_index(drop=True)
+    result['market_cap'] = (result['market_cap'] / 1e8).round(2)  # 转为亿元
+    if 'pb_percentile' in result.columns:
+        result['pb_percentile'] = result['pb_percentile'].round(3)
+    result.columns = labels
+    return result
+
+def export_universe(merged, path):
+    """导出合并后的全部行情（格式按扩展名，见 exporters.export）"""
+    start = time.perf_counter()
+    with metrics.stage('export'):
+        rows = exporters.export(merged, path, encoding=exporters.EXPORT_ENCODING)
+    print(f"📤 全部行情 {rows} 条已导出到 {path}（{(time.perf_counter() - start) * 1000:.0f} 毫秒）")
+
+def get_cigar_butt_realtime_final(snapshot=None, criteria=DEFAULT_CRITERIA, show=True,
+                                  history_source=None, history_years=HISTORY_YEARS, export=None):
+    """实时捡烟蒂策略（最终版），snapshot 不为 None 时筛选离线快照
+
+    show 为 False 时只打印候选股数量，不打印表格（供监控模式反复调用）。
+    history_source / history_years 见 add_history_columns；export 不为 None 时把合并后的
+    全部行情导出到该文件。
+    """
+    print("🔍 开始执行捡烟蒂策略...")
+    if isinstance(criteria, str):
+        criteria = Criteria(criteria)
+    
+    # 按 PB 快速抓取时，只需覆盖筛选条件中的 PB 上限
+    pb_limit = criteria.pb_upper_bound() if SCREEN_AWARE_FETCH else None
+    merged = get_market_data(pb_limit=pb_limit, snapshot=snapshot)
+    if merged.empty:
+        return pd.DataFrame()
+    merged = add_history_columns(merged, criteria.columns, history_source, history_years)
+    if export:
+        export_universe(merged, export)
     
-    # 捡烟蒂筛选条件
-    candidates = merged[
-        (merged['pb_ratio'] > 0) & (merged['pb_ratio'] <= 1.2) &  # PB <= 1.2
-        (merged['pe_ratio'] > 0) & (merged['pe_ratio'] <= 20) &   # PE <= 20
-        (merged['market_cap'] > 1e10) &                          # 市值 > 100亿
-        (merged['price'] > 0)                                    # 股价 > 0
-    ].copy()
+    # 捡烟蒂筛选条件（默认: PB <= 1.2，PE <= 20，市值 > 100亿，股价 > 0）
+    cache = {}
+    with metrics.stage('screen'):
+        candidates = merged[criteria.mask(merged, cache)]
+    # 各条件逐个叠加后剩余的行数（复用上面的求值缓存）
+    for step, count in criteria.funnel(merged, cache):
+        metrics.rows(step, count)
     
     if not candidates.empty:
-        result = candidates[['display_name', 'code', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']].copy()
-        result = result.sort_values('pb_ratio').reset_index(drop=True)
-        result['market_cap'] = (result['market_cap'] / 1e8).round(2)  # 转为亿元
-        result.columns = ['股票名', '代码', '股价', 'PB', 'PE', '市值(亿)']
-        
-        print(f"\n✅ 找到 {len(result)} 只捡烟蒂候选股（PB≤1.2）:")
-        print(result.to_string(index=False))
+        with metrics.stage('render'):
+            result = format_candidates(candidates)
+            
+            print(f"\n✅ 找到 {len(result)} 只捡烟蒂候选股（{criteria.text}）" + (":" if show else ""))
+            if show:
+                print(result.to_string(index=False))
         
         return result
     else:
-        print("❌ 未找到 PB≤1.2 的股票")
+        print(f"❌ 未找到符合 {criteria.text} 的股票")
+        if not show:
+            return pd.DataFrame(columns=['股票名', '代码', '股价', 'PB', 'PE', '市值(亿)'])
         
         # 显示 PB 最低的股票
         lowest = merged.nsmallest(20, 'pb_ratio')[['display_name', 'code', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']].copy()
@@ -146,12 +202,280 @@ def get_cigar_butt_realtime_final():
         
         return pd.DataFrame()
 
+def run_strategies(strategies, snapshot=None, history_source=None, history_years=HISTORY_YEARS):
+    """在同一份行情上一次性运行多个命名策略，返回 {策略名: 候选股}
+
+    只下载一次行情（按 PB 快速抓取时取各策略 PB 上限的最大值），
+    所有策略共享比较结果，相同的子条件只计算一次。
+    """
+    print(f"🔍 开始执行 {len(strategies)} 个策略...")
+    pb_limit = combined_pb_bound(strategies) if SCREEN_AWARE_FETCH else None
+    merged = get_market_data(pb_limit=pb_limit, snapshot=snapshot)
+    if merged.empty:
+        return {}
+    columns = set().union(*(criteria.columns for criteria in strategies.values()))
+    merged = add_history_columns(merged, columns, history_source, history_years)
+    
+    screen_start = time.perf_counter()
+    with metrics.stage('screen'):
+        masks = evaluate_strategies(merged, strategies)
+    with metrics.stage('render'):
+        results = {name: format_candidates(merged[mask]) for name, mask in masks.items()}
+    print(f"⚡ {len(strategies)} 个策略筛选耗时 {(time.perf_counter() - screen_start) * 1000:.1f} 毫秒")
+    for name, result in results.items():
+        metrics.rows(name, len(result))
+    
+    for name, result in results.items():
+        print(f"\n✅ [{name}] {strategies[name].text}: {len(result)} 只候选股")
+        if not result.empty:
+            print(result.head(10).to_string(index=False))
+    
+    return results
+
+def run_sweep(pb_values, pe_values, mcap_values, snapshot=None, parameter_sets=None, out_prefix='sweep'):
+    """在同一份行情上一次性评估整个阈值网格，写出候选数量表和入选表
+
+    mcap_values 与 parameter_sets 中的市值单位为亿；parameter_sets 不为 None 时
+    只输出文件中列出的参数组，否则输出整个网格。
+    """
+    print(f"🔍 参数扫描: {len(pb_values)} × {len(pe_values)} × {len(mcap_values)} 组阈值")
+    pb_limit = float(max(pb_values)) if SCREEN_AWARE_FETCH else None
+    merged = get_market_data(pb_limit=pb_limit, snapshot=snapshot)
+    if merged.empty:
+        return
+    
+    sweep_start = time.perf_counter()
+    grids, counts, members = sweep.sweep_grid(
+        merged, pb_values, pe_values, [value * 1e8 for value in mcap_values],
+        label_columns=('display_name', 'code'))
+    if parameter_sets is None:
+        table = sweep.counts_table(grids, counts)
+    else:
+        table = sweep.lookup_counts(grids, counts, parameter_sets.assign(mcap_min=parameter_sets['mcap_min'] * 1e8))
+    print(f"⚡ 扫描 {len(table)} 组参数耗时 {(time.perf_counter() - sweep_start) * 1000:.1f} 毫秒")
+    
+    table['mcap_min'] = table['mcap_min'] / 1e8  # 转为亿元
+    table = table.round({'pb_max': 4, 'pe_max': 4, 'mcap_min': 2})
+    table.columns = ['PB上限', 'PE上限', '最小市值(亿)', '候选数']
+    
+    # 入选表：股票入选某组参数，当且仅当 PB上限 >= 最小PB上限、PE上限 >= 最小PE上限、
+    # 最小市值 <= 最大市值下限
+    members['market_cap'] = (members['market_cap'] / 1e8).round(2)
+    members['mcap_upto'] = (members['mcap_upto'] / 1e8).round(2)
+    members = members.round({'pb_from': 4, 'pe_from': 4})
+    members.columns = ['股票名', '代码', 'PB', 'PE', '市值(亿)', '最小PB上限', '最小PE上限', '最大市值下限(亿)']
+    
+    table.to_csv(f'{out_prefix}_counts.csv', index=False, encoding='utf-8')
+    members.to_csv(f'{out_prefix}_members.csv', index=False, encoding='utf-8')
+    print(f"✅ 候选数量表已保存到 {out_prefix}_counts.csv，入选表已保存到 {out_prefix}_members.csv")
+    print(table.sort_values('候选数', ascending=False).head(10).to_string(index=False))
+
+def run_backtest(criteria, hold=backtest.HOLD_DAYS, cost=0.0, start=None, end=None,
+                 root=snapshot_store.SNAPSHOT_DIR, all_stocks=False, include_partial=False, out_prefix='backtest'):
+    """在已保存的逐日行情快照上回测筛选条件，写出每日净值表和调仓表
+
+    默认与实时筛选一样只保留股票列表中 BOARDS 板块的非ST股票（按当前列表，存在幸存者偏差）。
+    include_partial 为 True 时，没有全市场快照的日期使用按 PB 快速抓取的快照（收益可能失真）。
+    """
+    panel = backtest.load_panel(root=root, start=start, end=end, include_partial=include_partial)
+    if not all_stocks:
+        codes = get_stock_list_offline()['code'].astype(str).str.zfill(6)
+        if BOARDS is not None:
+            codes = codes[pd.Series(sina_fetch.board_of(codes), index=codes.index).isin(BOARDS)]
+        panel = panel.restrict(codes)
+    print(f"🔍 回测条件: {criteria.text}，每 {hold} 个交易日调仓")
+    daily, periods, summary = backtest.timed_backtest(panel, criteria, hold=hold, cost=cost)
+    print(backtest.format_summary(summary))
+    
+    daily.to_csv(f'{out_prefix}_daily.csv', index=False, encoding='utf-8')
+    periods.to_csv(f'{out_prefix}_periods.csv', index=False, encoding='utf-8')
+    print(f"✅ 每日净值已保存到 {out_prefix}_daily.csv，调仓记录已保存到 {out_prefix}_periods.csv")
+
+def save_metrics(report=None, prom_file=None):
+    """结束本次运行的指标记录，打印各阶段耗时，并按需写出 JSON 报告和 Prometheus 指标文件"""
+    run = metrics.finish_run()
+    if run is None:
+        return
+    print(run.format_stages())
+    if report:
+        run.write_json(report)
+        print(f"📝 运行报告已保存到 {report}")
+    if prom_file:
+        run.write_prometheus(prom_file)
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="实时捡烟蒂策略（命令行版）")
+    parser.add_argument('--offline', action='store_true', help="不联网，筛选最新保存的行情快照")
+    parser.add_argument('--snapshot', metavar='KEY', help="不联网，筛选指定的行情快照（如 20240102-093000）")
+    parser.add_argument('--list-snapshots', action='store_true', help="列出已保存的行情快照")
+    parser.add_argument('--sources', metavar='NAMES', default=','.join(QUOTE_SOURCES),
+                        help=f"逗号分隔的行情源优先顺序（可用: {', '.join(quote_sources.SOURCES)}），"
+                             f"默认 {','.join(QUOTE_SOURCES)}")
+    parser.add_argument('--nodes', metavar='NODES', default=','.join(MARKET_NODES),
+                        help=f"逗号分隔的新浪板块节点（可用: {', '.join(sina_fetch.MARKET_NODES)}），"
+                             f"多个节点并发抓取，默认 {','.join(MARKET_NODES)}")
+    parser.add_argument('--boards', metavar='BOARDS', default=','.join(BOARDS),
+                        help=f"逗号分隔的参与筛选的板块（{'、'.join(board for board, _ in sina_fetch.BOARD_PREFIXES)}），"
+                             f"all 为抓到的全部板块，默认 {','.join(BOARDS)}")
+    parser.add_argument('--source-stats', action='store_true', help="显示各行情源的健康状况和耗时统计")
+    parser.add_argument('--criteria', metavar='EXPR', default=DEFAULT_CRITERIA,
+                        help=f"筛选条件表达式，默认 \"{DEFAULT_CRITERIA}\"")
+    parser.add_argument('--strategies', metavar='FILE',
+                        help="策略文件，每行 \"名称: 表达式\"，一次下载运行全部策略")
+    parser.add_argument('--history-years', type=float, default=HISTORY_YEARS,
+                        help=f"条件中 pb_pct（PB 历史分位数）的回看年数，默认 {HISTORY_YEARS}")
+    parser.add_argument('--history-source', metavar='DIR',
+                        help="用本地快照目录代替 akshare 作为历史估值来源（离线测试用）")
+    parser.add_argument('--export', metavar='FILE',
+                        help=f"把合并后的全部行情导出到该文件（按扩展名: {', '.join(exporters.FORMATS)}）")
+    parser.add_argument('--report', metavar='FILE', nargs='?', const=metrics.REPORT_FILE,
+                        help=f"把各阶段耗时、请求统计和各筛选步骤的行数写入 JSON 报告（默认 {metrics.REPORT_FILE}）")
+    parser.add_argument('--prom-file', metavar='FILE',
+                        help="同时写出 Prometheus textfile 格式的指标文件（供 node_exporter 采集）")
+    sweep_group = parser.add_argument_group("参数扫描（RANGE 为 起:止:个数 或 逗号分隔的值）")
+    sweep_group.add_argument('--sweep-pb', metavar='RANGE', help="PB 上限，如 0.5:1.5:50")
+    sweep_group.add_argument('--sweep-pe', metavar='RANGE', help="PE 上限，如 5:30:50")
+    sweep_group.add_argument('--sweep-mcap', metavar='RANGE', help="最小市值（亿），如 50:500:10")
+    sweep_group.add_argument('--sweep-file', metavar='FILE', help="参数组 CSV，列为 pb_max,pe_max,mcap_min（亿）")
+    sweep_group.add_argument('--sweep-out', metavar='PREFIX', default='sweep', help="输出文件前缀，默认 sweep")
+    backtest_group = parser.add_argument_group("历史回测（使用 --criteria 指定的条件）")
+    backtest_group.add_argument('--backtest', action='store_true', help="在逐日行情快照上回测筛选条件")
+    backtest_group.add_argument('--hold', type=int, default=backtest.HOLD_DAYS,
+                                help=f"持有期（交易日），默认 {backtest.HOLD_DAYS}")
+    backtest_group.add_argument('--cost', type=float, default=0.0, help="单边交易费率，如 0.001")
+    backtest_group.add_argument('--start', metavar='YYYYMMDD', help="回测开始日期")
+    backtest_group.add_argument('--end', metavar='YYYYMMDD', help="回测结束日期")
+    backtest_group.add_argument('--snapshot-dir', default=snapshot_store.SNAPSHOT_DIR,
+                                help=f"快照目录，默认 {snapshot_store.SNAPSHOT_DIR}")
+    backtest_group.add_argument('--all-stocks', action='store_true', help="不按股票列表（主板非ST）过滤")
+    backtest_group.add_argument('--include-partial', action='store_true',
+                                help="当天没有全市场快照时使用按PB快速抓取的快照（高PB股票缺少价格，收益可能失真）")
+    backtest_group.add_argument('--backtest-out', metavar='PREFIX', default='backtest', help="输出文件前缀，默认 backtest")
+    monitor_group = parser.add_argument_group("监控模式")
+    monitor_group.add_argument('--monitor', action='store_true', help="交易时段内持续筛选，候选股变化写入事件日志")
+    monitor_group.add_argument('--interval', type=float, default=monitor.BASE_INTERVAL,
+                               help=f"有变化时的轮询间隔（秒），默认 {monitor.BASE_INTERVAL}")
+    monitor_group.add_argument('--max-interval', type=float, default=monitor.MAX_INTERVAL,
+                               help=f"无变化时放慢到的最长间隔（秒），默认 {monitor.MAX_INTERVAL}")
+    monitor_group.add_argument('--events', metavar='FILE', default=monitor.EVENT_LOG,
+                               help=f"事件日志（JSONL），默认 {monitor.EVENT_LOG}")
+    monitor_group.add_argument('--alert-pb', metavar='LEVELS', default=','.join(map(str, monitor.ALERT_PB_LEVELS)),
+                               help="候选股 PB 穿越这些水平时记录事件，逗号分隔")
+    monitor_group.add_argument('--calendar', metavar='FILE', default=monitor.CALENDAR_FILE,
+                               help=f"本地交易日历，默认 {monitor.CALENDAR_FILE}")
+    monitor_group.add_argument('--update-calendar', action='store_true', help="下载交易日历到 --calendar 指定的文件")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.list_snapshots:
+        for key in snapshot_store.list_snapshots():
+            print(key)
+        raise SystemExit
+    
+    if args.source_stats:
+        print(quote_sources.get_stats().summary() or "尚无行情源统计")
+        raise SystemExit
+    
+    try:
+        criteria = Criteria(args.criteria)
+        strategies = load_strategies(args.strategies) if args.strategies else None
+        QUOTE_SOURCES = tuple(name.strip() for name in args.sources.split(',') if name.strip())
+        MARKET_NODES = tuple(node.strip() for node in args.nodes.split(',') if node.strip())
+        quote_sources.create_sources(QUOTE_SOURCES, nodes=MARKET_NODES)
+        BOARDS = None if args.boards == 'all' else tuple(board.strip() for board in args.boards.split(',') if board.strip())
+        for board in BOARDS or ():
+            if board not in dict(sina_fetch.BOARD_PREFIXES):
+                raise ValueError(f"未知的板块: {board}")
+        if args.export:
+            exporters.check_format(args.export)
+    except (CriteriaError, ValueError, OSError) as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    
+    if args.update_calendar:
+        monitor.update_calendar(args.calendar)
+        raise SystemExit
+    
     start_time = time.time()
-    candidates = get_cigar_butt_realtime_final()
+    snapshot = args.snapshot or (snapshot_store.LATEST if args.offline else None)
+    
+    if args.backtest:
+        try:
+            run_backtest(criteria, hold=args.hold, cost=args.cost, start=args.start, end=args.end,
+                         root=args.snapshot_dir, all_stocks=args.all_stocks, include_partial=args.include_partial,
+                         out_prefix=args.backtest_out)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        print(f"\n⏱️ 总耗时: {round(time.time() - start_time, 2)} 秒")
+        raise SystemExit
+    
+    if args.monitor:
+        if snapshot is not None:
+            print("❌ 监控模式需要联网获取实时行情，不能与 --offline/--snapshot 同时使用")
+            raise SystemExit(1)
+        def screen():
+            metrics.start_run('monitor')
+            try:
+                return get_cigar_butt_realtime_final(criteria=criteria, show=False,
+                                                     history_source=args.history_source,
+                                                     history_years=args.history_years)
+            finally:
+                save_metrics(args.report, args.prom_file)
+        
+        try:
+            monitor.run_monitor(
+                screen,
+                calendar=monitor.TradingCalendar.load(args.calendar),
+                base_interval=args.interval, max_interval=args.max_interval, event_log=args.events,
+                levels=[float(level) for level in args.alert_pb.split(',') if level])
+        except KeyboardInterrupt:
+            print("\n👋 监控已停止")
+        raise SystemExit
+    
+    if args.sweep_file or args.sweep_pb or args.sweep_pe or args.sweep_mcap:
+        if args.sweep_file:
+            parameter_sets = sweep.load_parameter_sets(args.sweep_file)
+            pb_values = parameter_sets['pb_max'].unique()
+            pe_values = parameter_sets['pe_max'].unique()
+            mcap_values = parameter_sets['mcap_min'].unique()
+        else:
+            parameter_sets = None
+            pb_values = sweep.parse_range(args.sweep_pb) if args.sweep_pb else [PB_MAX]
+            pe_values = sweep.parse_range(args.sweep_pe) if args.sweep_pe else [PE_MAX]
+            mcap_values = sweep.parse_range(args.sweep_mcap) if args.sweep_mcap else [MCAP_MIN / 1e8]
+        run_sweep(pb_values, pe_values, mcap_values, snapshot=snapshot,
+                  parameter_sets=parameter_sets, out_prefix=args.sweep_out)
+        print(f"\n⏱️ 总耗时: {round(time.time() - start_time, 2)} 秒")
+        raise SystemExit
+    
+    if strategies:
+        metrics.start_run('strategies')
+        results = run_strategies(strategies, snapshot=snapshot, history_source=args.history_source,
+                                 history_years=args.history_years)
+        print(f"\n⏱️ 总耗时: {round(time.time() - start_time, 2)} 秒")
+        save_metrics(args.report, args.prom_file)
+        for name, result in results.items():
+            if not result.empty:
+                exporters.export(result, f'cigar_butt_{name}.csv')
+                if RESULT_LOG:
+                    exporters.ResultLog().append(result, kind=name)
+        print(f"✅ 各策略结果已保存到 cigar_butt_<策略名>.csv"
+              + (f"，并追加到 {exporters.RESULT_LOG_DIR}/ 结果日志" if RESULT_LOG else ""))
+        raise SystemExit
+    
+    metrics.start_run('screen')
+    candidates = get_cigar_butt_realtime_final(snapshot=snapshot, criteria=criteria,
+                                               history_source=args.history_source,
+                                               history_years=args.history_years, export=args.export)
     print(f"\n⏱️ 总耗时: {round(time.time() - start_time, 2)} 秒")
+    save_metrics(args.report, args.prom_file)
     
     # 保存结果
     if not candidates.empty:
-        candidates.to_csv('cigar_butt_realtime.csv', index=False, encoding='utf-8')
-        print("✅ 结果已保存到 cigar_butt_realtime.csv")
\ No newline at end of file
+        exporters.export(candidates, 'cigar_butt_realtime.csv')
+        print("✅ 结果已保存到 cigar_butt_realtime.csv")
+        if RESULT_LOG:
+            print(f"🗂️ 结果已追加到 {exporters.ResultLog().append(candidates)}")
\ No newline at end of file
@@ -0,0 +1,194 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import snapshot_store
+
+PRICE_SCALE = 1000                       # 价格定点数的单位：1/1000 元
+PRICE_MISSING = np.iinfo(np.int32).min   # 缺失价格的定点数取值
+CODE_MISSING = -1                        # 无法解析为数字的股票代码
+NUMERIC_COLUMNS = ('price', 'pb_ratio', 'pe_ratio', 'market_cap')
+
+
+class NameTable:
+    """跨快照共享的股票名称字典：每个名称只保存一份，快照中以 int32 编号引用"""
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self._array = np.empty(0, dtype=object)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, names):
+        """把名称序列转为编号数组，新名称追加到字典末尾"""
+        values = pd.Series(names, copy=False).fillna('').astype(str)
+        uniques, inverse = np.unique(values.to_numpy(dtype=object), return_inverse=True)
+        with self._lock:
+            mapping = np.empty(len(uniques), dtype=np.int32)
+            for i, name in enumerate(uniques):
+                index = self.ids.get(name)
+                if index is None:
+                    index = self.ids[name] = len(self.names)
+                    self.names.append(name)
+                mapping[i] = index
+        return mapping[inverse]
+
+    def decode(self, ids):
+        """把编号数组还原为名称（object 数组，元素引用字典中的同一个字符串）"""
+        with self._lock:
+            if len(self._array) != len(self.names):
+                self._array = np.asarray(self.names, dtype=object)
+            return self._array[ids]
+
+
+def _encode_codes(codes):
+    text = np.asarray(codes, dtype=str)
+    valid = np.char.isdigit(text)
+    values = np.full(len(text), CODE_MISSING, dtype=np.int32)
+    values[valid] = text[valid].astype(np.int32)
+    return values
+
+
+def _decode_codes(codes):
+    text = np.char.zfill(codes.astype(str), 6).astype(object)
+    text[codes == CODE_MISSING] = ''
+    return text
+
+
+def _encode_price(price):
+    price = np.asarray(price, dtype=np.float64)
+    fixed = np.full(len(price), PRICE_MISSING, dtype=np.int32)
+    valid = np.isfinite(price)
+    fixed[valid] = np.round(price[valid] * PRICE_SCALE)
+    return fixed
+
+
+def _decode_price(fixed):
+    price = fixed / PRICE_SCALE
+    price[fixed == PRICE_MISSING] = np.nan
+    return price
+
+
+class CompactSnapshot:
+    """紧凑的行情快照：每列一个连续的定长数组，按需生成 pandas 视图
+
+    code 为去掉前导零的 int32 代码，name 为共享 NameTable 中的 int32 编号，
+    price 为以 1/PRICE_SCALE 元为单位的 int32 定点数；参与阈值比较的 pb_ratio / pe_ratio
+    和 market_cap 保持 float64，在快照上筛选与在原始行情上筛选的结果完全一致
+    （float32 会改变阈值附近的值，如 PB 1.2000004 变为 1.2）。
+    每行 36 字节，而 object 字符串 + float64 的 DataFrame 每行约 200 字节。
+
+    snapshot['pb_ratio'] 等按列返回 Series，ScreenIndex、screen_mask 和 Criteria 可以
+    直接在快照上筛选；需要完整表格时用 to_frame。
+    """
+
+    def __init__(self, code, name, price, pb_ratio, pe_ratio, market_cap, names, meta=None,
+                 name_column='name'):
+        self.code = code
+        self.name = name
+        self.price = price
+        self.pb_ratio = pb_ratio
+        self.pe_ratio = pe_ratio
+        self.market_cap = market_cap
+        self.names = names
+        self.meta = meta or {}
+        self.name_column = name_column
+
+    @classmethod
+    def from_frame(cls, df, names=None, meta=None, name_column='name'):
+        """由行情 DataFrame 构建，name_column 为名称所在的列（合并股票列表后为 display_name）"""
+        names = names if names is not None else NameTable()
+        return cls(
+            code=_encode_codes(df['code']),
+            name=names.encode(df[name_column]),
+            price=_encode_price(df['price']),
+            pb_ratio=df['pb_ratio'].to_numpy(dtype=np.float64, copy=True),
+            pe_ratio=df['pe_ratio'].to_numpy(dtype=np.float64, copy=True),
+            market_cap=df['market_cap'].to_numpy(dtype=np.float64, copy=True),
+            names=names, meta=meta, name_column=name_column,
+        )
+
+    @classmethod
+    def load(cls, key=None, root=snapshot_store.SNAPSHOT_DIR, names=None):
+        """直接从保存的 .npy 快照构建，不经过 object 字符串的 DataFrame"""
+        df, meta = snapshot_store.load_snapshot(key, root, text=False)
+        return cls.from_frame(df, names=names, meta=meta)
+
+    def __len__(self):
+        return len(self.code)
+
+    @property
+    def empty(self):
+        return len(self.code) == 0
+
+    @property
+    def nbytes(self):
+        """各列数组占用的字节数（不含共享的名称字典）"""
+        return sum(getattr(self, column).nbytes
+                   for column in ('code', 'name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap'))
+
+    def column(self, column, rows=None):
+        """取一列（rows 为行位置时只取这些行），数值列还原为 float64，代码和名称还原为字符串"""
+        def pick(values):
+            return values if rows is None else values[rows]
+        if column == 'code':
+            return _decode_codes(pick(self.code))
+        if column == self.name_column:
+            return self.names.decode(pick(self.name))
+        if column == 'price':
+            return _decode_price(pick(self.price))
+        if column in ('pb_ratio', 'pe_ratio', 'market_cap'):
+            return pick(getattr(self, column))
+        raise KeyError(column)
+
+    def __getitem__(self, column):
+        return pd.Series(self.column(column), name=column, copy=False)
+
+    def to_frame(self, rows=None, columns=None):
+        """生成 pandas 视图：rows 为行位置（默认全部），columns 为列名（默认全部六列）"""
+        columns = columns or ('code', self.name_column) + NUMERIC_COLUMNS
+        return pd.DataFrame({column: self.column(column, rows) for column in columns}, copy=False)
+
+
+class SnapshotHistory:
+    """一个交易日内按时间顺序保存的紧凑快照，所有快照共享同一个名称字典，跨日时自动清空"""
+
+    def __init__(self, names=None, max_snapshots=None):
+        self.names = names if names is not None else NameTable()
+        self.max_snapshots = max_snapshots
+        self.snapshots = []
+        self.day = None
+
+    def append(self, df, fetched_at=None, pb_limit=None, name_column='name'):
+        """压缩一份行情并追加，返回压缩后的快照"""
+        fetched_at = fetched_at or datetime.now()
+        if fetched_at.date() != self.day:
+            self.snapshots = []
+            self.day = fetched_at.date()
+        snapshot = CompactSnapshot.from_frame(
+            df, names=self.names, name_column=name_column,
+            meta={'fetched_at': fetched_at.isoformat(timespec='seconds'), 'rows': len(df), 'pb_limit': pb_limit})
+        self.snapshots.append(snapshot)
+        if self.max_snapshots is not None:
+            del self.snapshots[:-self.max_snapshots]
+        return snapshot
+
+    def latest(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def __iter__(self):
+        return iter(self.snapshots)
+
+    @property
+    def nbytes(self):
+        """全部快照加名称字典的大致字节数"""
+        names = sum(len(name) * 4 + 50 for name in self.names.names)
+        return sum(snapshot.nbytes for snapshot in self.snapshots) + names
@@ -0,0 +1,263 @@
+import ast
+import operator
+
+import numpy as np
+
+# 表达式中可用的字段名 -> 行情列名
+FIELDS = {
+    'pb': 'pb_ratio',
+    'pe': 'pe_ratio',
+    'mcap': 'market_cap',
+    'price': 'price',
+    'pb_pct': 'pb_percentile',  # 当前 PB 在自身近几年历史中的分位数（0~1）
+    'pb_ratio': 'pb_ratio',
+    'pe_ratio': 'pe_ratio',
+    'market_cap': 'market_cap',
+    'pb_percentile': 'pb_percentile',
+}
+
+COMPARE_OPS = {
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Gt: '>',
+    ast.GtE: '>=',
+    ast.Eq: '==',
+    ast.NotEq: '!=',
+}
+OP_FUNCS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+# 常数写在左边时，把比较符翻转为“字段 op 常数”的形式
+FLIPPED = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!='}
+
+ARITH_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+
+
+class CriteriaError(ValueError):
+    """筛选条件表达式有误"""
+
+
+class Criteria:
+    """筛选条件表达式，例如 "pb <= 1.2 and 0 < pe <= 20 and mcap > 100e8"
+
+    支持 and / or / not、括号、连续比较和常数算术（如 100 * 1e8）。
+    表达式编译为规范化的节点树：('cmp', 列名, 比较符, 常数)、('and', 子节点...)、
+    ('or', 子节点...)、('not', 子节点)。相同的子表达式得到相同的节点，
+    多个策略一起求值时只计算一次；规范化的节点只用作求值缓存的键，
+    funnel 按书写顺序的顶层 and 条件（steps）逐步叠加。
+    """
+
+    def __init__(self, text):
+        self.text = text.strip()
+        try:
+            tree = ast.parse(self.text, mode='eval')
+        except SyntaxError as e:
+            raise CriteriaError(f"表达式语法错误: {self.text}") from e
+        self.root = self._compile(tree.body)
+        self.steps = list(dict.fromkeys(self._conjuncts(tree.body)))
+
+    def __repr__(self):
+        return f"Criteria({self.text!r})"
+
+    def _compile(self, node):
+        if isinstance(node, ast.BoolOp):
+            kind = 'and' if isinstance(node.op, ast.And) else 'or'
+            return _combine(kind, [self._compile(value) for value in node.values])
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ('not', self._compile(node.operand))
+        if isinstance(node, ast.Compare):
+            operands = [node.left] + node.comparators
+            atoms = []
+            for left, op, right in zip(operands, node.ops, operands[1:]):
+                if type(op) not in COMPARE_OPS:
+                    raise CriteriaError(f"不支持的比较符: {ast.unparse(node)}")
+                atoms.append(self._compare(left, COMPARE_OPS[type(op)], right))
+            return _combine('and', atoms)
+        raise CriteriaError(f"不支持的表达式: {ast.unparse(node)}")
+
+    def _conjuncts(self, node):
+        """顶层 and 条件按书写顺序展开，连续比较拆为各个比较"""
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+            return [step for value in node.values for step in self._conjuncts(value)]
+        if isinstance(node, ast.Compare):
+            operands = [node.left] + node.comparators
+            if all(type(op) in COMPARE_OPS for op in node.ops):
+                return [self._compare(left, COMPARE_OPS[type(op)], right)
+                        for left, op, right in zip(operands, node.ops, operands[1:])]
+        return [self._compile(node)]
+
+    def _compare(self, left, op, right):
+        for side in (left, right):
+            if isinstance(side, ast.Name):
+                _field(side)  # 先校验字段名
+        if isinstance(left, ast.Name) and not isinstance(right, ast.Name):
+            return ('cmp', _field(left), op, _constant(right))
+        if isinstance(right, ast.Name) and not isinstance(left, ast.Name):
+            return ('cmp', _field(right), FLIPPED[op], _constant(left))
+        raise CriteriaError(f"比较的一侧须为字段、另一侧须为常数: "
+                            f"{ast.unparse(left)} {op} {ast.unparse(right)}")
+
+    @property
+    def columns(self):
+        """表达式用到的行情列"""
+        return sorted(_columns(self.root))
+
+    def pb_upper_bound(self):
+        """表达式蕴含的 PB 上限，用于按 PB 快速抓取；无法确定时返回 None"""
+        return _pb_bound(self.root)
+
+    def mask(self, frame, cache=None):
+        """对行情求值，返回布尔数组；cache 可在多次求值间共享子表达式结果"""
+        return evaluate(self.root, frame, {} if cache is None else cache)
+
+    def funnel(self, frame, cache=None):
+        """按书写顺序逐个叠加顶层 and 条件，返回 [(条件文本, 满足前面全部条件的行数)]"""
+        cache = {} if cache is None else cache
+        mask = np.ones(len(frame), dtype=bool)
+        funnel = []
+        for node in self.steps:
+            mask &= evaluate(node, frame, cache)
+            funnel.append((describe(node), int(mask.sum())))
+        return funnel
+
+
+def _field(node):
+    if node.id not in FIELDS:
+        raise CriteriaError(f"未知字段: {node.id}（可用: {', '.join(sorted(FIELDS))}）")
+    return FIELDS[node.id]
+
+
+def _constant(node):
+    """常数折叠：只允许数字和数字之间的算术，结果必须是有限的实数"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+            and not isinstance(node.value, bool):
+        value = node.value
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _constant(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    elif isinstance(node, ast.BinOp) and type(node.op) in ARITH_OPS:
+        left, right = _constant(node.left), _constant(node.right)
+        try:
+            value = ARITH_OPS[type(node.op)](left, right)
+        except (ArithmeticError, ValueError) as e:
+            raise CriteriaError(f"常数无法计算: {ast.unparse(node)}（{e}）") from None
+    else:
+        raise CriteriaError(f"不支持的常数: {ast.unparse(node)}")
+    try:
+        value = float(value)  # 负数的小数次幂得到复数，超大整数无法转为浮点数
+    except (OverflowError, TypeError):
+        value = np.nan
+    if not np.isfinite(value):
+        raise CriteriaError(f"常数不是有限的实数: {ast.unparse(node)}")
+    return value
+
+
+def _combine(kind, children):
+    """合并同类子节点并排序，使等价表达式得到相同的节点"""
+    flat = []
+    for child in children:
+        if child[0] == kind:
+            flat.extend(child[1:])
+        else:
+            flat.append(child)
+    flat = sorted(set(flat), key=repr)
+    if len(flat) == 1:
+        return flat[0]
+    return (kind, *flat)
+
+
+def _columns(node):
+    if node[0] == 'cmp':
+        return {node[1]}
+    return set().union(*(_columns(child) for child in node[1:]))
+
+
+def _pb_bound(node):
+    kind = node[0]
+    if kind == 'cmp':
+        _, column, op, value = node
+        return value if column == 'pb_ratio' and op in ('<', '<=') else None
+    if kind == 'and':
+        bounds = [b for b in (_pb_bound(child) for child in node[1:]) if b is not None]
+        return min(bounds) if bounds else None
+    if kind == 'or':
+        bounds = [_pb_bound(child) for child in node[1:]]
+        return None if None in bounds else max(bounds)
+    return None
+
+
+def describe(node):
+    """把节点还原为表达式文本（列名为行情列名）"""
+    kind = node[0]
+    if kind == 'cmp':
+        _, column, op, value = node
+        return f"{column} {op} {value:g}"
+    if kind == 'not':
+        return f"not ({describe(node[1])})"
+    return f" {kind} ".join(f"({describe(child)})" if child[0] in ('and', 'or') else describe(child)
+                            for child in node[1:])
+
+
+def evaluate(node, frame, cache):
+    """递归求值节点，结果按节点缓存在 cache 中"""
+    if node in cache:
+        return cache[node]
+
+    kind = node[0]
+    if kind == 'cmp':
+        _, column, op, value = node
+        key = ('column', column)
+        if key not in cache:
+            cache[key] = np.asarray(frame[column], dtype=float)
+        # NaN 参与的比较均为 False
+        result = OP_FUNCS[op](cache[key], value)
+    elif kind == 'and':
+        result = np.logical_and.reduce([evaluate(child, frame, cache) for child in node[1:]])
+    elif kind == 'or':
+        result = np.logical_or.reduce([evaluate(child, frame, cache) for child in node[1:]])
+    else:
+        result = ~evaluate(node[1], frame, cache)
+
+    cache[node] = result
+    return result
+
+
+def evaluate_strategies(frame, strategies):
+    """在同一份行情上一次性求值多个策略，返回 {策略名: 布尔数组}
+
+    所有策略共享同一个缓存，相同的比较和子表达式只计算一次。
+    """
+    cache = {}
+    return {name: criteria.mask(frame, cache) for name, criteria in strategies.items()}
+
+
+def combined_pb_bound(strategies):
+    """多个策略一起抓取时所需的 PB 上限（取最大值），任一策略无上限则返回 None"""
+    bounds = [criteria.pb_upper_bound() for criteria in strategies.values()]
+    return None if not bounds or None in bounds else max(bounds)
+
+
+def load_strategies(path):
+    """从文本文件读取命名策略，每行 "名称: 表达式"，# 开头为注释"""
+    strategies = {}
+    with open(path, encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            name, sep, text = line.partition(':')
+            if not sep or not name.strip():
+                raise CriteriaError(f"{path} 第 {lineno} 行格式应为 \"名称: 表达式\"")
+            strategies[name.strip()] = Criteria(text)
+    return strategies
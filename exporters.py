@@ -0,0 +1,281 @@
+import glob
+import os
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+RESULT_LOG_DIR = 'results'  # 只追加的筛选结果日志，每次运行在当天的分区目录下新增一个文件
+CHUNK_ROWS = 50000          # 流式写出时每块的行数
+FORMATS = ('.csv', '.xlsx', '.parquet', '.feather')
+CSV_ENCODING = 'utf-8'         # 结果文件、结果日志等供脚本读取的 CSV 不带 BOM（与以前的输出一致）
+EXPORT_ENCODING = 'utf-8-sig'  # 用户导出的 CSV 带 BOM，Excel 直接打开不乱码
+PARTITION_FORMAT = 'date=%Y%m%d'
+FILE_TIME_FORMAT = '%H%M%S'
+
+
+def has_pyarrow():
+    """Parquet / Feather 需要 pyarrow，未安装时结果日志改用 CSV"""
+    try:
+        import pyarrow  # noqa: F401  只检查是否可用
+    except ImportError:
+        return False
+    return True
+
+
+def check_format(path):
+    """导出前检查扩展名和所需的依赖，不支持时抛出 ValueError"""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {suffix or path}（可用: {', '.join(FORMATS)}）")
+    if suffix in ('.parquet', '.feather') and not has_pyarrow():
+        raise ValueError(f"导出 {suffix} 需要安装 pyarrow（pip install pyarrow），也可以改用 .csv / .xlsx")
+
+
+def _tmp_path(path):
+    return path + '.tmp'
+
+
+class CsvStreamWriter:
+    """分块追加写出 CSV：第一块写表头，之后只写数据；写到临时文件，close 时改名
+
+    用法同文件对象（with 语句），write(frame) 可以反复调用，适合逐页或逐块导出大表。
+    """
+
+    def __init__(self, path, encoding=CSV_ENCODING):
+        self.path = path
+        self.rows = 0
+        self._file = open(_tmp_path(path), 'w', encoding=encoding, newline='')
+        self._header = True
+
+    def write(self, frame):
+        frame.to_csv(self._file, index=False, header=self._header, lineterminator='\n')
+        self._header = False
+        self.rows += len(frame)
+
+    def close(self):
+        self._file.close()
+        os.replace(_tmp_path(self.path), self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(_tmp_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>')
+_XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>')
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/></Relationships>')
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def _xlsx_workbook(sheet_name):
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name, {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/>'
+            '</sheets></workbook>')
+
+
+def _xlsx_cells(values):
+    """把一列转为单元格 XML 片段数组：数值列写数值，其他写内联字符串，缺失值为空单元格"""
+    if pd.api.types.is_bool_dtype(values):
+        values = values.astype(int)
+    if pd.api.types.is_numeric_dtype(values):
+        numbers = values.to_numpy(dtype=np.float64)
+        cells = np.array(['<c><v>' + repr(float(number)) + '</v></c>' for number in numbers], dtype=object)
+        cells[~np.isfinite(numbers)] = '<c/>'
+        return cells
+    text = values.astype(object).where(values.notna(), None)
+    return np.array(['<c/>' if value is None else
+                     '<c t="inlineStr"><is><t xml:space="preserve">' + escape(str(value)) + '</t></is></c>'
+                     for value in text], dtype=object)
+
+
+class XlsxStreamWriter:
+    """流式写出单个工作表的 XLSX（只用标准库 zipfile，不需要 openpyxl）
+
+    每次 write(frame) 直接把行写入压缩包中的工作表 XML，内存占用与总行数无关；
+    接口同 CsvStreamWriter。
+    """
+
+    def __init__(self, path, sheet_name='Sheet1'):
+        self.path = path
+        self.rows = 0
+        self._zip = zipfile.ZipFile(_tmp_path(path), 'w', compression=zipfile.ZIP_DEFLATED)
+        self._zip.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        self._zip.writestr('_rels/.rels', _XLSX_RELS)
+        self._zip.writestr('xl/workbook.xml', _xlsx_workbook(sheet_name))
+        self._zip.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        self._sheet = self._zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self._sheet.write(_XLSX_SHEET_HEAD.encode('utf-8'))
+        self._header = True
+
+    def _write_rows(self, columns):
+        rows = ['<row>' + ''.join(cells) + '</row>' for cells in zip(*columns)]
+        self._sheet.write(''.join(rows).encode('utf-8'))
+
+    def write(self, frame):
+        if self._header:
+            self._write_rows([_xlsx_cells(pd.Series([str(column)])) for column in frame.columns])
+            self._header = False
+        if len(frame):
+            self._write_rows([_xlsx_cells(frame[column]) for column in frame.columns])
+        self.rows += len(frame)
+
+    def close(self):
+        self._sheet.write(_XLSX_SHEET_TAIL.encode('utf-8'))
+        self._sheet.close()
+        self._zip.close()
+        os.replace(_tmp_path(self.path), self.path)
+
+    def abort(self):
+        self._sheet.close()
+        self._zip.close()
+        os.remove(_tmp_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def open_writer(path, **kwargs):
+    """按扩展名打开流式写出器（.csv 或 .xlsx）"""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.csv':
+        return CsvStreamWriter(path, **kwargs)
+    if suffix == '.xlsx':
+        return XlsxStreamWriter(path, **kwargs)
+    raise ValueError(f"不支持流式写出的格式: {suffix}（可用: .csv, .xlsx）")
+
+
+def _columnar(df):
+    """列式格式要求列名为字符串、索引为默认索引"""
+    return df.reset_index(drop=True).rename(columns=str)
+
+
+def write_parquet(df, path):
+    check_format(path)
+    tmp_path = _tmp_path(path)
+    _columnar(df).to_parquet(tmp_path, index=False, engine='pyarrow')
+    os.replace(tmp_path, path)
+
+
+def write_feather(df, path):
+    check_format(path)
+    tmp_path = _tmp_path(path)
+    _columnar(df).to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def export(df, path, chunk_rows=CHUNK_ROWS, encoding=CSV_ENCODING):
+    """按扩展名导出表格（.csv / .xlsx 分块流式写出，.parquet / .feather 需要 pyarrow），返回写出的行数
+
+    encoding 只用于 CSV：默认不带 BOM，用户在界面或 --export 导出时传入 EXPORT_ENCODING。
+    """
+    check_format(path)
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.parquet':
+        write_parquet(df, path)
+    elif suffix == '.feather':
+        write_feather(df, path)
+    else:
+        with open_writer(path, **({'encoding': encoding} if suffix == '.csv' else {})) as writer:
+            for start in range(0, max(len(df), 1), chunk_rows):
+                writer.write(df.iloc[start:start + chunk_rows])
+    return len(df)
+
+
+def read_table(path):
+    """读取 export 写出的 .csv / .parquet / .feather 文件"""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.parquet':
+        return pd.read_parquet(path)
+    if suffix == '.feather':
+        return pd.read_feather(path)
+    if suffix == '.csv':
+        # utf-8-sig 同时兼容带 BOM 和不带 BOM 的文件
+        return pd.read_csv(path, encoding='utf-8-sig', dtype={'code': str, '代码': str})
+    raise ValueError(f"不支持读取的格式: {suffix or path}")
+
+
+class ResultLog:
+    """只追加的筛选结果日志：root/date=YYYYMMDD/HHMMSS_<kind>.<格式>，每次运行新增一个文件
+
+    已写出的分区文件不会被改写；每行带 run_at（运行时间）列，读取时按日期范围拼接。
+    安装了 pyarrow 时写 Parquet，否则写 CSV。
+    """
+
+    def __init__(self, root=RESULT_LOG_DIR, suffix=None):
+        self.root = root
+        self.suffix = suffix or ('.parquet' if has_pyarrow() else '.csv')
+
+    def append(self, df, kind='candidates', run_at=None):
+        """追加一次运行的结果，返回写出的分区文件路径"""
+        run_at = run_at or datetime.now()
+        directory = os.path.join(self.root, run_at.strftime(PARTITION_FORMAT))
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{run_at.strftime(FILE_TIME_FORMAT)}_{kind}")
+        path, n = stem + self.suffix, 1
+        while os.path.exists(path):  # 同一秒内多次运行时加序号，不覆盖已有分区
+            n += 1
+            path = f"{stem}_{n}{self.suffix}"
+        export(df.assign(run_at=run_at.isoformat(timespec='seconds')), path)
+        return path
+
+    def partitions(self, kind='candidates', start=None, end=None):
+        """按时间顺序列出分区文件，start / end 为 YYYYMMDD（含）"""
+        pattern = re.compile(rf'\d{{6}}_{re.escape(kind)}(_\d+)?')
+        paths = []
+        for directory in sorted(glob.glob(os.path.join(self.root, 'date=*'))):
+            day = os.path.basename(directory)[len('date='):]
+            if (start and day < start) or (end and day > end):
+                continue
+            for name in sorted(os.listdir(directory)):
+                stem, suffix = os.path.splitext(name)
+                if suffix in FORMATS and pattern.fullmatch(stem):
+                    paths.append(os.path.join(directory, name))
+        return paths
+
+    def read(self, kind='candidates', start=None, end=None):
+        """读取并拼接日期范围内的全部分区，没有分区时返回空表"""
+        frames = [read_table(path) for path in self.partitions(kind, start, end)]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
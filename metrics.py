@@ -0,0 +1,198 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+REPORT_FILE = 'run_report.json'  # 默认 JSON 运行报告
+PROM_PREFIX = 'cigar_butt'       # Prometheus 指标名前缀
+
+# 阶段名 -> 打印时的中文名（未列出的按原名显示）
+STAGE_LABELS = {
+    'fetch': '抓取', 'parse': '解析', 'snapshot': '读快照', 'save': '存快照', 'stock_list': '股票列表',
+    'merge': '合并', 'filter': '过滤', 'history': '历史估值', 'screen': '筛选', 'render': '渲染', 'export': '导出',
+}
+
+
+class RunMetrics:
+    """一次筛选运行的分阶段指标：各阶段耗时、计数器、每页请求延迟和各筛选步骤后的行数
+
+    阶段可以嵌套（例如 fetch 包含 parse），同名阶段多次进入时耗时累加。
+    计数器和延迟可能由抓取线程写入，均加锁。
+    """
+
+    def __init__(self, name='screen'):
+        self.name = name
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.stages = {}     # 阶段名 -> [累计秒数, 次数]
+        self.counters = {}   # 计数器名 -> 数值
+        self.latencies = []  # 每次请求的延迟（秒）
+        self.steps = []      # [(筛选步骤, 剩余行数)]，按发生顺序
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])  # 按首次进入的顺序排列
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry[0] += elapsed
+                entry[1] += 1
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def rows(self, step, count):
+        with self._lock:
+            self.steps.append((step, int(count)))
+
+    def observe_fetch(self, stats):
+        """并入一次抓取的网络统计（sina_fetch.FetchStats）"""
+        with self._lock:
+            for name in ('requests', 'errors', 'retries', 'bytes'):
+                key = 'fetch_' + name
+                self.counters[key] = self.counters.get(key, 0) + getattr(stats, name, 0)
+            self.latencies.extend(stats.latencies)
+
+    def finish(self):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self.started
+        return self
+
+    def latency_summary(self):
+        """每页请求延迟的分位数（毫秒），没有请求时为 None"""
+        if not self.latencies:
+            return None
+        values = np.asarray(self.latencies) * 1000
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {'count': len(values), 'p50': round(p50, 2), 'p90': round(p90, 2),
+                'p99': round(p99, 2), 'max': round(values.max(), 2)}
+
+    def report(self):
+        """整理为可写入 JSON 的字典"""
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        with self._lock:
+            return {
+                'run': self.name,
+                'started': self.started_at.isoformat(timespec='seconds'),
+                'seconds': round(seconds, 4),
+                'stages': {name: {'seconds': round(total, 4), 'calls': calls}
+                           for name, (total, calls) in self.stages.items()},
+                'counters': dict(self.counters),
+                'rows': [{'step': step, 'rows': count} for step, count in self.steps],
+                'page_latency_ms': self.latency_summary(),
+            }
+
+    def format_stages(self):
+        """各阶段耗时的单行摘要"""
+        parts = [f"{STAGE_LABELS.get(name, name)} {total:.2f}s" for name, (total, _) in self.stages.items()]
+        return "📏 各阶段耗时: " + (" · ".join(parts) or "无")
+
+    def write_json(self, path=REPORT_FILE):
+        _write_atomic(path, json.dumps(self.report(), ensure_ascii=False, indent=2) + '\n')
+
+    def write_prometheus(self, path):
+        """写出 node_exporter textfile collector 格式的指标文件（先写临时文件再改名）"""
+        report = self.report()
+        run = {'run': self.name}
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            full = f"{PROM_PREFIX}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{full}{suffix}{_labels(labels)} {_number(value)}")
+
+        metric('run_seconds', 'gauge', '最近一次运行的总耗时（秒）', [('', run, report['seconds'])])
+        metric('run_timestamp_seconds', 'gauge', '最近一次运行的开始时间（Unix 时间戳）',
+               [('', run, self.started_at.timestamp())])
+        metric('stage_seconds', 'gauge', '最近一次运行各阶段的耗时（秒）',
+               [('', {**run, 'stage': name}, stage['seconds']) for name, stage in report['stages'].items()])
+        for name, value in report['counters'].items():
+            metric(name, 'gauge', f'最近一次运行的 {name} 计数', [('', run, value)])
+        metric('filter_rows', 'gauge', '最近一次运行各筛选步骤后剩余的行数',
+               [('', {**run, 'step': step, 'order': str(order)}, count)
+                for order, (step, count) in enumerate(self.steps, 1)])
+        if self.latencies:
+            latencies = np.asarray(self.latencies)
+            quantiles = np.percentile(latencies, [50, 90, 99])
+            metric('page_latency_seconds', 'summary', '最近一次运行每页请求的延迟（秒）',
+                   [('', {**run, 'quantile': q}, value) for q, value in zip(('0.5', '0.9', '0.99'), quantiles)]
+                   + [('_sum', run, latencies.sum()), ('_count', run, len(latencies))])
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, (float, np.floating)) else str(value)
+
+
+def _write_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# 进程内当前运行的指标；没有进行中的运行时，各记录函数什么也不做
+_current = None
+last_run = None
+
+
+def start_run(name='screen'):
+    """开始记录一次运行，之后各模块的 stage / count / rows 都记入它"""
+    global _current
+    _current = RunMetrics(name)
+    return _current
+
+
+def finish_run():
+    """结束当前运行并返回它（同时保存为 last_run），没有进行中的运行时返回 None"""
+    global _current, last_run
+    run, _current = _current, None
+    if run is not None:
+        last_run = run.finish()
+    return run
+
+
+def current():
+    return _current
+
+
+def stage(name):
+    run = _current
+    return run.stage(name) if run is not None else contextlib.nullcontext()
+
+
+def count(name, value=1):
+    run = _current
+    if run is not None:
+        run.count(name, value)
+
+
+def rows(step, value):
+    run = _current
+    if run is not None:
+        run.rows(step, value)
+
+
+def observe_fetch(stats):
+    run = _current
+    if run is not None:
+        run.observe_fetch(stats)
@@ -0,0 +1,178 @@
+import json
+import math
+import os
+import time
+from datetime import datetime, time as dtime, timedelta, timezone
+
+import pandas as pd
+
+CHINA_TZ = timezone(timedelta(hours=8))  # 沪深交易所时间（无夏令时）
+SESSIONS = ((dtime(9, 30), dtime(11, 30)), (dtime(13, 0), dtime(15, 0)))  # 连续竞价时段
+CALENDAR_FILE = 'trading_calendar.csv'   # 本地交易日历，trade_date 列为交易日
+EVENT_LOG = 'monitor_events.jsonl'       # 候选股变化事件日志，每行一个 JSON
+
+BASE_INTERVAL = 60      # 有变化时的轮询间隔（秒）
+MAX_INTERVAL = 600      # 无变化时逐步放慢到的最长间隔（秒）
+BACKOFF_FACTOR = 2      # 每次无变化时间隔的放大倍数
+ALERT_PB_LEVELS = (0.5, 0.8, 1.0)  # 候选股 PB 穿越这些水平时记录事件
+
+# 事件中记录的候选股字段 -> 结果表列名
+EVENT_FIELDS = {'name': '股票名', 'price': '股价', 'pb': 'PB', 'pe': 'PE', 'mcap': '市值(亿)'}
+CANDIDATE_COLUMNS = ['代码'] + list(EVENT_FIELDS.values())  # 比较前后两次候选股所需的列
+
+
+class TradingCalendar:
+    """沪深交易日历与交易时段判断
+
+    交易日来自本地日历表；没有日历表，或日期超出日历覆盖范围时，按周一至周五近似。
+    """
+
+    def __init__(self, days=None):
+        self.days = None if days is None else set(days)
+        self.last_day = max(self.days) if self.days else None
+
+    @classmethod
+    def load(cls, path=CALENDAR_FILE, log=print):
+        """读取本地交易日历，文件不存在时退回按工作日判断"""
+        if not os.path.exists(path):
+            log(f"⚠️ 未找到交易日历 {path}，按周一至周五判断交易日（可用 --update-calendar 生成）")
+            return cls()
+        df = pd.read_csv(path, dtype=str)
+        return cls(pd.to_datetime(df['trade_date']).dt.date)
+
+    def is_trading_day(self, day):
+        if self.days is None or day > self.last_day:
+            return day.weekday() < 5
+        return day in self.days
+
+    def in_session(self, now):
+        """now 是否处于交易时段内"""
+        now = now.astimezone(CHINA_TZ)
+        if not self.is_trading_day(now.date()):
+            return False
+        return any(start <= now.time() < end for start, end in SESSIONS)
+
+    def next_open(self, now):
+        """now 之后最近的一个交易时段开始时间"""
+        now = now.astimezone(CHINA_TZ)
+        for offset in range(370):
+            day = now.date() + timedelta(days=offset)
+            if not self.is_trading_day(day):
+                continue
+            for start, _ in SESSIONS:
+                opening = datetime.combine(day, start, tzinfo=CHINA_TZ)
+                if opening > now:
+                    return opening
+        raise ValueError("交易日历中一年内没有交易日")
+
+
+def update_calendar(path=CALENDAR_FILE, log=print):
+    """用 akshare 下载新浪历史交易日历并保存到本地"""
+    import akshare as ak
+    df = ak.tool_trade_date_hist_sina()
+    df['trade_date'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
+    df[['trade_date']].to_csv(path, index=False)
+    log(f"✅ 交易日历已保存到 {path}（{df['trade_date'].iloc[0]} ~ {df['trade_date'].iloc[-1]}）")
+
+
+def _record(row, suffix=''):
+    """把一行候选股整理为事件字段，NaN 记为 null"""
+    record = {'code': row['代码']}
+    for field, column in EVENT_FIELDS.items():
+        value = row[column + suffix]
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        record[field] = value
+    return record
+
+
+def diff_candidates(previous, current, levels=ALERT_PB_LEVELS):
+    """按代码外连接比较前后两次候选股，返回事件列表
+
+    enter：新入选；exit：不再入选（字段为上一次的值）；
+    cross：两次都入选、PB 穿越 levels 中某个水平（direction 为 down / up）。
+    """
+    joined = pd.merge(previous[CANDIDATE_COLUMNS], current[CANDIDATE_COLUMNS], on='代码', how='outer',
+                      suffixes=('_prev', ''), indicator=True)
+
+    events = []
+    for _, row in joined[joined['_merge'] == 'right_only'].iterrows():
+        events.append({'event': 'enter', **_record(row)})
+    for _, row in joined[joined['_merge'] == 'left_only'].iterrows():
+        events.append({'event': 'exit', **_record(row, '_prev')})
+
+    both = joined[joined['_merge'] == 'both']
+    before, after = both['PB_prev'].to_numpy(dtype=float), both['PB'].to_numpy(dtype=float)
+    for level in levels:
+        for direction, crossed in (('down', (before > level) & (after <= level)),
+                                   ('up', (before <= level) & (after > level))):
+            for _, row in both[crossed].iterrows():
+                events.append({'event': 'cross', 'level': level, 'direction': direction,
+                               'pb_prev': float(row['PB_prev']), **_record(row)})
+    return events
+
+
+def write_events(events, path=EVENT_LOG, now=None):
+    """把事件追加到 JSONL 日志，每个事件一行并带时间戳"""
+    if not events:
+        return
+    ts = (now or datetime.now(CHINA_TZ)).isoformat(timespec='seconds')
+    with open(path, 'a', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps({'ts': ts, **event}, ensure_ascii=False, default=float) + '\n')
+
+
+def next_interval(interval, changed, base=BASE_INTERVAL, maximum=MAX_INTERVAL):
+    """有变化时回到基础间隔，无变化时按倍数放慢，直到最长间隔"""
+    return base if changed else min(interval * BACKOFF_FACTOR, maximum)
+
+
+def run_monitor(screen, calendar=None, base_interval=BASE_INTERVAL, max_interval=MAX_INTERVAL,
+                event_log=EVENT_LOG, levels=ALERT_PB_LEVELS, log=print, sleep=time.sleep,
+                now=lambda: datetime.now(CHINA_TZ), max_polls=None):
+    """交易时段内定时筛选并记录候选股变化，休市时休眠到下一个交易时段
+
+    screen() 返回本次候选股（format_candidates 格式的 DataFrame）；抓取失败时返回的
+    不带候选股列的空表按筛选失败处理，放慢轮询并保留上一次结果，不记为全部退出。
+    上一次结果跨越午休和隔夜保留，开盘后的第一次筛选与上一个收盘前的结果比较。
+    """
+    calendar = calendar or TradingCalendar.load(log=log)
+    previous = None
+    interval = base_interval
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        current_time = now()
+        if not calendar.in_session(current_time):
+            opening = calendar.next_open(current_time)
+            log(f"💤 非交易时段，休眠到 {opening:%Y-%m-%d %H:%M}")
+            sleep((opening - current_time).total_seconds())
+            interval = base_interval
+            continue
+
+        polls += 1
+        try:
+            current = screen()
+            if not set(CANDIDATE_COLUMNS) <= set(current.columns):
+                raise ValueError("未获取到行情数据，保留上一次的候选股")
+        except Exception as e:
+            log(f"❌ 筛选失败: {e}")
+            interval = next_interval(interval, False, base_interval, max_interval)
+            sleep(interval)
+            continue
+
+        if previous is None:
+            events = [{'event': 'start', 'count': len(current)}]
+            changed = False
+        else:
+            events = diff_candidates(previous, current, levels)
+            changed = bool(events)
+        write_events(events, event_log, current_time)
+        previous = current
+
+        counts = {}
+        for event in events:
+            counts[event['event']] = counts.get(event['event'], 0) + 1
+        summary = '，'.join(f"{kind} {count}" for kind, count in counts.items()) or '无变化'
+        interval = next_interval(interval, changed, base_interval, max_interval)
+        log(f"👀 {current_time:%H:%M:%S} 候选股 {len(current)} 只，{summary}；{interval:.0f} 秒后再次筛选")
+        sleep(interval)
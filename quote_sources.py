@@ -0,0 +1,454 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import sina_fetch
+
+QUOTE_COLUMNS = ['code', 'name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap']
+
+EASTMONEY_API = "https://push2.eastmoney.com/api/qt/clist/get"
+EASTMONEY_PAGE_SIZE = 100                              # 请求的每页股票数（服务器可能截断）
+# 新浪板块节点 -> 东方财富市场过滤条件（m:0 深市、m:1 沪市；t:6 深主板、t:80 创业板、t:2 沪主板、
+# t:23 科创板、t:7 深 B、t:3 沪 B、t:81 s:2048 北交所）
+EASTMONEY_NODE_MARKETS = {
+    'hs_a': "m:0 t:6,m:0 t:80,m:1 t:2,m:1 t:23", 'sh_a': "m:1 t:2,m:1 t:23", 'sz_a': "m:0 t:6,m:0 t:80",
+    'kcb': "m:1 t:23", 'cyb': "m:0 t:80", 'hs_b': "m:0 t:7,m:1 t:3", 'sh_b': "m:1 t:3", 'sz_b': "m:0 t:7",
+    'hs_bjs': "m:0 t:81 s:2048",
+}
+# 东方财富字段 -> 行情列：f12 代码、f14 名称、f2 最新价、f23 市净率、f9 动态市盈率、f20 总市值（元）
+EASTMONEY_FIELDS = {'f12': 'code', 'f14': 'name', 'f2': 'price', 'f23': 'pb_ratio', 'f9': 'pe_ratio',
+                    'f20': 'market_cap'}
+
+PROVIDER_STATS_FILE = 'provider_stats.json'  # 各行情源的健康状况和耗时，跨次运行保留
+MAX_SAMPLES = 50             # 每个行情源每种抓取方式保留的最近耗时样本数
+MIN_SAMPLES = 5              # 样本不足时使用默认对冲等待时间
+HEDGE_PERCENTILE = 95        # 首选源超过该分位数耗时仍未返回时发送对冲请求
+DEFAULT_HEDGE_DELAY = 8.0    # 样本不足时的对冲等待时间（秒）
+MIN_HEDGE_DELAY = 1.0        # 对冲等待时间下限（秒），避免每次运行都重复请求
+UNHEALTHY_FAILURES = 3       # 连续失败该次数后视为不健康，排到其他源之后
+UNHEALTHY_COOLDOWN = 600     # 不健康的源在最后一次失败该秒数后恢复原有顺序
+
+
+def normalize(df):
+    """整理为统一的行情列并按代码标注板块，剔除价格或 PB 无效（含停牌、缺失）的行"""
+    df = df[QUOTE_COLUMNS].copy()
+    df['code'] = df['code'].astype(str).str.zfill(6)
+    for column in QUOTE_COLUMNS[2:]:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    df = df[(df['pb_ratio'] > 0) & (df['price'] > 0)].reset_index(drop=True)
+    df['board'] = sina_fetch.board_of(df['code'])
+    return df
+
+
+def eastmoney_markets(nodes):
+    """把板块节点合并为东方财富的 fs 过滤条件（重复的市场只保留一次）"""
+    parts = []
+    for node in nodes:
+        for part in EASTMONEY_NODE_MARKETS[node].split(','):
+            if part not in parts:
+                parts.append(part)
+    return ','.join(parts)
+
+
+class QuoteSource:
+    """行情源接口：fetch 返回 QUOTE_COLUMNS 列的 DataFrame，失败时抛出异常
+
+    nodes 为要覆盖的板块节点（sina_fetch.MARKET_NODES 的键）；pb_limit 不为 None 时只需覆盖
+    PB ≤ pb_limit 的股票；progress(已完成, 计划)、on_page(frame) 和 cancel 的含义同
+    sina_fetch.get_realtime_quotes，不支持分页的源可以不调用或只调用一次。
+    checkpoint_dir 为分页抓取的断点目录（None 时不保存断点），不支持断点的源忽略。
+    """
+
+    name = ''
+
+    def __init__(self, max_workers=sina_fetch.MAX_WORKERS, nodes=sina_fetch.DEFAULT_NODES,
+                 checkpoint_dir=sina_fetch.CHECKPOINT_DIR):
+        self.max_workers = max_workers
+        self.nodes = tuple(nodes)
+        self.checkpoint_dir = checkpoint_dir
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        raise NotImplementedError
+
+
+class SinaSource(QuoteSource):
+    """新浪财经 Market_Center.getHQNodeData（并发分页，支持按 PB 提前停止）"""
+
+    name = 'sina'
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        df = sina_fetch.get_realtime_quotes(max_workers=self.max_workers, pb_limit=pb_limit, log=log,
+                                            progress=progress, on_page=on_page, cancel=cancel,
+                                            checkpoint_dir=self.checkpoint_dir, nodes=self.nodes)
+        if df.empty:
+            raise RuntimeError("新浪财经没有返回有效行情")
+        return df
+
+
+class EastmoneySource(QuoteSource):
+    """东方财富行情列表（push2 clist 接口，akshare.stock_zh_a_spot_em 使用的同一数据），一个请求覆盖全部节点"""
+
+    name = 'eastmoney'
+
+    def _page(self, session, page, stats, cancel=None):
+        params = {'pn': page, 'pz': EASTMONEY_PAGE_SIZE, 'po': 0, 'np': 1, 'fltt': 2, 'invt': 2,
+                  'fid': 'f12', 'fs': eastmoney_markets(self.nodes), 'fields': ','.join(EASTMONEY_FIELDS)}
+        url = f"{EASTMONEY_API}?{urlencode(params)}"
+        data = sina_fetch.with_retries(lambda: session.get_json(url, stats=stats, cancel=cancel),
+                                       stats=stats, cancel=cancel)
+        data = (data or {}).get('data') or {}
+        return data.get('total', 0), data.get('diff') or []
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        session = get_session(self.name)
+        stats = sina_fetch.FetchStats()
+        with metrics.stage('fetch'):
+            total, first = self._page(session, 1, stats, cancel)
+            if not first:
+                raise RuntimeError("东方财富没有返回行情")
+            page_count = -(-total // len(first))
+            pages = [first] + [None] * (page_count - 1)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._page, session, page, stats, cancel): page
+                           for page in range(2, page_count + 1)}
+                for done, future in enumerate(as_completed(futures), 2):
+                    pages[futures[future] - 1] = future.result()[1]
+                    if progress is not None:
+                        progress(done, page_count)
+        stats.finish()
+        metrics.observe_fetch(stats)
+        metrics.count('fetch_pages', page_count)
+        log(f"🌐 东方财富网络开销: {stats.summary()}")
+
+        with metrics.stage('parse'):
+            records = [record for page in pages for record in page]
+            df = normalize(pd.DataFrame.from_records(records).rename(columns=EASTMONEY_FIELDS))
+        return _finish(df, pb_limit, on_page)
+
+
+class AkshareSpotSource(QuoteSource):
+    """akshare 的东方财富实时行情（stock_zh_a_spot_em），需要安装 akshare；总是返回全部 A 股，不区分节点"""
+
+    name = 'akshare'
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        import akshare as ak  # 只在使用该行情源时才导入
+        with metrics.stage('fetch'):
+            spot = ak.stock_zh_a_spot_em()
+        df = normalize(pd.DataFrame({
+            'code': spot['代码'], 'name': spot['名称'], 'price': spot['最新价'],
+            'pb_ratio': spot['市净率'], 'pe_ratio': spot['市盈率-动态'], 'market_cap': spot['总市值'],
+        }))
+        return _finish(df, pb_limit, on_page)
+
+
+class ServerSource(QuoteSource):
+    """本地筛选服务（screen_server.py）的 /market 接口：由服务统一抓取新浪行情，多个客户端共享同一份快照
+
+    请求带上次的 ETag（If-None-Match），快照没有变化时服务返回 304，直接复用上次解析的结果。
+    """
+
+    name = 'server'
+
+    def __init__(self, url, max_workers=sina_fetch.MAX_WORKERS, nodes=sina_fetch.DEFAULT_NODES):
+        super().__init__(max_workers=max_workers, nodes=nodes)
+        self.url = url.rstrip('/')
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        url = f"{self.url}/market" + ('' if pb_limit is None else f"?{urlencode({'pb_max': pb_limit})}")
+        etag, cached = _server_cache.get(url, (None, None))
+        headers = {'If-None-Match': etag} if etag and cached is not None else {}
+        with metrics.stage('fetch'):
+            response = get_session(self.name).session.get(url, headers=headers, timeout=sina_fetch.REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            log(f"♻️ 筛选服务的行情快照（{response.headers.get('X-Snapshot-Time')}）没有变化，复用上次结果")
+            df = cached
+        else:
+            response.raise_for_status()
+            with metrics.stage('parse'):
+                data = response.json()
+                df = normalize(pd.DataFrame(data['data'], columns=data['columns']))
+            _server_cache[url] = (response.headers.get('ETag'), df)
+            log(f"🛰️ 从筛选服务获取 {len(df)} 只股票（快照 {response.headers.get('X-Snapshot-Time')}，"
+                f"{len(response.content) / 1024:.0f} KB）")
+        metrics.count('fetch_requests')
+        if progress is not None:
+            progress(1, 1)
+        return _finish(df.copy(), pb_limit, on_page)
+
+
+_server_cache = {}  # 筛选服务 URL -> (ETag, 上次的行情)
+
+
+def _finish(df, pb_limit, on_page):
+    """一次性返回全市场的行情源：按 pb_limit 截取并整体回调一次 on_page"""
+    if pb_limit is not None:
+        df = df[df['pb_ratio'] <= pb_limit].reset_index(drop=True)
+    if df.empty:
+        raise RuntimeError("没有有效行情")
+    if on_page is not None:
+        on_page(df)
+    return df
+
+
+SOURCES = {source.name: source for source in (SinaSource, EastmoneySource, AkshareSpotSource)}
+DEFAULT_SOURCES = ('sina', 'eastmoney')
+
+
+def create_sources(names=DEFAULT_SOURCES, max_workers=sina_fetch.MAX_WORKERS, nodes=sina_fetch.DEFAULT_NODES,
+                   checkpoint_dir=sina_fetch.CHECKPOINT_DIR):
+    """按名称创建行情源，未知的行情源或板块节点抛出 ValueError"""
+    for name in names:
+        if name not in SOURCES:
+            raise ValueError(f"未知的行情源: {name}（可用: {', '.join(SOURCES)}）")
+    for node in nodes:
+        if node not in sina_fetch.MARKET_NODES:
+            raise ValueError(f"未知的板块节点: {node}（可用: {', '.join(sina_fetch.MARKET_NODES)}）")
+    return [SOURCES[name](max_workers=max_workers, nodes=nodes, checkpoint_dir=checkpoint_dir) for name in names]
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(name):
+    """非新浪行情源共享的 FetchSession（各源独立限速）"""
+    with _sessions_lock:
+        if name not in _sessions:
+            session = sina_fetch.FetchSession()
+            session.session.headers['Referer'] = 'https://quote.eastmoney.com/'
+            _sessions[name] = session
+        return _sessions[name]
+
+
+class ProviderStats:
+    """各行情源的成功 / 失败次数、连续失败和最近耗时样本，保存在 JSON 文件中跨次运行保留
+
+    耗时按抓取方式（全市场 full / 按 PB 截取 pb）分别统计，用于计算对冲等待时间。
+    """
+
+    def __init__(self, path=PROVIDER_STATS_FILE):
+        self.path = path
+        self.providers = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    providers = json.load(f)
+                if not isinstance(providers, dict):
+                    raise ValueError("内容不是 JSON 对象")
+                self.providers = providers
+            except (OSError, ValueError) as e:
+                # 文件损坏（如写入时被中断）不影响抓取，重新开始统计
+                print(f"⚠️ 行情源统计文件 {path} 无法读取（{e}），重新开始统计")
+
+    def _entry(self, name):
+        return self.providers.setdefault(name, {'ok': 0, 'failed': 0, 'consecutive_failures': 0,
+                                                'last_error': None, 'last_failure': None, 'seconds': {}})
+
+    def record(self, name, mode, seconds=None, error=None):
+        """记录一次抓取结果并写回文件"""
+        with self._lock:
+            entry = self._entry(name)
+            if error is None:
+                entry['ok'] += 1
+                entry['consecutive_failures'] = 0
+                samples = entry['seconds'].setdefault(mode, [])
+                samples.append(round(seconds, 3))
+                del samples[:-MAX_SAMPLES]
+            else:
+                entry['failed'] += 1
+                entry['consecutive_failures'] += 1
+                entry['last_error'] = str(error)[:200]
+                entry['last_failure'] = time.time()
+            try:
+                self.save()
+            except OSError as e:
+                # 统计只用于排序和对冲，写不进文件（磁盘满、无权限）不影响本次抓取
+                print(f"⚠️ 行情源统计无法写入 {self.path}（{e}）")
+
+    def hedge_delay(self, name, mode):
+        """该行情源的对冲等待时间：最近耗时的 p95，样本不足时为默认值"""
+        with self._lock:
+            samples = self.providers.get(name, {}).get('seconds', {}).get(mode, [])
+            if len(samples) < MIN_SAMPLES:
+                return DEFAULT_HEDGE_DELAY
+            return max(MIN_HEDGE_DELAY, float(np.percentile(samples, HEDGE_PERCENTILE)))
+
+    def healthy(self, name, now=None):
+        with self._lock:
+            entry = self.providers.get(name)
+            return (entry is None or entry['consecutive_failures'] < UNHEALTHY_FAILURES
+                    or (now or time.time()) - entry['last_failure'] > UNHEALTHY_COOLDOWN)
+
+    def order(self, sources):
+        """健康的源保持原有顺序排在前面，不健康的源排在最后"""
+        return sorted(sources, key=lambda source: not self.healthy(source.name))
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.providers, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        """各行情源状况的多行文本"""
+        lines = []
+        for name, entry in self.providers.items():
+            latency = '，'.join(f"{mode} p{HEDGE_PERCENTILE} {np.percentile(samples, HEDGE_PERCENTILE):.2f} 秒"
+                               for mode, samples in entry['seconds'].items() if samples)
+            lines.append(f"{name}: 成功 {entry['ok']} 次，失败 {entry['failed']} 次"
+                         f"（连续 {entry['consecutive_failures']}）" + (f"，{latency}" if latency else ""))
+        return "\n".join(lines)
+
+
+_default_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_stats():
+    """进程内共享的 ProviderStats（首次使用时从文件加载）"""
+    global _default_stats
+    with _stats_lock:
+        if _default_stats is None:
+            _default_stats = ProviderStats()
+        return _default_stats
+
+
+def get_quotes(sources, pb_limit=None, stats=None, hedge=True, log=print, progress=None, on_page=None,
+               cancel=None):
+    """按顺序向行情源请求行情，首选源慢或失败时自动对冲 / 切换，返回最先成功的结果
+
+    首选源超过其历史 p95 耗时仍未返回时，向下一个源发送同样的请求（对冲），
+    两者谁先成功用谁；正在进行的源失败时立即启用下一个源。每个源使用各自的取消事件，
+    结果确定后立即取消落选的请求（其日志、进度和 on_page 回调被丢弃），不在后台继续占用
+    共享的限速预算和连接池。全部失败时返回空 DataFrame。
+    cancel（threading.Event）被设置后，sina_fetch.CANCEL_POLL 秒内取消所有源并抛出
+    sina_fetch.FetchCancelled，此后所有源的回调都被丢弃。
+    """
+    stats = stats or get_stats()
+    mode = 'full' if pb_limit is None else 'pb'
+    order = stats.order(sources)
+    results = queue.Queue()
+    lock = threading.Lock()
+    state = {'winner': None, 'active': order[0]}
+    cancels = {}  # 源 -> 该源的取消事件（调用方取消或结果确定后设置）
+    live = []  # 仍在请求的源，按启动顺序
+
+    def gated(source, callback, exclusive=True):
+        """结果确定前转发回调（exclusive 时只转发当前主导源的），确定后落选源的回调全部丢弃"""
+        if callback is None:
+            return None
+
+        def call(*args, **kwargs):
+            with lock:
+                allowed = state['winner'] is None and (not exclusive or state['active'] is source)
+            if allowed and not (cancel is not None and cancel.is_set()):
+                callback(*args, **kwargs)
+        return call
+
+    def run(source):
+        start = time.perf_counter()
+        outcome = (source, None, RuntimeError("行情线程意外退出"), 0.0)
+        source_log = gated(source, log if source is order[0] else lambda message: log(f"[{source.name}] {message}"),
+                           exclusive=False)
+        try:
+            df = source.fetch(pb_limit=pb_limit, log=source_log, progress=gated(source, progress),
+                              on_page=gated(source, on_page), cancel=cancels[source])
+        except sina_fetch.FetchCancelled as e:
+            outcome = (source, None, e, time.perf_counter() - start)  # 取消不计为该源失败
+        except Exception as e:
+            outcome = (source, None, e, time.perf_counter() - start)
+            stats.record(source.name, mode, error=e)
+        else:
+            outcome = (source, df, None, time.perf_counter() - start)
+            stats.record(source.name, mode, seconds=outcome[3])
+        finally:
+            # 无论统计是否记录成功都回报结果，否则主循环会一直等待这个源
+            results.put(outcome)
+
+    def launch(source):
+        cancels[source] = threading.Event()
+        live.append(source)
+        threading.Thread(target=run, args=(source,), daemon=True).start()
+
+    def cancel_sources():
+        for event in cancels.values():
+            event.set()
+
+    def hedge_deadline(source):
+        return time.monotonic() + stats.hedge_delay(source.name, mode) if hedge else None
+
+    def check_cancel():
+        if cancel is not None and cancel.is_set():
+            log("⏹️ 已取消获取行情")
+            sina_fetch.check_cancel(cancel)
+
+    try:
+        launch(order[0])
+        next_index = 1
+        hedge_at = hedge_deadline(order[0])
+        while live:
+            check_cancel()
+            # 等到对冲时刻或下一个取消检查点（不支持取消的源也不会拖住调用方）
+            timeout = None
+            if hedge_at is not None and next_index < len(order):
+                timeout = max(0.0, hedge_at - time.monotonic())
+            if cancel is not None:
+                timeout = sina_fetch.CANCEL_POLL if timeout is None else min(timeout, sina_fetch.CANCEL_POLL)
+            try:
+                source, df, error, seconds = results.get(timeout=timeout)
+            except queue.Empty:
+                if hedge_at is None or next_index >= len(order) or time.monotonic() < hedge_at:
+                    continue
+                hedge_source = order[next_index]
+                log(f"🐢 {state['active'].name} 超过 {stats.hedge_delay(state['active'].name, mode):.1f} 秒未返回，"
+                    f"向 {hedge_source.name} 发送对冲请求")
+                metrics.count('hedged_requests')
+                launch(hedge_source)
+                next_index += 1
+                hedge_at = hedge_deadline(hedge_source)
+                continue
+
+            live.remove(source)
+            if isinstance(error, sina_fetch.FetchCancelled):
+                check_cancel()
+            if error is None:
+                with lock:
+                    state['winner'] = source
+                if live:
+                    log(f"🛑 已采用 {source.name} 的行情，取消其余 {len(live)} 个仍在请求的行情源")
+                if source is not order[0]:
+                    log(f"✅ 使用 {source.name} 的行情（{seconds:.2f} 秒，{len(df)} 只股票）")
+                return df
+
+            log(f"⚠️ 行情源 {source.name} 失败: {error}")
+            if live:
+                # 仍有源在请求：失败的若是主导源，由最近启动且仍在请求的源接管进度和逐页回调
+                with lock:
+                    if state['active'] not in live:
+                        state['active'] = live[-1]
+            elif next_index < len(order):
+                log(f"🔀 切换到行情源 {order[next_index].name}")
+                metrics.count('failovers')
+                with lock:
+                    state['active'] = order[next_index]
+                launch(order[next_index])
+                next_index += 1
+                hedge_at = hedge_deadline(order[next_index - 1])
+    finally:
+        # 已有结果、全部失败或调用方取消：仍在请求的源一并停止
+        cancel_sources()
+
+    log("❌ 所有行情源均获取失败")
+    return pd.DataFrame()
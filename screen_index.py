@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class ScreenIndex:
+    """按 PB、PE、市值预排序的筛选索引
+
+    每份行情快照只建一次索引。每次筛选先用 searchsorted 在三个有序数组上
+    求出各条件的区间，以最窄的区间为起点与其余条件求交集，
+    结果按 PB 升序返回行位置，无需对整表扫描和排序。
+    """
+
+    def __init__(self, df):
+        self.size = len(df)
+        self.price = df['price'].to_numpy(dtype=float)
+        self.pb = df['pb_ratio'].to_numpy(dtype=float)
+        self.pe = df['pe_ratio'].to_numpy(dtype=float)
+        self.mcap = df['market_cap'].to_numpy(dtype=float)
+
+        # NaN 排在有序数组末尾，查询时不会落入任何区间
+        self.pb_order = np.argsort(self.pb, kind='stable')
+        self.pe_order = np.argsort(self.pe, kind='stable')
+        self.mcap_order = np.argsort(self.mcap, kind='stable')
+        self.pb_sorted = self.pb[self.pb_order]
+        self.pe_sorted = self.pe[self.pe_order]
+        self.mcap_sorted = self.mcap[self.mcap_order]
+
+        # 每行在 PB 顺序中的名次，用于把结果恢复为 PB 升序
+        self.pb_rank = np.empty(self.size, dtype=np.intp)
+        self.pb_rank[self.pb_order] = np.arange(self.size)
+
+    @staticmethod
+    def _span(sorted_values, low, high):
+        """返回 low < 值 <= high 在有序数组中的下标区间"""
+        start = np.searchsorted(sorted_values, low, side='right')
+        stop = np.searchsorted(sorted_values, high, side='right')
+        return start, max(start, stop)
+
+    def query(self, pb_max, pe_max, mcap_min):
+        """筛选 0 < PB <= pb_max、0 < PE <= pe_max、市值 > mcap_min 的股票，返回按 PB 升序的行位置"""
+        spans = [
+            ('pb', self._span(self.pb_sorted, 0, pb_max)),
+            ('pe', self._span(self.pe_sorted, 0, pe_max)),
+            ('mcap', self._span(self.mcap_sorted, mcap_min, np.inf)),
+        ]
+        driver, (start, stop) = min(spans, key=lambda item: item[1][1] - item[1][0])
+        rows = getattr(self, f'{driver}_order')[start:stop]
+
+        # 与其余区间求交集：对候选行直接比较原值，等价于检查其是否落在对应区间
+        keep = self.price[rows] > 0
+        if driver != 'pb':
+            keep &= (self.pb[rows] > 0) & (self.pb[rows] <= pb_max)
+        if driver != 'pe':
+            keep &= (self.pe[rows] > 0) & (self.pe[rows] <= pe_max)
+        if driver != 'mcap':
+            keep &= self.mcap[rows] > mcap_min
+        rows = rows[keep]
+
+        if driver != 'pb':
+            rows = rows[np.argsort(self.pb_rank[rows])]
+        return rows
+
+
+def screen_mask(df, pb_max, pe_max, mcap_min):
+    """与 ScreenIndex.query 相同的条件，直接对一批行求布尔掩码，用于边下载边筛选"""
+    pb = df['pb_ratio'].to_numpy(dtype=float)
+    pe = df['pe_ratio'].to_numpy(dtype=float)
+    return ((df['price'].to_numpy(dtype=float) > 0) & (pb > 0) & (pb <= pb_max)
+            & (pe > 0) & (pe <= pe_max) & (df['market_cap'].to_numpy(dtype=float) > mcap_min))
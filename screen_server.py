@@ -0,0 +1,392 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import choose
+import metrics
+import monitor
+import quote_sources
+import sina_fetch
+import snapshot_store
+from criteria import Criteria, CriteriaError
+
+HOST = '127.0.0.1'
+PORT = 8765
+REFRESH_INTERVAL = 60     # 交易时段内刷新行情快照的间隔（秒）
+RESPONSE_CACHE_SIZE = 512  # 每份快照缓存的响应数（按查询参数），超出时淘汰最久未用的
+EVAL_CACHE_SIZE = 4096     # 每份快照缓存的子条件求值结果数，超出时清空
+GZIP_MIN_BYTES = 1024      # 响应体超过该字节数且客户端接受 gzip 时压缩
+IDLE_TIMEOUT = 30          # keep-alive 连接空闲多久（秒）后关闭
+MAX_HEADER_LINES = 100
+# 服务自己的分页断点目录，不与同时运行的命令行 / GUI 互相覆盖断点
+CHECKPOINT_DIR = os.path.join(sina_fetch.CHECKPOINT_DIR, 'server')
+# 筛选结果返回的列（市值单位为元，与行情一致）
+RESULT_COLUMNS = ['code', 'display_name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap', 'board']
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MarketState:
+    """一份行情快照及其上的缓存：原始行情（/market）、合并股票列表后的行情（/screen）、
+    子条件求值缓存和按查询参数缓存的响应。刷新时整体替换，不修改旧对象，请求处理无需加锁。
+    """
+
+    def __init__(self, quotes, merged, fetched_at):
+        self.quotes = quotes
+        self.merged = merged.sort_values('pb_ratio', kind='stable').reset_index(drop=True)
+        self.fetched_at = fetched_at
+        self.snapshot_time = fetched_at.isoformat(timespec='seconds')
+        self.version = _digest(pd.util.hash_pandas_object(quotes, index=False).to_numpy().tobytes())
+        self.eval_cache = {}
+        self.responses = OrderedDict()  # (路径, 规范化参数) -> (ETag, 响应体, gzip 响应体)
+
+    def respond(self, key, build):
+        """返回 key 对应的缓存响应，没有时调用 build() 生成响应体并缓存"""
+        entry = self.responses.get(key)
+        if entry is None:
+            body = build()
+            entry = (f'"{_digest(body)}"', body, None)
+            self.responses[key] = entry
+            if len(self.responses) > RESPONSE_CACHE_SIZE:
+                self.responses.popitem(last=False)
+        else:
+            self.responses.move_to_end(key)
+        return entry
+
+    def gzipped(self, key):
+        etag, body, compressed = self.responses[key]
+        if compressed is None:
+            compressed = gzip.compress(body, compresslevel=5)
+            self.responses[key] = (etag, body, compressed)
+        return compressed
+
+    def screen(self, criteria, limit=None):
+        if 'pb_percentile' in criteria.columns:
+            raise HttpError(400, "筛选服务不支持 pb_pct（需要逐只下载历史估值），请在命令行版中使用")
+        if len(self.eval_cache) > EVAL_CACHE_SIZE:
+            self.eval_cache = {}
+        candidates = self.merged[criteria.mask(self.merged, self.eval_cache)]
+        count = len(candidates)
+        if limit is not None:
+            candidates = candidates.head(limit)
+        return _json({'criteria': criteria.text, 'count': count, **_table(candidates[RESULT_COLUMNS])})
+
+
+def _digest(text):
+    data = text if isinstance(text, bytes) else text.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+def _table(df):
+    """按列名 + 行数组整理表格（缺失值为 null），比逐行的对象数组小"""
+    return {'columns': list(df.columns), 'data': df.astype(object).where(df.notna(), None).to_numpy().tolist()}
+
+
+def _json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _etag_matches(header, etag):
+    """If-None-Match 是否包含 etag（支持逗号分隔的多个值、弱校验前缀 W/ 和 *）"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+def _number(params, name, minimum=None):
+    if name not in params:
+        return None
+    try:
+        value = float(params[name])
+    except ValueError:
+        raise HttpError(400, f"参数 {name} 不是数字: {params[name]}")
+    if minimum is not None and value < minimum:
+        raise HttpError(400, f"参数 {name} 不能小于 {minimum}")
+    return value
+
+
+def criteria_from_params(params):
+    """criteria 参数为条件表达式；否则按 pb_max / pe_max / mcap_min（亿）拼出默认条件，缺省值同命令行版"""
+    if 'criteria' in params:
+        text = params['criteria']
+    else:
+        pb_max = _number(params, 'pb_max')
+        pe_max = _number(params, 'pe_max')
+        mcap_min = _number(params, 'mcap_min')
+        text = (f"0 < pb <= {float(choose.PB_MAX if pb_max is None else pb_max)!r} "
+                f"and 0 < pe <= {float(choose.PE_MAX if pe_max is None else pe_max)!r} "
+                f"and mcap > {float(choose.MCAP_MIN if mcap_min is None else mcap_min * 1e8)!r} and price > 0")
+    try:
+        return Criteria(text)
+    except CriteriaError as e:
+        raise HttpError(400, str(e))
+
+
+class ScreenServer:
+    """在内存中保持一份定时刷新的行情快照，通过 HTTP/JSON 回答筛选请求
+
+    所有客户端共享同一份快照，新浪接口的访问量与客户端数量无关。请求在事件循环中同步处理：
+    相同参数的响应按快照缓存，相同的子条件只求值一次，单核即可支撑数百个并发请求；
+    行情刷新在线程池中进行，不阻塞请求。响应带 ETag，客户端用 If-None-Match 重复请求时，
+    结果没有变化则返回 304。
+    """
+
+    def __init__(self, snapshot=None, interval=REFRESH_INTERVAL, calendar=None, log=print):
+        self.snapshot = snapshot  # 离线快照键，不为 None 时只加载一次，不刷新
+        self.interval = interval
+        self.calendar = calendar or monitor.TradingCalendar()
+        self.log = log
+        self.state = None
+        self.refreshing = False
+        self.saved_on = None  # 最近一次保存行情快照的日期，每天最多保存一份
+        self.requests = 0
+        self.not_modified = 0
+
+    def should_save(self, now):
+        """交易日收盘后的第一次刷新保存一份行情快照（choose.SAVE_SNAPSHOTS 为 True 时），盘中刷新不保存"""
+        return (choose.SAVE_SNAPSHOTS and self.snapshot is None and self.saved_on != now.date()
+                and self.calendar.is_trading_day(now.date()) and now.time() >= monitor.SESSIONS[-1][1])
+
+    def load_market(self, save=False):
+        """抓取（或读取离线快照）并合并股票列表，生成新的 MarketState（在工作线程中执行）
+
+        save 为 True 时把抓到的行情保存为快照。
+        """
+        metrics.start_run('server')
+        try:
+            if self.snapshot is not None:
+                quotes = choose.get_realtime_quotes_sina_fixed(pb_limit=None, snapshot=self.snapshot)
+            else:
+                sources = quote_sources.create_sources(choose.QUOTE_SOURCES, max_workers=choose.FETCH_WORKERS,
+                                                       nodes=choose.MARKET_NODES, checkpoint_dir=CHECKPOINT_DIR)
+                quotes = quote_sources.get_quotes(sources, pb_limit=None, log=self.log)
+            if quotes.empty:
+                raise RuntimeError("没有获取到行情")
+            if save:
+                with metrics.stage('save'):
+                    key = snapshot_store.save_snapshot(quotes, pb_limit=None)
+                self.saved_on = datetime.now(monitor.CHINA_TZ).date()
+                self.log(f"💾 收盘行情快照已保存: {key}")
+            with metrics.stage('stock_list'):
+                stock_list = choose.get_stock_list_offline()
+            with metrics.stage('merge'):
+                merged = choose.merge_stock_list(quotes, stock_list, choose.BOARDS)
+            fetched_at = datetime.now()
+            if self.snapshot is not None:
+                fetched_at = datetime.fromisoformat(snapshot_store.load_snapshot_meta(self.snapshot)['fetched_at'])
+            columns = [column for column in quote_sources.QUOTE_COLUMNS + ['board'] if column in quotes.columns]
+            return MarketState(quotes[columns], merged, fetched_at)
+        finally:
+            run = metrics.finish_run()
+            if run is not None:
+                self.log(run.format_stages())
+
+    async def refresh(self):
+        loop = asyncio.get_running_loop()
+        self.refreshing = True
+        try:
+            save = self.should_save(datetime.now(monitor.CHINA_TZ))
+            state = await loop.run_in_executor(None, self.load_market, save)
+        except Exception as e:
+            self.log(f"❌ 行情刷新失败: {e}")
+            return
+        finally:
+            self.refreshing = False
+        unchanged = self.state is not None and state.version == self.state.version
+        if not unchanged:
+            self.state = state  # 整体替换，进行中的请求继续使用旧快照
+        self.log(f"{'♻️ 行情没有变化' if unchanged else '🔄 行情快照已更新'}: {len(state.quotes)} 只股票，"
+                 f"筛选范围 {len(state.merged)} 只，快照 {state.snapshot_time}")
+
+    async def refresh_loop(self):
+        """先加载一次；之后交易时段内每 interval 秒刷新，收盘后再刷新一次取得收盘价"""
+        await self.refresh()
+        if self.snapshot is not None:
+            return
+        in_session = self.calendar.in_session(datetime.now(monitor.CHINA_TZ))
+        while True:
+            await asyncio.sleep(self.interval)
+            now = datetime.now(monitor.CHINA_TZ)
+            was_in_session, in_session = in_session, self.calendar.in_session(now)
+            if in_session or was_in_session or self.state is None:
+                await self.refresh()
+
+    def health(self):
+        state = self.state
+        return _json({
+            'status': 'ok' if state is not None else 'loading',
+            'snapshot_time': state.snapshot_time if state else None,
+            'quotes': len(state.quotes) if state else 0,
+            'screenable': len(state.merged) if state else 0,
+            'refreshing': self.refreshing,
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+        })
+
+    def dispatch(self, method, target, headers):
+        """处理一个请求，返回 (状态码, 响应头, 响应体)"""
+        if method not in ('GET', 'HEAD'):
+            raise HttpError(405, f"不支持的请求方法: {method}")
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == '/health':
+            return 200, {'Cache-Control': 'no-store'}, self.health()
+        if url.path not in ('/market', '/screen'):
+            raise HttpError(404, f"未知的路径: {url.path}（可用: /screen, /market, /health）")
+
+        state = self.state
+        if state is None:
+            raise HttpError(503, "行情快照尚未加载完成，请稍后重试")
+        if url.path == '/market':
+            pb_max = _number(params, 'pb_max', minimum=0)
+            key = ('/market', pb_max)
+
+            def build():
+                quotes = state.quotes if pb_max is None else state.quotes[state.quotes['pb_ratio'] <= pb_max]
+                return _json(_table(quotes))
+        else:
+            criteria = criteria_from_params(params)
+            limit = _number(params, 'limit', minimum=0)
+            limit = None if limit is None else int(limit)
+            key = ('/screen', criteria.text, limit)
+
+            def build():
+                return state.screen(criteria, limit)
+
+        etag, body, _ = state.respond(key, build)
+        compress = len(body) >= GZIP_MIN_BYTES and 'gzip' in headers.get('accept-encoding', '')
+        if compress:
+            etag = etag[:-1] + '-gz"'  # gzip 表示与未压缩表示的字节不同，强校验 ETag 也须不同
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Snapshot-Time': state.snapshot_time,
+                            'Vary': 'Accept-Encoding'}
+        if _etag_matches(headers.get('if-none-match'), etag):
+            self.not_modified += 1
+            return 304, response_headers, b''
+        if compress:
+            response_headers['Content-Encoding'] = 'gzip'
+            body = state.gzipped(key)
+        return 200, response_headers, body
+
+    async def handle(self, reader, writer):
+        """一个连接上按顺序处理请求（HTTP/1.1 keep-alive），请求体被忽略"""
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                parts = line.decode('latin-1').split()
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length') or 0) > 0:
+                    await reader.readexactly(int(headers['content-length']))
+
+                self.requests += 1
+                method, version = (parts[0], parts[2]) if len(parts) == 3 else ('', 'HTTP/1.0')
+                try:
+                    if len(parts) != 3:
+                        raise HttpError(400, "请求行格式错误")
+                    status, response_headers, body = self.dispatch(method, parts[1], headers)
+                except HttpError as e:
+                    status, response_headers, body = e.status, {'Cache-Control': 'no-store'}, _json({'error': str(e)})
+                except Exception as e:
+                    self.log(f"❌ 处理请求 {line!r} 出错: {e}")
+                    status, response_headers, body = 500, {'Cache-Control': 'no-store'}, _json({'error': str(e)})
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                        'Content-Type: application/json; charset=utf-8',
+                        f"Content-Length: {len(body)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{name}: {value}" for name, value in response_headers.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # 客户端断开或请求过大 / 格式错误，直接关闭连接
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        refresher = asyncio.create_task(self.refresh_loop())
+        self.log(f"🛰️ 筛选服务已启动: http://{host}:{port}/screen?pb_max=1.2&pe_max=20&mcap_min=100")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="捡烟蒂筛选服务：多个客户端共享一份定时刷新的行情快照")
+    parser.add_argument('--host', default=HOST, help=f"监听地址，默认 {HOST}（局域网共享时用 0.0.0.0）")
+    parser.add_argument('--port', type=int, default=PORT, help=f"监听端口，默认 {PORT}")
+    parser.add_argument('--interval', type=float, default=REFRESH_INTERVAL,
+                        help=f"交易时段内的刷新间隔（秒），默认 {REFRESH_INTERVAL}")
+    parser.add_argument('--offline', action='store_true', help="不联网，提供最新保存的行情快照")
+    parser.add_argument('--snapshot', metavar='KEY', help="不联网，提供指定的行情快照")
+    parser.add_argument('--sources', metavar='NAMES', default=','.join(choose.QUOTE_SOURCES),
+                        help=f"逗号分隔的行情源优先顺序，默认 {','.join(choose.QUOTE_SOURCES)}")
+    parser.add_argument('--nodes', metavar='NODES', default=','.join(choose.MARKET_NODES),
+                        help=f"逗号分隔的新浪板块节点，默认 {','.join(choose.MARKET_NODES)}")
+    parser.add_argument('--boards', metavar='BOARDS', default=','.join(choose.BOARDS),
+                        help=f"逗号分隔的参与筛选的板块，all 为全部，默认 {','.join(choose.BOARDS)}")
+    parser.add_argument('--calendar', metavar='FILE', default=monitor.CALENDAR_FILE,
+                        help=f"交易日历文件，默认 {monitor.CALENDAR_FILE}")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        choose.QUOTE_SOURCES = tuple(name.strip() for name in args.sources.split(',') if name.strip())
+        choose.MARKET_NODES = tuple(node.strip() for node in args.nodes.split(',') if node.strip())
+        quote_sources.create_sources(choose.QUOTE_SOURCES, nodes=choose.MARKET_NODES)
+        if args.boards == 'all':
+            choose.BOARDS = None
+        else:
+            choose.BOARDS = tuple(board.strip() for board in args.boards.split(',') if board.strip())
+            for board in choose.BOARDS:
+                if board not in dict(sina_fetch.BOARD_PREFIXES):
+                    raise ValueError(f"未知的板块: {board}")
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    snapshot = args.snapshot or (snapshot_store.LATEST if args.offline else None)
+    server = ScreenServer(snapshot=snapshot, interval=args.interval, calendar=monitor.TradingCalendar.load(args.calendar))
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"\n👋 筛选服务已停止（共处理 {server.requests} 个请求，其中 {server.not_modified} 个返回 304）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import synthetic_market
+
+MAX_NUM = 100  # 与新浪一致，每页最多返回 100 条
+# 板块节点 -> (包含的交易所前缀, 包含的代码前缀)，None 表示不限
+NODES = {
+    'hs_a': (('sh', 'sz'), None), 'sh_a': (('sh',), None), 'sz_a': (('sz',), None),
+    'kcb': (None, ('688', '689')), 'cyb': (None, ('30',)), 'hs_b': (None, ('900', '200')),
+    'sh_b': (('sh',), ('900',)), 'sz_b': (('sz',), ('200',)), 'hs_bjs': (None, ('4', '8', '92')),
+}
+SORT_FIELDS = ('symbol', 'code', 'trade', 'pb', 'per', 'mktcap')
+# 代码前缀 -> 交易所前缀（与新浪的 symbol 一致），按顺序匹配：北交所的 92 开头需先于上交所的 9
+EXCHANGE_PREFIXES = (('bj', ('4', '8', '92')), ('sh', ('5', '6', '7', '9')), ('sz', ('0', '1', '2', '3')))
+
+
+def exchange_of(code):
+    """按代码前缀判断交易所前缀（sh / sz / bj）"""
+    for exchange, prefixes in EXCHANGE_PREFIXES:
+        if code.startswith(prefixes):
+            return exchange
+    return 'sz'
+
+
+def market_records(stocks=5300, seed=0):
+    """生成一份新浪 getHQNodeData 格式的模拟行情（市值单位为万元）"""
+    _, df = synthetic_market.generate_frames(days=1, stocks=stocks, seed=seed)[0]
+    records = []
+    for row in df.itertuples(index=False):
+        records.append({
+            'symbol': exchange_of(row.code) + row.code,
+            'code': row.code,
+            'name': row.name,
+            'trade': f"{row.price:.2f}",
+            'pb': round(row.pb_ratio, 3),
+            'per': round(row.pe_ratio, 3),
+            'mktcap': round(row.market_cap / 1e4, 4),
+        })
+    return records
+
+
+class SinaEmulator:
+    """本地模拟的新浪行情接口（Market_Center.getHQNodeData / getHQNodeStockCount）
+
+    支持 page / num / sort / asc / node 参数，按请求的排序字段分页返回预先序列化的记录；
+    每个请求按 latency ± jitter 秒延迟，按 error_rate 返回 500、按 throttle_rate 返回 456
+    （新浪限流时的状态码），客户端声明支持时以 gzip 压缩返回。
+    """
+
+    def __init__(self, stocks=5300, latency=0.05, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 port=0, seed=0, records=None):
+        self.records = records if records is not None else market_records(stocks, seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.port = port
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.server = None
+        self.sorted_pages = {}  # (node, sort, asc) -> 预先序列化的记录列表
+
+    @property
+    def base_url(self):
+        """替换 sina_fetch.SINA_API_BASE 用的地址"""
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def rows(self, node, sort, asc):
+        """按板块和排序字段排好的 JSON 记录片段（首次请求时计算并缓存）"""
+        key = (node, sort, asc)
+        with self.lock:
+            if key not in self.sorted_pages:
+                exchanges, codes = NODES[node]
+                rows = [record for record in self.records
+                        if (exchanges is None or record['symbol'][:2] in exchanges)
+                        and (codes is None or record['code'].startswith(codes))]
+                field = sort if sort in SORT_FIELDS else 'symbol'
+                numeric = field not in ('symbol', 'code')
+                rows.sort(key=lambda record: float(record[field]) if numeric else record[field],
+                          reverse=not asc)
+                self.sorted_pages[key] = [json.dumps(record, ensure_ascii=False) for record in rows]
+            return self.sorted_pages[key]
+
+    def respond(self, path, query):
+        """返回 (状态码, 响应体字符串)"""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            roll = self.random.random()
+        time.sleep(delay)
+        if roll < self.throttle_rate:
+            return 456, ''
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, ''
+
+        node = query.get('node', 'hs_a')
+        if node not in NODES:
+            return 200, 'null'
+        if path.endswith('Market_Center.getHQNodeStockCount'):
+            return 200, json.dumps(str(len(self.rows(node, 'symbol', True))))
+        if path.endswith('Market_Center.getHQNodeData'):
+            rows = self.rows(node, query.get('sort', 'symbol'), query.get('asc', '1') != '0')
+            num = min(max(int(query.get('num', 40)), 1), MAX_NUM)
+            page = max(int(query.get('page', 1)), 1)
+            chunk = rows[(page - 1) * num:page * num]
+            return 200, '[' + ','.join(chunk) + ']' if chunk else 'null'
+        return 404, ''
+
+    def start(self):
+        """在后台线程启动服务，返回自身"""
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                status, body = emulator.respond(url.path, query)
+                data = body.encode('utf-8')
+                self.send_response(status)
+                if data and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    data = gzip.compress(data, compresslevel=1)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟新浪行情接口")
+    parser.add_argument('--port', type=int, default=18080, help="监听端口，默认 18080")
+    parser.add_argument('--stocks', type=int, default=5300, help="模拟股票数，默认 5300")
+    parser.add_argument('--latency', type=float, default=0.05, help="每个请求的平均延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="延迟的标准差（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="返回 456（限流）的比例")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    emulator = SinaEmulator(args.stocks, args.latency, args.jitter, args.error_rate, args.throttle_rate,
+                            port=args.port, seed=args.seed).start()
+    print(f"🛰️ 模拟新浪行情接口已启动: {emulator.base_url}（{len(emulator.records)} 只股票），Ctrl+C 停止")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emulator.stop()
@@ -0,0 +1,778 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+SINA_API_BASE = "http://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php"
+
+PAGE_SIZE = 100       # 请求的每页股票数（服务器不接受时按实际返回条数）
+MAX_PAGES = 200       # 最多抓取页数
+MAX_WORKERS = 8       # 每个板块节点的并发请求数上限
+POOL_SIZE = 32        # 连接池保留的 keep-alive 连接数，多个板块节点并发抓取时共用
+REQUEST_TIMEOUT = 10  # 单页超时（秒）
+
+RATE_LIMIT = 20.0       # 初始请求速率（次/秒）
+MIN_RATE = 1.0          # 被限流时最低降到的速率
+MAX_RATE = 40.0         # 服务器响应良好时最高升到的速率
+TARGET_LATENCY = 0.8    # 单次响应超过该延迟（秒）即视为服务器吃力
+THROTTLE_STATUS = (403, 429, 456)  # 新浪限流/封禁时返回的状态码
+
+PAGE_RETRIES = 3        # 单页失败后的重试次数
+RETRY_BACKOFF = 0.5     # 首次重试前的等待（秒），之后每次翻倍
+MAX_BACKOFF = 8.0       # 单次重试等待上限（秒）
+CANCEL_POLL = 0.1       # 等待请求结果时检查取消的间隔（秒）
+CHECKPOINT_DIR = 'fetch_checkpoints'  # 分页抓取的断点目录
+CHECKPOINT_MAX_AGE = 900  # 断点有效期（秒），超过后行情已变化，重新抓取
+
+# 新浪行情中心的板块节点 -> 说明
+MARKET_NODES = {
+    'hs_a': '沪深A股', 'sh_a': '沪市A股', 'sz_a': '深市A股', 'kcb': '科创板', 'cyb': '创业板',
+    'hs_b': '沪深B股', 'sh_b': '沪市B股', 'sz_b': '深市B股', 'hs_bjs': '北交所',
+}
+DEFAULT_NODES = ('hs_a',)
+# 按代码前缀判断所属板块，先匹配的优先
+BOARD_PREFIXES = (
+    ('科创板', ('688', '689')),
+    ('创业板', ('30',)),
+    ('沪主板', ('60',)),
+    ('深主板', ('00',)),
+    ('B股', ('900', '200')),
+    ('北交所', ('4', '8', '92')),
+)
+MAIN_BOARDS = ('沪主板', '深主板')  # 股票列表（剔除 ST/退市股）一直覆盖的板块
+
+
+class FetchCancelled(Exception):
+    """抓取被取消（cancel 事件已设置）"""
+
+
+class FetchIncomplete(RuntimeError):
+    """有页面重试后仍然失败，抓取结果不完整"""
+
+
+def check_cancel(cancel):
+    """cancel（threading.Event）已设置时抛出 FetchCancelled"""
+    if cancel is not None and cancel.is_set():
+        raise FetchCancelled("抓取已取消")
+
+
+def wait_or_cancel(seconds, cancel):
+    """等待 seconds 秒，期间 cancel 被设置时立即抛出 FetchCancelled"""
+    if cancel is None:
+        time.sleep(seconds)
+    elif cancel.wait(seconds):
+        raise FetchCancelled("抓取已取消")
+
+
+class TokenBucket:
+    """令牌桶限速器，根据响应延迟和错误码自适应调整速率
+
+    正常响应时速率线性回升（加性增），响应变慢时小幅降速，
+    遇到限流或服务端错误时速率减半（乘性减）。
+    """
+
+    def __init__(self, rate=RATE_LIMIT, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 target_latency=TARGET_LATENCY):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cancel=None):
+        """取一个令牌，不足时阻塞等待（等待期间可被 cancel 打断）"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            wait_or_cancel(wait_time, cancel)
+
+    def feedback(self, latency, status_code):
+        """根据一次请求的延迟和状态码调整速率"""
+        with self._lock:
+            self._refill()
+            if status_code in THROTTLE_STATUS or status_code >= 500:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = min(self.tokens, 0)  # 立刻停止突发
+            elif latency > self.target_latency:
+                self.rate = max(self.min_rate, self.rate * 0.9)
+            else:
+                self.rate = min(self.max_rate, self.rate + 1)
+            self.capacity = max(1.0, self.rate)
+
+
+class FetchStats:
+    """一次行情快照的网络开销统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latencies = []
+        self.started = time.time()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, nbytes, latency, ok=True):
+        with self._lock:
+            self.requests += 1
+            self.bytes += nbytes
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def finish(self):
+        self.seconds = time.time() - self.started
+        return self
+
+    def summary(self):
+        return (f"请求 {self.requests} 次（失败 {self.errors}，重试 {self.retries}），"
+                f"下载 {self.bytes / 1024:.1f} KB，耗时 {self.seconds:.2f} 秒")
+
+
+class FetchSession:
+    """共享的 HTTP 会话：连接池复用 keep-alive 连接，启用 gzip，并统一限速"""
+
+    def __init__(self, pool_size=POOL_SIZE, bucket=None):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            'Referer': 'http://vip.stock.finance.sina.com.cn/',
+        })
+        self.bucket = bucket or TokenBucket()
+        self.last_stats = None  # 最近一次 get_realtime_quotes 的网络统计
+
+    def get_json(self, url, stats=None, cancel=None):
+        """限速后发起 GET 请求并解析 JSON，同时记录统计与反馈限速器"""
+        self.bucket.acquire(cancel)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException:
+            latency = time.perf_counter() - start
+            self.bucket.feedback(latency, 599)
+            if stats is not None:
+                stats.record(0, latency, ok=False)
+            raise
+
+        latency = time.perf_counter() - start
+        # Content-Length 是压缩后的实际传输字节数
+        nbytes = int(response.headers.get('Content-Length') or len(response.content))
+        self.bucket.feedback(latency, response.status_code)
+        if stats is not None:
+            stats.record(nbytes, latency, ok=response.ok)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+_default_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """获取进程内共享的 FetchSession（连接池与限速状态跨次运行保留）"""
+    global _default_session
+    with _session_lock:
+        if _default_session is None:
+            _default_session = FetchSession()
+        return _default_session
+
+
+def reset_session():
+    """关闭并丢弃共享会话，下次抓取时以初始限速重新建立（切换接口地址时使用）"""
+    global _default_session
+    with _session_lock:
+        if _default_session is not None:
+            _default_session.close()
+        _default_session = None
+
+
+def with_retries(call, retries=PAGE_RETRIES, stats=None, cancel=None):
+    """调用 call()，失败时按指数退避（带随机抖动）重试 retries 次，退避期间可被 cancel 打断"""
+    for attempt in range(retries + 1):
+        check_cancel(cancel)
+        try:
+            return call()
+        except FetchCancelled:
+            raise
+        except Exception:
+            if attempt == retries:
+                raise
+        if stats is not None:
+            stats.record_retry()
+        wait_or_cancel(min(MAX_BACKOFF, RETRY_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0), cancel)
+
+
+def fetch_page(session, page, num=PAGE_SIZE, sort='code', asc=1, node='hs_a', stats=None, cancel=None,
+               retries=PAGE_RETRIES):
+    """获取单页行情数据，返回记录列表（空页返回 []），失败时重试"""
+    url = (f"{SINA_API_BASE}/Market_Center.getHQNodeData"
+           f"?page={page}&num={num}&sort={sort}&asc={asc}&node={node}")
+    return with_retries(lambda: session.get_json(url, stats=stats, cancel=cancel) or [],
+                        retries=retries, stats=stats, cancel=cancel)
+
+
+def fetch_node_count(session, node='hs_a', stats=None, cancel=None):
+    """从计数接口获取板块股票总数，接口不可用时返回 None"""
+    url = f"{SINA_API_BASE}/Market_Center.getHQNodeStockCount?node={node}"
+    try:
+        return with_retries(lambda: int(session.get_json(url, stats=stats, cancel=cancel)),
+                            retries=1, stats=stats, cancel=cancel)
+    except FetchCancelled:
+        raise
+    except Exception:
+        return None
+
+
+def probe_last_page(session, num, sort='code', asc=1, node='hs_a', known=None, stats=None, cancel=None):
+    """计数接口不可用时，先倍增再二分探测最后一个非空页
+
+    探测到的页会写入 known（页码 -> 记录），正式抓取时不再重复请求。
+    返回值大于 MAX_PAGES 表示页数超出上限。
+    """
+    known = {} if known is None else known
+
+    def has_data(page):
+        if page not in known:
+            known[page] = fetch_page(session, page, num=num, sort=sort, asc=asc,
+                                     node=node, stats=stats, cancel=cancel)
+        return bool(known[page])
+
+    # 探测到 MAX_PAGES + 1 页仍有数据时直接返回，由调用方告警截断
+    limit = MAX_PAGES + 1
+    low, high = 1, 2
+    while high < limit and has_data(high):
+        low, high = high, high * 2
+    if high >= limit:
+        if has_data(limit):
+            return limit
+        high = limit
+
+    # 不变式：low 页非空，high 页为空
+    while high - low > 1:
+        mid = (low + high) // 2
+        if has_data(mid):
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+def plan_pages(session, sort='code', asc=1, node='hs_a', stats=None, log=print, cancel=None):
+    """确定页大小和总页数
+
+    用 PAGE_SIZE 请求第 1 页，服务器实际返回的条数即为它接受的最大页大小；
+    总数优先取计数接口，失败时二分探测。返回 (页大小, 总页数, 总数, 已获取的页)。
+    """
+    first = fetch_page(session, 1, num=PAGE_SIZE, sort=sort, asc=asc, node=node, stats=stats, cancel=cancel)
+    known = {1: first}
+    if not first:
+        return PAGE_SIZE, 0, 0, known
+
+    total = fetch_node_count(session, node=node, stats=stats, cancel=cancel)
+    # 返回不足一页且总数更多，说明服务器截断了页大小
+    num = len(first) if total is None or len(first) < min(PAGE_SIZE, total) else PAGE_SIZE
+
+    if total is None:
+        if len(first) < num:
+            total, page_count = len(first), 1
+        else:
+            page_count = probe_last_page(session, num, sort=sort, asc=asc, node=node,
+                                         known=known, stats=stats, cancel=cancel)
+            total = (page_count - 1) * num + len(known[page_count])
+        log(f"📐 计数接口不可用，探测得到共 {page_count} 页")
+    else:
+        page_count = -(-total // num)
+
+    if page_count > MAX_PAGES:
+        log(f"⚠️ 股票总数（至少 {total} 只）超过 {MAX_PAGES} 页 × {num} 只的抓取上限，"
+            f"只能获取前 {MAX_PAGES * num} 只，结果不完整")
+        page_count = MAX_PAGES
+
+    log(f"📐 共 {total} 只股票，每页 {num} 只，计划抓取 {page_count} 页")
+    return num, page_count, total, known
+
+
+class PageCheckpoint:
+    """分页抓取的断点文件（JSON Lines）
+
+    第一行是抓取计划（接口地址、页大小、页数、总数、创建时间），之后每行是一个成功页的原始记录。
+    每页逐行追加并立即 flush，进程崩溃时最多丢失正在写的一行（读取时忽略不完整的行）。
+    创建超过 max_age 秒的断点视为过期，不再复用。
+    """
+
+    def __init__(self, root=CHECKPOINT_DIR, node='hs_a', sort='code', asc=1, max_age=CHECKPOINT_MAX_AGE):
+        self.root = root
+        self.path = os.path.join(root, f"{node}_{sort}_{asc}.jsonl")
+        self.max_age = max_age
+        self.resumed = False  # 是否复用了已有断点
+        self.file = None
+
+    def load(self):
+        """读取未过期的断点，返回 (计划, {页码: 记录})，没有可用断点时返回 (None, {})"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            plan = json.loads(lines[0])
+        except (OSError, ValueError):
+            return None, {}
+        if plan.get('base') != SINA_API_BASE or time.time() - plan.get('created', 0) > self.max_age:
+            return None, {}
+
+        pages = {}
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # 空行或崩溃时写了一半的行
+            pages[entry['page']] = entry['records']
+        self.resumed = True
+        return plan, pages
+
+    def start(self, num, page_count, total):
+        """新建断点，写入抓取计划（覆盖旧断点）"""
+        self.close()
+        os.makedirs(self.root, exist_ok=True)
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self._write({'base': SINA_API_BASE, 'num': num, 'pages': page_count, 'total': total,
+                     'created': time.time()})
+
+    def add(self, page, records):
+        """追加一个成功的页"""
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self._write({'page': page, 'records': records})
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def clear(self):
+        """抓取完成后删除断点"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def fetch_all_pages(session, sink, max_workers=MAX_WORKERS, sort='code', asc=1, node='hs_a',
+                    stop_after=None, stats=None, log=print, progress=None, on_page=None,
+                    cancel=None, checkpoint=None):
+    """并发获取全部分页，每页到达后立即交给 sink 解析，返回按页序连续的行数上界
+
+    先确定页大小与总页数，再按精确页数调度：同时最多有 max_workers 个请求在途，
+    每完成一页就补发下一页；遇到空页后不再发新请求。
+    单页失败时按指数退避重试 PAGE_RETRIES 次，仍失败则不再发新请求，
+    等在途请求结束后抛出 FetchIncomplete。
+    第 page 页写入 sink 的 (page - 1) * 页大小 位置，因此乱序到达也能保持顺序。
+    stop_after(records) 返回 True 时，该页即为所需的最后一页，之后的页不再请求。
+    progress(已完成页数, 计划页数) 在规划完成后及每页完成后调用，计划页数会随提前停止而减少。
+    on_page(offset, count) 在每页写入 sink 后调用，可用于边下载边处理。
+    checkpoint（PageCheckpoint）不为 None 时，抓取计划和每个成功的页都写入断点；
+    存在未过期的断点时跳过规划，只请求断点中缺失的页，全部完成后删除断点。
+    cancel（threading.Event）被设置后，CANCEL_POLL 秒内停止等待、取消未开始的请求并抛出
+    FetchCancelled；在途请求在后台结束后丢弃，已获取的页保留在断点中。
+    """
+    plan, known = checkpoint.load() if checkpoint is not None else (None, {})
+    if plan is not None:
+        num, last_page, total = plan['num'], plan['pages'], plan['total']
+        log(f"📂 从断点继续：已有 {len(known)}/{last_page} 页，只抓取缺失的页")
+        metrics.count('fetch_resumed_pages', len(known))
+    else:
+        num, last_page, total, known = plan_pages(session, sort=sort, asc=asc, node=node,
+                                                  stats=stats, log=log, cancel=cancel)
+        if checkpoint is not None:
+            checkpoint.start(num, last_page, total)
+            for page, data in sorted(known.items()):
+                if data and page <= last_page:
+                    checkpoint.add(page, data)
+
+    sink.reserve(last_page * num)
+    page_rows = {}
+    for page, data in known.items():
+        if data and page <= last_page:
+            with metrics.stage('parse'):
+                sink.add((page - 1) * num, data)
+            page_rows[page] = len(data)
+            if on_page is not None:
+                on_page((page - 1) * num, len(data))
+    fetched = sum(page_rows.values())
+    next_page = 1
+    failed_page = None
+
+    if stop_after is not None:
+        # 已有的页从第 1 页起依次判断是否已到所需的最后一页
+        page = 1
+        while page in page_rows and page <= last_page:
+            if stop_after(known[page]):
+                last_page = page
+                break
+            page += 1
+    del known
+    if progress is not None:
+        progress(len(page_rows), last_page)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    in_flight = {}
+    try:
+        while in_flight or next_page <= last_page:
+            check_cancel(cancel)
+            # 补满并发窗口（跳过规划阶段或断点中已获取的页）
+            while next_page <= last_page and len(in_flight) < max_workers:
+                if next_page not in page_rows:
+                    in_flight[executor.submit(fetch_page, session, next_page, num=num, sort=sort,
+                                              asc=asc, node=node, stats=stats, cancel=cancel)] = next_page
+                next_page += 1
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, timeout=None if cancel is None else CANCEL_POLL,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                if future.cancelled():
+                    continue
+                try:
+                    data = future.result()
+                except FetchCancelled:
+                    continue
+                except Exception as e:
+                    log(f"获取第 {page} 页失败（已重试 {PAGE_RETRIES} 次）: {e}")
+                    failed_page = page if failed_page is None else min(failed_page, page)
+                    last_page = min(last_page, page - 1)
+                    continue
+
+                if not data:
+                    last_page = min(last_page, page - 1)
+                    continue
+
+                with metrics.stage('parse'):
+                    sink.add((page - 1) * num, data)
+                page_rows[page] = len(data)
+                fetched += len(data)
+                if checkpoint is not None:
+                    checkpoint.add(page, data)
+                log(f"已获取第 {page} 页数据，累计 {fetched} 只股票")
+                if on_page is not None:
+                    on_page((page - 1) * num, len(data))
+
+                if stop_after is not None and page < last_page and stop_after(data):
+                    last_page = page
+                    # 取消尚未开始的多余请求
+                    for pending, pending_page in in_flight.items():
+                        if pending_page > last_page:
+                            pending.cancel()
+
+            if progress is not None and done:
+                progress(sum(1 for p in page_rows if p <= last_page), last_page)
+    finally:
+        # 取消时不等待在途请求，它们结束后结果直接丢弃
+        executor.shutdown(wait=cancel is None or not cancel.is_set(), cancel_futures=True)
+        if checkpoint is not None:
+            checkpoint.close()
+
+    metrics.count('fetch_pages', len(page_rows))
+    if failed_page is not None:
+        saved = "，已获取的页已保存断点，重新运行时只抓取缺失的页" if checkpoint is not None else ""
+        raise FetchIncomplete(f"第 {failed_page} 页重试 {PAGE_RETRIES} 次后仍失败，"
+                              f"只获取到 {len(page_rows)} 页{saved}")
+    if checkpoint is not None:
+        checkpoint.clear()
+
+    # 只保留从第 1 页起连续成功的页
+    page = 0
+    rows = 0
+    while page + 1 in page_rows and page + 1 <= last_page:
+        page += 1
+        rows += page_rows[page]
+
+    if stop_after is None and rows < total:
+        log(f"⚠️ 只获取到 {rows}/{total} 只股票，数据不完整")
+    return page * num
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class QuoteColumns:
+    """行情列缓冲区：逐页把新浪记录直接解析进预分配的定型列，只保留用到的字段
+
+    新浪财经返回的字段名
+    'symbol': 'sz000001' 格式
+    'trade': 最新价
+    'pb': 市净率
+    'per': 市盈率
+    'mktcap': 总市值（万元）
+    """
+
+    def __init__(self, capacity=0):
+        self.size = 0
+        self.code = np.empty(0, dtype=object)
+        self.name = np.empty(0, dtype=object)
+        self.price = np.empty(0)
+        self.pb_ratio = np.empty(0)
+        self.pe_ratio = np.empty(0)
+        self.market_cap = np.empty(0)
+        self.filled = np.zeros(0, dtype=bool)
+        self.reserve(capacity)
+
+    def reserve(self, capacity):
+        """确保缓冲区至少能容纳 capacity 行"""
+        if capacity <= len(self.filled):
+            return
+        for column in ('code', 'name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap'):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, column, new)
+        filled = np.zeros(capacity, dtype=bool)
+        filled[:len(self.filled)] = self.filled
+        self.filled = filled
+
+    def add(self, offset, records):
+        """把一页记录写入 offset 起的位置"""
+        end = offset + len(records)
+        self.reserve(end)
+        code, name = self.code, self.name
+        price, pb, pe, mcap = self.price, self.pb_ratio, self.pe_ratio, self.market_cap
+        for i, record in enumerate(records, offset):
+            code[i] = (record.get('symbol') or '')[2:]  # 去掉 'sz' 或 'sh' 前缀
+            name[i] = record.get('name')
+            price[i] = _to_float(record.get('trade'))
+            pb[i] = _to_float(record.get('pb'))
+            pe[i] = _to_float(record.get('per'))
+            mcap[i] = _to_float(record.get('mktcap')) * 10000  # 万元转元
+        self.filled[offset:end] = True
+        self.size = max(self.size, end)
+
+    def to_frame(self, rows=None, start=0):
+        """取 [start, rows) 位置中的有效行组成 DataFrame，列直接引用缓冲区"""
+        rows = self.size if rows is None else min(rows, self.size)
+        span = slice(start, rows)
+        # 过滤有效数据：NaN 的比较结果为 False，一并剔除
+        keep = self.filled[span] & (self.pb_ratio[span] > 0) & (self.price[span] > 0)
+        columns = ('code', 'name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap')
+        if keep.all():
+            data = {column: getattr(self, column)[span] for column in columns}
+        else:
+            data = {column: getattr(self, column)[span][keep] for column in columns}
+        return pd.DataFrame(data, copy=False)
+
+
+class PbCutoff:
+    """按 PB 升序抓取时的提前终止判断
+
+    某页中出现 PB 超过上限的股票，说明后续页只会更大，可以停止；
+    若发现返回数据并未按 PB 升序排列，则放弃提前终止，退回全量抓取。
+    """
+
+    def __init__(self, pb_limit, log=print):
+        self.pb_limit = pb_limit
+        self.enabled = True
+        self.log = log
+
+    def __call__(self, records):
+        if not self.enabled:
+            return False
+        pbs = []
+        for record in records:
+            try:
+                pbs.append(float(record.get('pb')))
+            except (TypeError, ValueError):
+                continue
+        if any(a > b for a, b in zip(pbs, pbs[1:])):
+            self.enabled = False
+            self.log("⚠️ 行情未按 PB 排序，改为全量抓取")
+            return False
+        return bool(pbs) and pbs[-1] > self.pb_limit
+
+
+def board_of(codes):
+    """按代码前缀判断所属板块，返回板块名数组（无法识别的为 '其他'）"""
+    codes = pd.Series(codes, copy=False).astype(str)
+    conditions = [codes.str.startswith(prefixes).to_numpy() for _, prefixes in BOARD_PREFIXES]
+    return np.select(conditions, [board for board, _ in BOARD_PREFIXES], default='其他').astype(object)
+
+
+def fetch_shard(session, node, max_workers=MAX_WORKERS, pb_limit=None, stats=None, log=print, progress=None,
+                on_page=None, cancel=None, checkpoint_dir=CHECKPOINT_DIR):
+    """抓取单个板块节点的全部分页，返回该节点的有效行情 DataFrame"""
+    columns = QuoteColumns()
+    page_done = None
+    if on_page is not None:
+        def page_done(offset, count):
+            on_page(columns.to_frame(offset + count, start=offset))
+    sort, stop_after = 'code', None
+    if pb_limit is not None:
+        sort, stop_after = 'pb', PbCutoff(pb_limit, log=log)
+    checkpoint = PageCheckpoint(checkpoint_dir, node=node, sort=sort) if checkpoint_dir else None
+    rows = fetch_all_pages(session, columns, max_workers=max_workers, sort=sort, asc=1, node=node,
+                           stop_after=stop_after, stats=stats, log=log, progress=progress,
+                           on_page=page_done, cancel=cancel, checkpoint=checkpoint)
+    df = columns.to_frame(rows)
+    if checkpoint is not None and checkpoint.resumed and pb_limit is not None:
+        # 断点中的页与新抓取的页之间 PB 排序可能已变化，同一只股票可能出现在两页中
+        df = df.drop_duplicates('code', ignore_index=True)
+    return df
+
+
+def fetch_shards(session, nodes, max_workers=MAX_WORKERS, pb_limit=None, stats=None, log=print, progress=None,
+                 on_page=None, cancel=None, checkpoint_dir=CHECKPOINT_DIR):
+    """各板块节点作为独立分片并发抓取，返回按 nodes 顺序排列的 DataFrame 列表
+
+    所有分片共用 session 的连接池和令牌桶，总请求速率受同一个预算约束；
+    各分片的规划请求、慢页和重试相互重叠，总耗时随板块数亚线性增长。
+    进度为各分片之和；on_page 只交出此前分片中未出现过的股票。
+    任一分片失败或 cancel 被设置时，其余分片随即停止（已获取的页保留在各自的断点中）。
+    """
+    lock = threading.Lock()
+    shard_progress = {}
+    seen = set()
+    stop = threading.Event()  # 停止全部分片：用户取消或某个分片失败
+    log_lock = threading.Lock()  # 逐条输出，避免各分片的日志交错在同一行
+
+    def shard_callbacks(node):
+        def shard_log(message):
+            with log_lock:
+                log(f"[{node}] {message}")
+
+        shard_page_progress = None
+        if progress is not None:
+            def shard_page_progress(done, total):
+                with lock:
+                    shard_progress[node] = (done, total)
+                    done = sum(value[0] for value in shard_progress.values())
+                    total = sum(value[1] for value in shard_progress.values())
+                progress(done, total)
+
+        shard_page = None
+        if on_page is not None:
+            def shard_page(frame):
+                with lock:
+                    fresh = ~frame['code'].isin(seen).to_numpy()
+                    seen.update(frame['code'].to_numpy()[fresh])
+                if fresh.any():
+                    on_page(frame[fresh])
+        return shard_log, shard_page_progress, shard_page
+
+    executor = ThreadPoolExecutor(max_workers=len(nodes))
+    futures = {}
+    for node in nodes:
+        shard_log, shard_page_progress, shard_page = shard_callbacks(node)
+        futures[executor.submit(fetch_shard, session, node, max_workers=max_workers, pb_limit=pb_limit,
+                                stats=stats, log=shard_log, progress=shard_page_progress, on_page=shard_page,
+                                cancel=stop, checkpoint_dir=checkpoint_dir)] = node
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                stop.set()
+                raise FetchCancelled("抓取已取消")
+            for future in done:
+                error = future.exception()
+                if error is not None:
+                    stop.set()
+                    raise error
+    finally:
+        executor.shutdown(wait=not stop.is_set())
+    return [future.result() for future in futures]
+
+
+def get_realtime_quotes(max_workers=MAX_WORKERS, session=None, pb_limit=None, log=print, progress=None,
+                        on_page=None, cancel=None, checkpoint_dir=CHECKPOINT_DIR, nodes=DEFAULT_NODES):
+    """从新浪财经并发获取实时行情
+
+    nodes 为要抓取的板块节点（见 MARKET_NODES），多个节点作为独立分片并发抓取，
+    合并后按代码去重，并增加按代码前缀判断的 board（板块）列。
+    pb_limit 不为 None 时启用按筛选抓取：按 PB 升序分页，PB 超过上限后提前停止，
+    返回的数据只覆盖 PB ≤ pb_limit 的股票；需要全市场数据时传 None。
+    progress 为分页进度回调，见 fetch_all_pages；on_page(frame) 在每页解析后
+    以该页有效行组成的 DataFrame 调用，用于边下载边筛选。
+    cancel 为 threading.Event，设置后抛出 FetchCancelled；checkpoint_dir 为断点目录，
+    None 时不保存断点。单页重试后仍失败时抛出 FetchIncomplete。
+    """
+    log("正在获取实时行情数据...")
+    session = session or get_session()
+    stats = FetchStats()
+    nodes = tuple(dict.fromkeys(nodes))  # 去掉重复的节点，保持顺序
+
+    if pb_limit is not None:
+        log(f"🎯 按 PB 升序抓取，PB 超过 {pb_limit} 后提前停止")
+    try:
+        with metrics.stage('fetch'):
+            if len(nodes) == 1:
+                frames = [fetch_shard(session, nodes[0], max_workers=max_workers, pb_limit=pb_limit, stats=stats,
+                                      log=log, progress=progress, on_page=on_page, cancel=cancel,
+                                      checkpoint_dir=checkpoint_dir)]
+            else:
+                log(f"🧩 并发抓取 {len(nodes)} 个板块节点: {', '.join(nodes)}")
+                frames = fetch_shards(session, nodes, max_workers=max_workers, pb_limit=pb_limit, stats=stats,
+                                      log=log, progress=progress, on_page=on_page, cancel=cancel,
+                                      checkpoint_dir=checkpoint_dir)
+    finally:
+        session.last_stats = stats.finish()
+        metrics.observe_fetch(stats)
+        log(f"🌐 网络开销: {stats.summary()}，当前限速 {session.bucket.rate:.1f} 次/秒")
+
+    if len(frames) == 1:
+        df = frames[0]
+    else:
+        df = pd.concat(frames, ignore_index=True)
+        rows = len(df)
+        df = df.drop_duplicates('code', ignore_index=True)
+        if rows > len(df):
+            log(f"🧹 {rows - len(df)} 只股票同时属于多个板块节点，已去重")
+
+    if df.empty:
+        log("❌ 无法获取实时行情数据")
+        return pd.DataFrame()
+    df['board'] = board_of(df['code'])
+
+    log(f"📊 成功获取 {len(df)} 只股票的有效行情数据")
+    log(f"📊 PB 数据范围: {df['pb_ratio'].min():.3f} ~ {df['pb_ratio'].max():.3f}")
+
+    return df
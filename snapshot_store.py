@@ -0,0 +1,112 @@
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_DIR = 'snapshots'  # 行情快照根目录，每个快照一个以抓取时间命名的子目录
+KEY_FORMAT = '%Y%m%d-%H%M%S'
+LATEST = 'latest'           # 表示最新一份快照的快照键
+
+COLUMNS = ('code', 'name', 'price', 'pb_ratio', 'pe_ratio', 'market_cap')
+TEXT_COLUMNS = ('code', 'name', 'board')
+OPTIONAL_COLUMNS = ('board',)  # 行情中有该列时才保存，旧快照中可能没有
+
+
+def save_snapshot(df, fetched_at=None, pb_limit=None, root=SNAPSHOT_DIR):
+    """把行情快照按列保存为 .npy 文件，返回快照键（抓取时间戳）
+
+    数值列保存为 float64，代码、名称和板块保存为定长 Unicode 数组，均可内存映射读取。
+    pb_limit 记录按 PB 快速抓取时的覆盖范围，None 表示全市场快照。
+    """
+    fetched_at = fetched_at or datetime.now()
+    key = fetched_at.strftime(KEY_FORMAT)
+    path = os.path.join(root, key)
+    tmp_path = path + '.tmp'
+
+    os.makedirs(tmp_path, exist_ok=True)
+    for column in COLUMNS + tuple(column for column in OPTIONAL_COLUMNS if column in df.columns):
+        if column in TEXT_COLUMNS:
+            values = df[column].fillna('').astype(str).to_numpy(dtype=str)
+        else:
+            values = df[column].to_numpy(dtype=np.float64)
+        np.save(os.path.join(tmp_path, f'{column}.npy'), values)
+
+    meta = {
+        'key': key,
+        'fetched_at': fetched_at.isoformat(timespec='seconds'),
+        'rows': len(df),
+        'pb_limit': pb_limit,
+    }
+    with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    # 写完再改名，避免读到写了一半的快照
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return key
+
+
+def list_snapshots(root=SNAPSHOT_DIR):
+    """按时间顺序列出已保存的快照键"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if os.path.isfile(os.path.join(root, name, 'meta.json'))
+    )
+
+
+def resolve_snapshot(key=None, root=SNAPSHOT_DIR):
+    """把快照键或目录路径解析为快照目录，key 为 None 或 'latest' 时取最新快照"""
+    if key and os.path.isfile(os.path.join(key, 'meta.json')):
+        return key
+    if key in (None, LATEST):
+        keys = list_snapshots(root)
+        if not keys:
+            raise FileNotFoundError(f"{root} 下没有已保存的行情快照")
+        key = keys[-1]
+    path = os.path.join(root, key)
+    if not os.path.isfile(os.path.join(path, 'meta.json')):
+        raise FileNotFoundError(f"找不到行情快照: {key}")
+    return path
+
+
+def load_snapshot_meta(key=None, root=SNAPSHOT_DIR):
+    """读取快照元数据"""
+    path = resolve_snapshot(key, root)
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_snapshot(key=None, root=SNAPSHOT_DIR, text=True):
+    """以内存映射方式加载快照，返回 (DataFrame, 元数据)
+
+    数值列直接引用只读的内存映射数组，不复制数据；
+    代码和名称需转为 Python 字符串，这两列会在加载时复制（text 为 False 时保留定长 Unicode 数组）。
+    """
+    path = resolve_snapshot(key, root)
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    data = {}
+    for column in COLUMNS + OPTIONAL_COLUMNS:
+        file = os.path.join(path, f'{column}.npy')
+        if column in OPTIONAL_COLUMNS and not os.path.exists(file):
+            continue
+        values = np.load(file, mmap_mode='r')
+        data[column] = values.astype(object) if column in TEXT_COLUMNS and text else values
+    return pd.DataFrame(data, copy=False), meta
+
+
+def load_snapshot_for_screen(key=None, pb_limit=None, root=SNAPSHOT_DIR, log=print):
+    """离线筛选时加载快照，快照覆盖范围不足以支撑 pb_limit 时给出提示"""
+    df, meta = load_snapshot(key, root)
+    log(f"📂 已加载离线快照 {meta['key']}（{meta['rows']} 只股票，抓取于 {meta['fetched_at']}）")
+    covered = meta.get('pb_limit')
+    if covered is not None and (pb_limit is None or pb_limit > covered):
+        log(f"⚠️ 该快照为按PB快速抓取，只包含 PB≤{covered} 附近的股票")
+    return df
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+
+def parse_range(text):
+    """解析阈值范围："0.5:1.5:11" 为等间距 11 个值，"0.8,1.0,1.2" 为逐个列出"""
+    if ':' in text:
+        start, stop, num = text.split(':')
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(value) for value in text.split(',')])
+
+
+def load_parameter_sets(path):
+    """读取参数组文件（CSV，列为 pb_max、pe_max、mcap_min，市值单位为亿）"""
+    sets = pd.read_csv(path)
+    missing = {'pb_max', 'pe_max', 'mcap_min'} - set(sets.columns)
+    if missing:
+        raise ValueError(f"{path} 缺少列: {', '.join(sorted(missing))}")
+    return sets[['pb_max', 'pe_max', 'mcap_min']].astype(float)
+
+
+def sweep_grid(frame, pb_values, pe_values, mcap_values, label_columns=('code',)):
+    """一次遍历求出整个阈值网格上每组参数的候选股数量
+
+    参数组 (a, b, c) 的候选股为 0 < PB <= a、0 < PE <= b、市值 > c（元）、股价 > 0。
+    每只股票先用 searchsorted 算出它能通过的最小 PB 阈值下标、最小 PE 阈值下标
+    和能通过的市值阈值个数，落入三维直方图后沿 PB、PE 轴做累加、
+    沿市值轴做反向累加，即得到全部参数组的数量，与网格大小无关地只扫一遍股票。
+
+    返回 (grids, counts, members)：grids 为升序去重后的三组阈值，
+    counts 形状为 (PB 个数, PE 个数, 市值个数)；members 为每只至少入选一组的股票
+    （带 label_columns 中的标识列）及其入选边界。
+    """
+    pb_grid = np.unique(np.asarray(pb_values, dtype=float))
+    pe_grid = np.unique(np.asarray(pe_values, dtype=float))
+    mcap_grid = np.unique(np.asarray(mcap_values, dtype=float))
+
+    price = np.asarray(frame['price'], dtype=float)
+    pb = np.asarray(frame['pb_ratio'], dtype=float)
+    pe = np.asarray(frame['pe_ratio'], dtype=float)
+    mcap = np.asarray(frame['market_cap'], dtype=float)
+
+    # 股票能通过 PB 阈值 pb_grid[j] 当且仅当 j >= pb_index，PE 同理；
+    # 能通过市值阈值 mcap_grid[k] 当且仅当 k < mcap_count
+    pb_index = np.searchsorted(pb_grid, pb, side='left')
+    pe_index = np.searchsorted(pe_grid, pe, side='left')
+    mcap_count = np.searchsorted(mcap_grid, mcap, side='left')
+
+    base = (price > 0) & (pb > 0) & (pe > 0) & ~np.isnan(mcap)
+    alive = base & (pb_index < len(pb_grid)) & (pe_index < len(pe_grid)) & (mcap_count > 0)
+
+    shape = (len(pb_grid), len(pe_grid), len(mcap_grid) + 1)
+    flat = np.ravel_multi_index((pb_index[alive], pe_index[alive], mcap_count[alive]), shape)
+    hist = np.bincount(flat, minlength=np.prod(shape)).reshape(shape)
+
+    counts = hist.cumsum(axis=0).cumsum(axis=1)
+    # 市值阈值 k 的数量 = mcap_count > k 的股票数
+    counts = counts[:, :, ::-1].cumsum(axis=2)[:, :, ::-1][:, :, 1:]
+
+    members = pd.DataFrame({column: np.asarray(frame[column])[alive] for column in label_columns})
+    members = members.assign(**{
+        'pb_ratio': pb[alive],
+        'pe_ratio': pe[alive],
+        'market_cap': mcap[alive],
+        # 入选条件：pb_max >= pb_from 且 pe_max >= pe_from 且 mcap_min <= mcap_upto
+        'pb_from': pb_grid[pb_index[alive]],
+        'pe_from': pe_grid[pe_index[alive]],
+        'mcap_upto': mcap_grid[mcap_count[alive] - 1],
+    })
+    return (pb_grid, pe_grid, mcap_grid), counts, members
+
+
+def counts_table(grids, counts):
+    """把网格数量展开为长表：pb_max, pe_max, mcap_min（元）, count"""
+    pb_grid, pe_grid, mcap_grid = grids
+    pb_mesh, pe_mesh, mcap_mesh = np.meshgrid(pb_grid, pe_grid, mcap_grid, indexing='ij')
+    return pd.DataFrame({
+        'pb_max': pb_mesh.ravel(),
+        'pe_max': pe_mesh.ravel(),
+        'mcap_min': mcap_mesh.ravel(),
+        'count': counts.ravel(),
+    })
+
+
+def lookup_counts(grids, counts, parameter_sets):
+    """按任意参数组（阈值均在网格上）查出数量，保持参数组原有顺序"""
+    pb_grid, pe_grid, mcap_grid = grids
+    i = np.searchsorted(pb_grid, parameter_sets['pb_max'].to_numpy())
+    j = np.searchsorted(pe_grid, parameter_sets['pe_max'].to_numpy())
+    k = np.searchsorted(mcap_grid, parameter_sets['mcap_min'].to_numpy())
+    result = parameter_sets.copy()
+    result['count'] = counts[i, j, k]
+    return result
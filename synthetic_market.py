@@ -0,0 +1,64 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import snapshot_store
+
+
+def generate_frames(days=250, stocks=5000, start='2015-01-05', seed=0):
+    """生成逐日的模拟全市场行情，返回 [(日期, DataFrame)]，列与行情快照一致
+
+    股价为带市场因子的几何随机游走，每股净资产和每股收益缓慢变化，
+    由此得到 PB、PE（部分亏损股 PE 为负）和总市值；少量股票偶有停牌（当日缺失）。
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=days)
+
+    codes = np.array([f"{code:06d}" for code in rng.choice(1000000, stocks, replace=False)])
+    names = np.array([f"模拟{i:04d}" for i in range(stocks)])
+    shares = rng.lognormal(20.5, 1.0, stocks)            # 总股本
+    book = rng.lognormal(1.5, 0.6, stocks)               # 每股净资产
+    earnings = book * rng.normal(0.08, 0.08, stocks)     # 每股收益，部分为负
+    price = book * rng.lognormal(0.3, 0.5, stocks)
+
+    market = rng.normal(0.0003, 0.012, days)
+    beta = rng.uniform(0.6, 1.4, stocks)
+    frames = []
+    for day in range(days):
+        if day:
+            price = price * np.exp(beta * market[day] + rng.normal(0, 0.02, stocks))
+            book = book * np.exp(rng.normal(0.0003, 0.002, stocks))
+            earnings = earnings + rng.normal(0, 0.002, stocks) * book
+        listed = rng.random(stocks) > 0.01  # 约 1% 的股票当日停牌
+        frames.append((dates[day], pd.DataFrame({
+            'code': codes[listed],
+            'name': names[listed],
+            'price': price[listed].round(2),
+            'pb_ratio': (price / book)[listed].round(3),
+            'pe_ratio': (price / earnings)[listed].round(3),
+            'market_cap': (price * shares)[listed],
+        })))
+    return frames
+
+
+def generate_snapshots(days=250, stocks=5000, start='2015-01-05', seed=0,
+                       root=snapshot_store.SNAPSHOT_DIR, log=print):
+    """把模拟行情逐日保存为行情快照（收盘时刻 15:00），返回快照键列表"""
+    keys = []
+    for date, df in generate_frames(days, stocks, start, seed):
+        keys.append(snapshot_store.save_snapshot(df, fetched_at=date.replace(hour=15).to_pydatetime(),
+                                                 root=root))
+    log(f"✅ 已在 {root} 生成 {len(keys)} 份模拟行情快照（{stocks} 只股票）")
+    return keys
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成模拟的逐日行情快照，用于回测和性能测试")
+    parser.add_argument('--days', type=int, default=250, help="交易日数，默认 250")
+    parser.add_argument('--stocks', type=int, default=5000, help="股票数，默认 5000")
+    parser.add_argument('--start', default='2015-01-05', help="起始日期，默认 2015-01-05")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--root', default='synthetic_snapshots', help="快照目录，默认 synthetic_snapshots")
+    args = parser.parse_args()
+    generate_snapshots(args.days, args.stocks, args.start, args.seed, root=args.root)
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+import snapshot_store
+from criteria import Criteria
+
+
+def quotes(rows):
+    return pd.DataFrame({'code': [row[0] for row in rows], 'name': [f"股票{row[0]}" for row in rows],
+                         'price': [row[1] for row in rows], 'pb_ratio': [row[2] for row in rows],
+                         'pe_ratio': 8.0, 'market_cap': 1e10})
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    """四个交易日：第二天收盘后另有一份按 PB ≤ 1 快速抓取的快照，第四天只有快速抓取的快照"""
+    def save(rows, day, hour, pb_limit=None):
+        snapshot_store.save_snapshot(quotes(rows), fetched_at=datetime(2024, 1, day, hour), pb_limit=pb_limit,
+                                     root=str(tmp_path))
+
+    save([('600000', 10.0, 0.5), ('600001', 20.0, 2.0)], 2, 15)
+    save([('600000', 12.0, 1.5), ('600001', 20.0, 2.0)], 3, 15)
+    save([], 3, 16, pb_limit=1.0)  # 600000 的 PB 升出范围，快速抓取时没有它的价格
+    save([('600000', 13.0, 1.6), ('600001', 22.0, 2.2)], 4, 15)
+    save([('600001', 9.0, 0.9)], 5, 15, pb_limit=1.0)
+    return str(tmp_path)
+
+
+def test_truncated_snapshots_are_skipped(snapshots):
+    """同一天有全市场快照时不取更晚的快速抓取快照，只有快速抓取快照的日期默认跳过"""
+    logs = []
+    panel = backtest.load_panel(root=snapshots, log=logs.append)
+
+    assert list(panel.dates.strftime('%Y%m%d')) == ['20240102', '20240103', '20240104']
+    assert panel.price[:, 0].tolist() == [10.0, 12.0, 13.0]
+    assert any('跳过 1 天' in line for line in logs)
+
+    daily, periods, summary = backtest.run_backtest(panel, Criteria('pb <= 1'), hold=2)
+    assert summary['total_return'] == pytest.approx(0.3)
+    assert periods['holdings'].tolist() == [1]
+
+
+def test_include_partial_adds_truncated_days(snapshots):
+    panel = backtest.load_panel(root=snapshots, include_partial=True, log=lambda message: None)
+
+    assert list(panel.dates.strftime('%Y%m%d')) == ['20240102', '20240103', '20240104', '20240105']
+    assert panel.price[1, 0] == 12.0
+    assert np.isnan(panel.price[3, 0])
+
+
+def test_costs_are_charged_on_turnover(snapshots):
+    """全仓买入和调仓换成现金各按单边费率扣减一次"""
+    panel = backtest.load_panel(root=snapshots, log=lambda message: None)
+    daily, periods, summary = backtest.run_backtest(panel, Criteria('pb <= 1'), hold=1, cost=0.01)
+
+    assert periods['turnover'].tolist() == [1.0, 1.0]
+    assert daily['value'].tolist() == pytest.approx([1.0, 1.2 * 0.99, 1.2 * 0.99 * 0.99])
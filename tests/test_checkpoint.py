@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import sina_fetch
+from sina_emulator import SinaEmulator
+
+
+class FlakyEmulator(SinaEmulator):
+    """failing 为 True 时第 3 页及以后的行情页返回 500"""
+
+    failing = True
+    data_pages = 0
+
+    def respond(self, path, query):
+        if path.endswith('getHQNodeData'):
+            if self.failing and int(query.get('page', 1)) >= 3:
+                return 500, ''
+            self.data_pages += 1
+        return super().respond(path, query)
+
+
+def test_resume_fetches_only_missing_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(sina_fetch, 'RETRY_BACKOFF', 0.01)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    with FlakyEmulator(stocks=1000, latency=0.0) as emulator:
+        monkeypatch.setattr(sina_fetch, 'SINA_API_BASE', emulator.base_url)
+
+        def fetch():
+            # 失败时不降速，测试不必等待
+            session = sina_fetch.FetchSession(bucket=sina_fetch.TokenBucket(min_rate=sina_fetch.RATE_LIMIT))
+            return sina_fetch.get_realtime_quotes(session=session, nodes=('sh_a',),
+                                                  checkpoint_dir=checkpoint_dir, log=lambda message: None)
+
+        with pytest.raises(sina_fetch.FetchIncomplete):
+            fetch()
+        assert os.listdir(checkpoint_dir) == ['sh_a_code_1.jsonl']
+        assert emulator.data_pages == 2
+
+        emulator.failing, emulator.data_pages = False, 0
+        df = fetch()
+
+    listed = [record for record in emulator.records if record['symbol'].startswith('sh')]
+    valid = [record for record in listed if float(record['trade']) > 0 and float(record['pb']) > 0]
+    pages = -(-len(listed) // sina_fetch.PAGE_SIZE)
+    assert sorted(df['code']) == sorted(record['code'] for record in valid)
+    assert emulator.data_pages == pages - 2
+    assert os.listdir(checkpoint_dir) == []
@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+
+from criteria import Criteria, CriteriaError
+
+
+def quotes():
+    return pd.DataFrame({'pb_ratio': [0.5, 0.9, 1.1, 2.0], 'pe_ratio': [8.0, -3.0, 15.0, 30.0],
+                         'market_cap': [2e10, 5e10, 8e9, 3e11], 'price': [5.0, 6.0, 7.0, 8.0]})
+
+
+def test_equivalent_expressions_share_a_root():
+    assert Criteria("pb <= 1.2 and 0 < pe").root == Criteria("pe > 0 and 1.2 >= pb").root
+    assert Criteria("mcap > 100 * 1e8").root == Criteria("mcap > 100e8").root
+
+
+def test_funnel_follows_written_order():
+    """漏斗按书写顺序逐步叠加，连续比较拆为各个比较"""
+    funnel = Criteria("mcap > 100e8 and 0 < pe <= 20 and pb <= 1.2").funnel(quotes())
+
+    assert [count for _, count in funnel] == [3, 2, 1, 1]
+
+
+@pytest.mark.parametrize('text', ["pb < 1/0", "pb < 1e308 * 10**400", "pb < (-8)**0.5", "pb < 1e999"])
+def test_bad_constants_are_criteria_errors(text):
+    with pytest.raises(CriteriaError):
+        Criteria(text)
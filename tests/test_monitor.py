@@ -0,0 +1,44 @@
+import json
+
+import pandas as pd
+
+import monitor
+
+
+class AlwaysOpen:
+    """始终处于交易时段的日历"""
+
+    def in_session(self, now):
+        return True
+
+
+def candidates(pb=0.9):
+    return pd.DataFrame({'股票名': ['浦发银行'], '代码': ['600000'], '股价': [10.0],
+                         'PB': [pb], 'PE': [8.0], '市值(亿)': [2900.0]})
+
+
+def test_empty_poll_is_a_failed_poll(tmp_path):
+    """抓取失败时返回的无列空表不会使监控崩溃，也不会记为全部退出"""
+    event_log = tmp_path / 'events.jsonl'
+    results = iter([candidates(), pd.DataFrame(), candidates(0.7)])
+    logs, sleeps = [], []
+    monitor.run_monitor(lambda: next(results), calendar=AlwaysOpen(), event_log=str(event_log),
+                        log=logs.append, sleep=sleeps.append, max_polls=3)
+
+    events = [json.loads(line) for line in event_log.read_text(encoding='utf-8').splitlines()]
+    assert [event['event'] for event in events] == ['start', 'cross']
+    assert events[1]['pb_prev'] == 0.9 and events[1]['level'] == 0.8
+    assert any('筛选失败' in line for line in logs)
+    assert sleeps[1] == sleeps[0] * monitor.BACKOFF_FACTOR
+
+
+def test_empty_candidates_with_columns_are_compared(tmp_path):
+    """筛选成功但没有候选股时（带列的空表）正常比较，记录退出事件"""
+    event_log = tmp_path / 'events.jsonl'
+    empty = candidates().iloc[0:0]
+    results = iter([candidates(), empty])
+    monitor.run_monitor(lambda: next(results), calendar=AlwaysOpen(), event_log=str(event_log),
+                        log=lambda message: None, sleep=lambda seconds: None, max_polls=2)
+
+    events = [json.loads(line) for line in event_log.read_text(encoding='utf-8').splitlines()]
+    assert [event['event'] for event in events] == ['start', 'exit']
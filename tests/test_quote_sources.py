@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pandas as pd
+
+import quote_sources
+
+
+def quotes():
+    return pd.DataFrame({'code': ['600000'], 'name': ['浦发银行'], 'price': [10.0], 'pb_ratio': [0.5],
+                         'pe_ratio': [5.0], 'market_cap': [2.9e11]})
+
+
+class PrimarySource(quote_sources.QuoteSource):
+    """等对冲源失败后才上报进度和逐页结果并返回的首选源"""
+
+    name = 'primary'
+
+    def __init__(self, hedge_failed):
+        super().__init__(checkpoint_dir=None)
+        self.hedge_failed = hedge_failed
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        assert self.hedge_failed.wait(5)
+        time.sleep(0.2)  # 留出时间让 get_quotes 处理对冲源的失败
+        df = quotes()
+        progress(1, 1)
+        on_page(df)
+        return df
+
+
+class FailingSource(quote_sources.QuoteSource):
+    name = 'failing'
+
+    def __init__(self, failed=None):
+        super().__init__(checkpoint_dir=None)
+        self.failed = failed
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        if self.failed is not None:
+            self.failed.set()
+        raise RuntimeError("接口无响应")
+
+
+class QuickSource(quote_sources.QuoteSource):
+    name = 'quick'
+
+    def __init__(self):
+        super().__init__(checkpoint_dir=None)
+
+    def fetch(self, pb_limit=None, log=print, progress=None, on_page=None, cancel=None):
+        return quotes()
+
+
+def test_failed_hedge_keeps_primary_callbacks(monkeypatch):
+    """对冲源先失败时，仍在请求的首选源继续转发进度和逐页回调"""
+    monkeypatch.setattr(quote_sources, 'DEFAULT_HEDGE_DELAY', 0.05)
+    monkeypatch.setattr(quote_sources, 'MIN_HEDGE_DELAY', 0.05)
+    hedge_failed = threading.Event()
+    progress, pages, logs = [], [], []
+    df = quote_sources.get_quotes([PrimarySource(hedge_failed), FailingSource(hedge_failed)],
+                                  stats=quote_sources.ProviderStats(path=None), log=logs.append,
+                                  progress=lambda done, planned: progress.append((done, planned)),
+                                  on_page=pages.append)
+
+    assert len(df) == 1
+    assert progress == [(1, 1)]
+    assert len(pages) == 1
+    assert any('failing 失败' in line for line in logs)
+
+
+def test_stats_write_failure_still_returns(tmp_path):
+    """统计文件写不进去时抓取照常返回（没有对冲和取消时也不会一直等待）"""
+    stats = quote_sources.ProviderStats(path=str(tmp_path / 'missing' / 'provider_stats.json'))
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.setdefault(
+        'df', quote_sources.get_quotes([FailingSource(), QuickSource()], stats=stats, hedge=False,
+                                       log=lambda message: None)), daemon=True)
+    thread.start()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert len(outcome['df']) == 1
+    assert stats.providers['failing']['failed'] == 1
+    assert stats.providers['quick']['ok'] == 1
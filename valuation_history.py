@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DIR = 'valuation_cache'  # 历史估值缓存目录
+HISTORY_WORKERS = 4              # 并发下载历史估值的股票数上限
+HISTORY_YEARS = 5                # 计算分位数时回看的年数
+MIN_HISTORY_DAYS = 250           # 历史数据少于该天数时不计算分位数
+PB_SPAN = 1e5                    # 组合排序键中每只股票占用的 PB 区间，需大于任何 PB
+# 已有缓存的股票只下载最近一段历史：(百度股市通的区间名, 覆盖天数)，从短到长选第一个能覆盖缺口的区间
+RECENT_PERIODS = (('近一年', 365), ('近三年', 3 * 365), ('近五年', 5 * 365))
+
+# 缓存记录：股票代码（整数）、日期（距 1970-01-01 的天数）、市净率
+RECORD = np.dtype([('code', '<i4'), ('day', '<i4'), ('pb', '<f4')])
+
+
+class AkshareValuationSource:
+    """百度股市通的个股市净率历史（akshare.stock_zh_valuation_baidu）
+
+    source(code, since_day) 返回 date、pb 两列；since_day 为已缓存的最后日期（距 1970-01-01
+    的天数）时只请求能覆盖此后缺口的最短区间（通常为近一年），没有缓存时下载 period 的完整历史。
+    """
+
+    name = 'akshare'
+
+    def __init__(self, period='近十年', recent_periods=RECENT_PERIODS):
+        self.period = period
+        self.recent_periods = recent_periods
+
+    def period_for(self, since_day, today=None):
+        """覆盖 since_day 之后缺口的最短区间，缺口超过所有近期区间时为完整区间"""
+        if since_day is None:
+            return self.period
+        gap = int(np.datetime64(today or date.today(), 'D').astype(np.int64)) - since_day
+        for period, days in self.recent_periods:
+            if gap < days:
+                return period
+        return self.period
+
+    def __call__(self, code, since_day=None):
+        import akshare as ak
+        df = ak.stock_zh_valuation_baidu(symbol=code, indicator='市净率', period=self.period_for(since_day))
+        return pd.DataFrame({'date': pd.to_datetime(df['date']),
+                             'pb': pd.to_numeric(df['value'], errors='coerce')})
+
+
+class SnapshotValuationSource:
+    """以本地行情快照中的 PB 作为历史估值，用于离线测试和回放，不联网"""
+
+    name = 'snapshot'
+
+    def __init__(self, root):
+        self.root = root
+        self.panel = None
+        self.lock = threading.Lock()
+
+    def __call__(self, code, since_day=None):
+        with self.lock:
+            if self.panel is None:
+                import backtest
+                self.panel = backtest.load_panel(root=self.root, log=lambda message: None)
+        column = np.searchsorted(self.panel.codes, code)
+        if column == len(self.panel.codes) or self.panel.codes[column] != code:
+            return pd.DataFrame({'date': pd.to_datetime([]), 'pb': []})
+        history = pd.DataFrame({'date': self.panel.dates, 'pb': self.panel.pb_ratio[:, column]})
+        if since_day is not None:
+            history = history[history['date'].to_numpy(dtype='datetime64[D]').astype(np.int64) > since_day]
+        return history
+
+
+class ValuationCache:
+    """个股历史市净率的本地增量缓存
+
+    所有记录追加写入同一个定长二进制文件 pb_history.bin，index.json 记录每只股票
+    已缓存的最后日期和最近一次下载日期。已有缓存的股票只向数据源请求最后日期之后的
+    近期历史，并只追加其中的新记录；当天已下载过的股票不再联网，因此同一天内再次运行
+    完全不访问历史数据源。
+    """
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+        self.data_path = os.path.join(root, 'pb_history.bin')
+        self.index_path = os.path.join(root, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    def stale_codes(self, codes, today=None):
+        """需要重新下载的股票：从未下载过，或最近一次下载早于 today"""
+        today = (today or date.today()).isoformat()
+        return [code for code in codes if self.index.get(code, {}).get('fetched_on', '') < today]
+
+    def append(self, code, history, today=None):
+        """把 history（date、pb 两列）中晚于已缓存最后日期的记录追加到缓存，返回追加条数"""
+        entry = self.index.get(code, {})
+        days = pd.to_datetime(history['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        pb = history['pb'].to_numpy(dtype=float)
+        new = (days > entry.get('last_day', -1)) & ~np.isnan(pb)
+
+        if new.any():
+            records = np.empty(new.sum(), dtype=RECORD)
+            records['code'] = int(code)
+            records['day'] = days[new]
+            records['pb'] = pb[new]
+            records.sort(order='day')
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.data_path, 'ab') as f:
+                records.tofile(f)
+            entry['last_day'] = int(records['day'][-1])
+        entry['fetched_on'] = (today or date.today()).isoformat()
+        self.index[code] = entry
+        return int(new.sum())
+
+    def save_index(self):
+        """写回索引（先写临时文件再改名）"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def update(self, codes, source, max_workers=HISTORY_WORKERS, today=None, log=print):
+        """并发下载过期股票的历史估值并追加到缓存，返回下载的股票数"""
+        stale = self.stale_codes(codes, today)
+        if not stale:
+            log(f"♻️ {len(codes)} 只股票的历史估值均为今日缓存，不联网")
+            return 0
+
+        since = {code: self.index.get(code, {}).get('last_day') for code in stale}
+        recent = sum(day is not None for day in since.values())
+        log(f"📥 下载 {len(stale)} 只股票的历史估值（{source.name}，{max_workers} 线程"
+            + (f"，其中 {recent} 只已有缓存，只下载近期数据" if recent else "") + "）...")
+        appended = failed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(source, code, since[code]): code for code in stale}
+                for done, future in enumerate(as_completed(futures), 1):
+                    code = futures[future]
+                    try:
+                        history = future.result()
+                    except Exception as e:
+                        failed += 1
+                        log(f"获取 {code} 历史估值失败: {e}")
+                        continue
+                    # 文件只在当前线程追加，工作线程只负责下载
+                    appended += self.append(code, history, today)
+                    if done % 200 == 0:
+                        log(f"已下载 {done}/{len(stale)} 只股票的历史估值")
+        finally:
+            self.save_index()
+        log(f"✅ 历史估值已更新：新增 {appended} 条记录" + (f"，{failed} 只失败" if failed else ""))
+        return len(stale) - failed
+
+    def load(self, since_day=None):
+        """读取全部缓存记录，按 (代码, 日期) 排序并去掉重复记录"""
+        if not os.path.exists(self.data_path):
+            return np.empty(0, dtype=RECORD)
+        records = np.fromfile(self.data_path, dtype=RECORD)
+        if since_day is not None:
+            records = records[records['day'] >= since_day]
+        records = records[np.lexsort((records['day'], records['code']))]
+        key = records['code'].astype(np.int64) * 100000 + records['day']
+        keep = np.ones(len(records), dtype=bool)
+        keep[1:] = key[1:] != key[:-1]
+        return records[keep]
+
+
+def pb_percentiles(records, codes, current_pb, min_days=MIN_HISTORY_DAYS):
+    """各股票当前 PB 在自身历史中的分位数（历史中 ≤ 当前值的比例），历史不足时为 NaN
+
+    把 (股票, PB) 编码为单个排序键 股票序号 × PB_SPAN + PB，整体排序一次后，
+    全部股票的分位数都只需两次 searchsorted，不按股票循环。
+    """
+    codes = np.asarray([int(code) for code in codes])
+    # 与缓存中的 PB 一样按 float32 比较，当前值与历史中同一天的值才会相等
+    current_pb = np.asarray(current_pb, dtype=np.float32).astype(float)
+    history = records[records['pb'] > 0]
+    if not len(history):
+        return np.full(len(codes), np.nan)
+
+    universe = np.unique(history['code'])
+    slot = np.searchsorted(universe, history['code'])
+    keys = np.sort(slot * PB_SPAN + history['pb'].astype(float))
+
+    query_slot = np.searchsorted(universe, codes)
+    known = (query_slot < len(universe)) & (universe[np.minimum(query_slot, len(universe) - 1)] == codes)
+    base = query_slot * PB_SPAN
+    start = np.searchsorted(keys, base, side='left')
+    stop = np.searchsorted(keys, base + PB_SPAN, side='left')
+    below = np.searchsorted(keys, base + np.clip(current_pb, 0, PB_SPAN - 1), side='right')
+
+    count = stop - start
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percentile = (below - start) / count
+    valid = known & (count >= min_days) & (current_pb > 0)
+    return np.where(valid, percentile, np.nan)
+
+
+def add_pb_percentile(df, source, years=HISTORY_YEARS, cache=None, max_workers=HISTORY_WORKERS,
+                      min_days=MIN_HISTORY_DAYS, log=print):
+    """为行情表增加 pb_percentile 列：当前 PB 在近 years 年自身历史中的分位数（0~1）"""
+    cache = cache or ValuationCache()
+    codes = df['code'].astype(str).tolist()
+    cache.update(codes, source, max_workers=max_workers, log=log)
+
+    since = (np.datetime64(date.today()) - np.timedelta64(int(years * 365.25), 'D')).astype(np.int64)
+    records = cache.load(since_day=since)
+    percentile = pb_percentiles(records, codes, df['pb_ratio'].to_numpy(dtype=float), min_days=min_days)
+    log(f"📈 {np.count_nonzero(~np.isnan(percentile))}/{len(df)} 只股票有足够的历史估值计算 PB 分位数")
+    return df.assign(pb_percentile=percentile)
@@ -0,0 +1,166 @@
+from tkinter import ttk
+
+import numpy as np
+
+ROW_HEIGHT = 20     # Treeview 默认行高（像素），主题未给出时使用
+HEADER_HEIGHT = 25  # 表头高度估计值，用于估算可见行数
+
+
+class VirtualTable:
+    """只渲染可见行的结果表格
+
+    Treeview 中始终只有一屏的行项目，滚动时改写这些项目的值而不增删项目。
+    加载数据时按列一次性格式化为字符串矩阵，并为每一列预先计算升序排列下标；
+    点击表头只是切换所用的排列下标（降序时反向读取），不重排数据、不重建控件。
+    key_column 为唯一标识一行的列（默认 '代码'），重新载入时按它保留选中行；表格没有该列时不保留。
+    """
+
+    def __init__(self, parent, columns, formats=None, width=100, key_column='代码'):
+        self.columns = tuple(columns)
+        self.key = self.columns.index(key_column) if key_column in self.columns else None
+        self.formats = formats or {}
+        self.tree = ttk.Treeview(parent, columns=self.columns, show='headings', height=10)
+        for col in self.columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
+            self.tree.column(col, width=width)
+
+        self.v_scrollbar = ttk.Scrollbar(parent, orient='vertical', command=self.yview)
+        h_scrollbar = ttk.Scrollbar(parent, orient='horizontal', command=self.tree.xview)
+        self.tree.configure(xscrollcommand=h_scrollbar.set)
+
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.v_scrollbar.grid(row=0, column=1, sticky='ns')
+        h_scrollbar.grid(row=1, column=0, sticky='ew')
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<MouseWheel>', self._on_wheel)
+        self.tree.bind('<Button-4>', lambda e: self._scroll(-3))
+        self.tree.bind('<Button-5>', lambda e: self._scroll(3))
+        for key, step in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'page-up'), ('<Next>', 'page-down')):
+            self.tree.bind(key, lambda e, s=step: self._on_key(s))
+
+        row_height = ttk.Style().lookup('Treeview', 'rowheight')
+        self.row_height = int(row_height) if row_height else ROW_HEIGHT
+
+        self.items = []      # 一屏的行项目，反复复用
+        self.visible = 1     # 当前可完整显示的行数
+        self.offset = 0      # 第一行可见行在排列中的位置
+        self.cells = np.empty((0, len(self.columns)), dtype=str)
+        self.orders = {}     # 列名 -> 升序排列下标
+        self.order = np.arange(0)
+        self.shown = np.arange(0)  # 各行项目当前显示的数据行号
+        self.selected = set()      # 选中的数据行号，滚动和排序时跟随数据行
+        self.sort_column = None
+        self.descending = False
+
+    def __len__(self):
+        return len(self.cells)
+
+    def load(self, frame):
+        """载入 DataFrame（列名与表格列一致），保留当前的排序列和方向，以及 key_column 相同的行的选中状态"""
+        keep = self.selected and self.key is not None
+        keys = set(self.cells[sorted(self.selected), self.key].tolist()) if keep else set()
+        strings = []
+        self.orders = {}
+        for col in self.columns:
+            values = frame[col].to_numpy()
+            fmt = self.formats.get(col)
+            if fmt:
+                values = values.astype(float)
+                strings.append(np.char.mod(fmt, values))
+            else:
+                values = values.astype(str)
+                strings.append(values)
+            self.orders[col] = np.argsort(values, kind='stable')
+        self.cells = np.column_stack(strings)
+        self.offset = 0
+        self.selected = set(np.flatnonzero(np.isin(self.cells[:, self.key], list(keys))).tolist()) if keys else set()
+        self._apply_order()
+
+    def clear(self):
+        """清空表格"""
+        self.cells = np.empty((0, len(self.columns)), dtype=str)
+        self.orders = {}
+        self.offset = 0
+        self.selected = set()
+        self._apply_order()
+
+    def sort_by(self, col):
+        """按列排序，再次点击同一列切换升降序"""
+        if self.sort_column == col:
+            self.descending = not self.descending
+        else:
+            self.sort_column, self.descending = col, False
+        for name in self.columns:
+            arrow = (' ▼' if self.descending else ' ▲') if name == col else ''
+            self.tree.heading(name, text=name + arrow)
+        self.offset = 0
+        self._apply_order()
+
+    def _apply_order(self):
+        if self.sort_column in self.orders:
+            order = self.orders[self.sort_column]
+            self.order = order[::-1] if self.descending else order
+        else:
+            self.order = np.arange(len(self.cells))
+        self.render()
+
+    def render(self):
+        """把当前位置的一屏数据写入复用的行项目"""
+        self.offset = max(0, min(self.offset, len(self.cells) - self.visible))
+        self.shown = self.order[self.offset:self.offset + len(self.items)]
+        rows = self.cells[self.shown].tolist()
+        for i, iid in enumerate(self.items):
+            self.tree.item(iid, values=rows[i] if i < len(rows) else ())
+        # 行项目是复用的，选中状态按数据行重新设置，而不是留在原来的行项目上
+        self.tree.selection_set([iid for iid, row in zip(self.items, self.shown) if row in self.selected])
+
+        total = len(self.cells)
+        if total > self.visible:
+            self.v_scrollbar.set(self.offset / total, (self.offset + self.visible) / total)
+        else:
+            self.v_scrollbar.set(0, 1)
+
+    def _on_select(self, event):
+        # 屏幕外的选中行保持不变，可见部分以控件当前的选中状态为准
+        picked = set(self.tree.selection())
+        visible = {int(row) for row in self.shown}
+        self.selected = (self.selected - visible) | {
+            int(row) for iid, row in zip(self.items, self.shown) if iid in picked}
+
+    def yview(self, *args):
+        """滚动条回调：moveto 比例 / scroll n units|pages"""
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * len(self.cells))
+            self.render()
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            self._scroll(step * self.visible if args[2] == 'pages' else step)
+
+    def _scroll(self, rows):
+        self.offset += rows
+        self.render()
+        return 'break'
+
+    def _on_wheel(self, event):
+        # Windows 每格 120，macOS 每格 1
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll(-3 * step)
+
+    def _on_key(self, step):
+        if step == 'page-up':
+            return self._scroll(-self.visible)
+        if step == 'page-down':
+            return self._scroll(self.visible)
+        return self._scroll(step)
+
+    def _on_resize(self, event):
+        """按控件高度调整行项目个数，多出一行以免底部留空"""
+        wanted = max(1, (event.height - HEADER_HEIGHT) // self.row_height + 1)
+        while len(self.items) < wanted:
+            self.items.append(self.tree.insert('', 'end', values=()))
+        while len(self.items) > wanted:
+            self.tree.delete(self.items.pop())
+        self.visible = max(1, wanted - 1)
+        self.render()